@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Registre des OIDs DME partagé par le simulateur, l'agent et les collecteurs
+La table des 26 OIDs (nom, valeur initiale, plage de variation) est décrite
+une seule fois, sous forme compacte, et compilée au chargement du module:
+
+- OID texte, tuple d'arcs (plus de split('.') à l'exécution) et nom;
+- indice de colonne fixe dans les lignes CSV (0 = horodatage);
+- valeur initiale, marche aléatoire (pas, minimum, maximum) et plage;
+- index trié des tuples d'arcs (recherche par dichotomie côté agent);
+- ObjectIdentity pysnmp, créés à la première demande puis réutilisés.
+
+Ajouter une voie (instance) ou une mesure se fait dans INSTANCES,
+TRANSMITTER_MEASURES ou STATION_MEASURES; l'ordre des colonnes existantes
+est conservé (mesure, puis instance, puis émetteur A/B).
+
+Auteur: arthur
+"""
+
+import threading
+
+# Racine des OIDs DME (entreprise 32275)
+OID_BASE = "1.3.6.1.4.1.32275.2.1.2.2"
+# Instance (voie) -> sous-arbre de l'OID
+INSTANCES = {0: 5, 3: 8}
+# Émetteurs (transpondeurs) d'une voie
+TRANSMITTERS = ("TXPA", "TXPB")
+# Mesures par émetteur: (suffixe du nom, dernier arc par émetteur)
+TRANSMITTER_MEASURES = (
+    ("DelayCurrentValue", {"TXPA": 10, "TXPB": 34}),
+    ("PulsePairSpacing", {"TXPA": 11, "TXPB": 35}),
+    ("TransmittedPowerCurrentValue", {"TXPA": 12, "TXPB": 36}),
+    ("Efficiency", {"TXPA": 13, "TXPB": 37}),
+    ("TxFreqError", {"TXPA": 14, "TXPB": 38}),
+)
+# Mesures de la station: (suffixe du nom, dernier arc)
+STATION_MEASURES = (
+    ("RadiatedPowerCurrentValue", 15),
+    ("TransmissionRate", 16),
+    ("IdentStatus", 17),
+)
+
+# Valeurs initiales par métrique (sans instance): valeur commune ou {instance: valeur}; 0 par défaut
+INITIAL_VALUES = {
+    "mtuExecTXPBDelayCurrentValue": 49200,
+    "mtuExecTXPBPulsePairSpacing": 12000,
+    "mtuExecTXPBTransmittedPowerCurrentValue": {0: 1080, 3: 1125},
+    "mtuExecTXPBEfficiency": {0: 90, 3: 91},
+    "mtuExecTXPBTxFreqError": 2,
+    "mtuExecRadiatedPowerCurrentValue": {0: 980, 3: 970},
+    "mtuExecTransmissionRate": 840,
+    "mtuExecIdentStatus": 1,
+}
+# Marche aléatoire des valeurs variables: (pas maximal, minimum, maximum), commune ou par instance
+VALUE_WALKS = {
+    "mtuExecTXPBDelayCurrentValue": (50, 49000, 49400),
+    "mtuExecTXPBTransmittedPowerCurrentValue": {0: (5, 1050, 1100), 3: (5, 1100, 1150)},
+    "mtuExecTXPBEfficiency": (2, 85, 95),
+}
+
+
+def _per_instance(table, metric, instance, default=None):
+    """Valeur d'une table indexée par métrique, commune ou propre à chaque instance"""
+    value = table.get(metric, default)
+    if isinstance(value, dict):
+        # Instance non décrite: mêmes valeurs que la première voie
+        return value.get(instance, next(iter(value.values())))
+    return value
+
+
+class OidEntry:
+    """Description compilée d'un OID DME"""
+
+    __slots__ = ("oid", "name", "arcs", "column", "initial", "walk")
+
+    def __init__(self, oid, name, column, initial=0, walk=None):
+        self.oid = oid
+        self.name = name
+        self.arcs = tuple(int(arc) for arc in oid.split("."))
+        self.column = column
+        self.initial = initial
+        self.walk = walk
+
+    @property
+    def value_range(self):
+        """Plage (minimum, maximum) des valeurs produites par le simulateur"""
+        if self.walk is None:
+            return self.initial, self.initial
+        _, low, high = self.walk
+        return low, high
+
+    def __repr__(self):
+        return f"OidEntry({self.name}, {self.oid}, colonne={self.column})"
+
+
+class OidRegistry:
+    """Table des OIDs indexée par OID, par nom et par colonne"""
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.by_oid = {entry.oid: entry for entry in self.entries}
+        self.by_name = {entry.name: entry for entry in self.entries}
+        if len(self.by_oid) != len(self.entries) or len(self.by_name) != len(self.entries):
+            raise ValueError("OID ou nom de métrique dupliqué dans le registre")
+        self.oids = [entry.oid for entry in self.entries]
+        self.names = [entry.name for entry in self.entries]
+        # Correspondance OID -> nom (ancien OID_LIST / DME_OIDS des collecteurs)
+        self.oid_names = {entry.oid: entry.name for entry in self.entries}
+        self.column_names = ["Timestamp"] + self.names
+        self.columns = {entry.name: entry.column for entry in self.entries}
+        self.walks = {entry.oid: entry.walk for entry in self.entries if entry.walk is not None}
+        ordered = sorted(self.entries, key=lambda entry: entry.arcs)
+        self.sorted_arcs = [entry.arcs for entry in ordered]
+        self.sorted_oids = [entry.oid for entry in ordered]
+        self._identities = None
+        self._identities_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def resolve(self, entries):
+        """Convertit une liste de noms de métriques ou d'OIDs en liste d'OIDs connus"""
+        oids = []
+        for item in entries:
+            entry = self.by_oid.get(item) or self.by_name.get(item)
+            if entry is None:
+                raise ValueError(f"OID ou métrique inconnu dans le profil: {item}")
+            oids.append(entry.oid)
+        return oids
+
+    def object_identities(self):
+        """ObjectIdentity pysnmp de chaque OID, créés une seule fois par processus"""
+        if self._identities is None:
+            with self._identities_lock:
+                if self._identities is None:
+                    from pysnmp.hlapi import ObjectIdentity
+                    self._identities = {entry.oid: ObjectIdentity(entry.oid) for entry in self.entries}
+        return self._identities
+
+    def format_row(self, data, timestamp, missing=0):
+        """Ligne CSV préallouée remplie par indice de colonne (noms inconnus ignorés)"""
+        row = [missing] * len(self.column_names)
+        row[0] = timestamp
+        columns = self.columns
+        for name, value in data.items():
+            column = columns.get(name)
+            if column is not None:
+                row[column] = value
+        return row
+
+
+def build_registry(instances=None):
+    """Compile la table des OIDs pour les instances (voies) données"""
+    instances = INSTANCES if instances is None else instances
+    specs = []
+    for measure, arcs in TRANSMITTER_MEASURES:
+        for instance, subtree in instances.items():
+            for transmitter in TRANSMITTERS:
+                specs.append((f"{subtree}.{arcs[transmitter]}", f"mtuExec{transmitter}{measure}", instance))
+    for measure, arc in STATION_MEASURES:
+        for instance, subtree in instances.items():
+            specs.append((f"{subtree}.{arc}", f"mtuExec{measure}", instance))
+
+    entries = []
+    for column, (suffix, metric, instance) in enumerate(specs, start=1):
+        entries.append(OidEntry(
+            f"{OID_BASE}.{suffix}",
+            f"{metric}-{instance}",
+            column,
+            initial=_per_instance(INITIAL_VALUES, metric, instance, 0),
+            walk=_per_instance(VALUE_WALKS, metric, instance)
+        ))
+    return OidRegistry(entries)
+
+
+# Registre par défaut, compilé une fois au chargement
+REGISTRY = build_registry()
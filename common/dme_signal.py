@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Modèle de signaux des stations DME simulées
+Toutes les métriques de toutes les stations virtuelles avancent d'un pas en
+une seule opération NumPy (matrice stations x métriques), quel que soit le
+nombre de stations. Chaque métrique combine des modèles configurables:
+
+- walk:     marche aléatoire, pas uniforme de ±step par reference_interval
+            (mis à l'échelle en racine du temps pour des pas plus courts);
+- drift:    dérive linéaire de rate unités par seconde;
+- periodic: sinusoïde d'amplitude amplitude et de période period (s), phase
+            propre à chaque station;
+- fault:    défaut en échelon (décalage magnitude) survenant rate fois par
+            heure et par station en moyenne, pendant duration secondes
+            (0 = jusqu'à la fin de la simulation).
+
+Le niveau (walk + drift) est borné à [min, max] lorsque ces bornes sont
+données; les composantes périodiques et les défauts s'y ajoutent sans
+bornes, pour que les défauts sortent réellement des plages normales.
+
+Par défaut, les marches aléatoires du registre des OIDs sont reprises;
+un fichier JSON peut ajouter ou remplacer des modèles par métrique, avec ou
+sans numéro d'instance:
+
+{
+    "mtuExecTXPBEfficiency": {"periodic": {"amplitude": 3, "period": 3600}},
+    "mtuExecTXPBDelayCurrentValue-3": {"fault": {"rate": 0.5, "magnitude": 400, "duration": 120}}
+}
+
+La graine rend la simulation reproductible (bancs d'essai).
+
+Auteur: arthur
+"""
+
+import json
+import math
+
+import numpy as np
+
+from dme_registry import REGISTRY
+
+MODEL_KINDS = ("walk", "drift", "periodic", "fault")
+
+
+def default_models(registry=REGISTRY):
+    """Modèles par défaut: marches aléatoires bornées décrites dans le registre"""
+    models = {}
+    for entry in registry:
+        if entry.walk is not None:
+            step, low, high = entry.walk
+            models[entry.name] = {"walk": {"step": step, "min": low, "max": high}}
+    return models
+
+
+def load_models(path, registry=REGISTRY):
+    """Modèles par défaut complétés par un fichier JSON (clé: métrique avec ou sans instance)"""
+    models = default_models(registry)
+    if not path:
+        return models
+    with open(path, 'r') as f:
+        overrides = json.load(f)
+    for key, kinds in overrides.items():
+        unknown = set(kinds) - set(MODEL_KINDS)
+        if unknown:
+            raise ValueError(f"Modèle de signal inconnu pour {key}: {', '.join(sorted(unknown))}")
+        names = [entry.name for entry in registry if key in (entry.name, entry.name.rsplit("-", 1)[0])]
+        if not names:
+            raise ValueError(f"Métrique inconnue dans les modèles de signal: {key}")
+        for name in names:
+            models.setdefault(name, {}).update(kinds)
+    return models
+
+
+class SignalModel:
+    """Valeurs entières de N stations x M métriques, avancées par pas vectorisés"""
+
+    def __init__(self, devices, models=None, seed=None, reference_interval=30.0, order=None, registry=REGISTRY):
+        self.devices = devices
+        self.reference_interval = reference_interval
+        # Ordre des colonnes de la matrice de sortie (OIDs); ordre du registre par défaut
+        self.order = list(order) if order is not None else list(registry.oids)
+        self.rng = np.random.default_rng(seed)
+        self.time = 0.0
+        models = default_models(registry) if models is None else models
+        entries = [registry.by_oid[oid] for oid in self.order]
+        specs = [models.get(entry.name, {}) for entry in entries]
+
+        initial = np.array([entry.initial for entry in entries], dtype=np.float64)
+        self.level = np.tile(initial, (devices, 1))
+
+        # Index de colonnes et paramètres de chaque modèle (seules les colonnes concernées sont calculées)
+        walk = [(column, spec["walk"]) for column, spec in enumerate(specs) if "walk" in spec]
+        self.walk_columns = np.array([column for column, _ in walk], dtype=np.intp)
+        self.walk_steps = np.array([params["step"] for _, params in walk], dtype=np.float64)
+
+        drift = [(column, spec["drift"]) for column, spec in enumerate(specs) if "drift" in spec]
+        self.drift_columns = np.array([column for column, _ in drift], dtype=np.intp)
+        self.drift_rates = np.array([params["rate"] for _, params in drift], dtype=np.float64)
+
+        bounded = []
+        for column, spec in enumerate(specs):
+            low = min((spec[kind]["min"] for kind in ("walk", "drift") if "min" in spec.get(kind, {})), default=-math.inf)
+            high = max((spec[kind]["max"] for kind in ("walk", "drift") if "max" in spec.get(kind, {})), default=math.inf)
+            if low > -math.inf or high < math.inf:
+                bounded.append((column, low, high))
+        self.bound_columns = np.array([column for column, _, _ in bounded], dtype=np.intp)
+        self.bound_low = np.array([low for _, low, _ in bounded], dtype=np.float64)
+        self.bound_high = np.array([high for _, _, high in bounded], dtype=np.float64)
+
+        periodic = [(column, spec["periodic"]) for column, spec in enumerate(specs) if "periodic" in spec]
+        self.periodic_columns = np.array([column for column, _ in periodic], dtype=np.intp)
+        self.periodic_amplitudes = np.array([params["amplitude"] for _, params in periodic], dtype=np.float64)
+        self.periodic_omegas = np.array([2 * math.pi / params["period"] for _, params in periodic], dtype=np.float64)
+        self.periodic_phases = self.rng.uniform(0, 2 * math.pi, size=(devices, len(periodic)))
+
+        fault = [(column, spec["fault"]) for column, spec in enumerate(specs) if "fault" in spec]
+        self.fault_columns = np.array([column for column, _ in fault], dtype=np.intp)
+        self.fault_rates = np.array([params["rate"] / 3600.0 for _, params in fault], dtype=np.float64)
+        self.fault_magnitudes = np.array([params["magnitude"] for _, params in fault], dtype=np.float64)
+        self.fault_durations = np.array([params.get("duration", 0) or math.inf for _, params in fault], dtype=np.float64)
+        self.fault_remaining = np.zeros((devices, len(fault)), dtype=np.float64)
+
+        self.values = self._render()
+
+    def __len__(self):
+        return self.devices
+
+    def advance(self, dt=None):
+        """Avance toutes les stations de dt secondes (reference_interval par défaut); retourne les valeurs"""
+        dt = self.reference_interval if dt is None else dt
+        self.time += dt
+        shape = (self.devices,)
+
+        if len(self.walk_columns):
+            scale = math.sqrt(dt / self.reference_interval)
+            steps = self.rng.uniform(-1.0, 1.0, size=shape + self.walk_steps.shape)
+            self.level[:, self.walk_columns] += steps * (self.walk_steps * scale)
+        if len(self.drift_columns):
+            self.level[:, self.drift_columns] += self.drift_rates * dt
+        if len(self.bound_columns):
+            self.level[:, self.bound_columns] = np.clip(self.level[:, self.bound_columns], self.bound_low, self.bound_high)
+
+        if len(self.fault_columns):
+            self.fault_remaining = np.maximum(self.fault_remaining - dt, 0.0)
+            # Arrivées de Poisson: probabilité d'au moins un défaut pendant dt
+            triggered = (self.fault_remaining == 0) & (self.rng.random(self.fault_remaining.shape) < -np.expm1(-self.fault_rates * dt))
+            self.fault_remaining = np.where(triggered, self.fault_durations, self.fault_remaining)
+
+        # Nouvelle matrice: les lecteurs gardent une image cohérente de l'ancienne
+        self.values = self._render()
+        return self.values
+
+    def _render(self):
+        signal = self.level.copy()
+        if len(self.periodic_columns):
+            signal[:, self.periodic_columns] += self.periodic_amplitudes * np.sin(self.periodic_omegas * self.time + self.periodic_phases)
+        if len(self.fault_columns):
+            signal[:, self.fault_columns] += np.where(self.fault_remaining > 0, self.fault_magnitudes, 0.0)
+        return np.rint(signal).astype(np.int32)
+
+    def device_values(self, device):
+        """Valeurs d'une station: dictionnaire OID -> entier"""
+        return dict(zip(self.order, self.values[device].tolist()))
+
+    def nbytes(self):
+        return self.level.nbytes + self.values.nbytes + self.fault_remaining.nbytes
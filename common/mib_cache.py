@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cache des modules MIB compilés de pysnmp (collecteur et simulateur)
+pysnmp 4.4 charge ses MIB (modules Python de pysnmp/smi/mibs) dans chaque
+moteur SNMP en recompilant leur source: il cherche un <module>.pyc à l'ancien
+format, dont l'en-tête n'est plus reconnu depuis Python 3.7, et chaque moteur
+a son propre MibBuilder. Une quinzaine de modules sont ainsi recompilés à
+chaque moteur créé (environ 70 ms), et davantage au premier GET.
+
+Ici, le code compilé de chaque module est conservé:
+- en mémoire, partagé par tous les moteurs du processus (simulateur en mode
+  port: un moteur par station);
+- sur disque, pour les démarrages suivants: un fichier par module, invalidé si
+  la source (taille, date de modification) ou la version de Python change.
+
+Le compilateur de MIB ASN.1 (pysmi) n'est pas construit: pysnmp le crée à la
+première résolution d'un OID (plusieurs secondes pour son analyseur), alors que
+les OIDs DME sont numériques et que les MIB utiles sont livrées avec pysnmp.
+
+Un répertoire de cache absent ou en lecture seule ne fait que désactiver le
+cache disque.
+
+Auteur: arthur
+"""
+
+import os
+import struct
+import hashlib
+import logging
+import marshal
+import tempfile
+import threading
+import importlib.util
+
+from pysnmp.smi import builder
+
+logger = logging.getLogger("mib_cache")
+
+# Version du bytecode Python, taille et date (ns) de la source
+CACHE_HEADER = struct.Struct("<4sqq")
+CACHE_SUFFIX = ".mibc"
+
+# Code compilé par (source, taille, date): partagé par tous les moteurs du processus
+_code = {}
+_code_lock = threading.Lock()
+
+
+def _cache_path(cache_dir, source_path):
+    """Fichier de cache d'une source (nom du module et empreinte de son chemin)"""
+    digest = hashlib.blake2b(source_path.encode(), digest_size=6).hexdigest()
+    return os.path.join(cache_dir, f"{os.path.basename(source_path)}-{digest}{CACHE_SUFFIX}")
+
+
+def _load(cache_file, size, mtime_ns):
+    try:
+        with open(cache_file, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < CACHE_HEADER.size or \
+            CACHE_HEADER.unpack_from(data) != (importlib.util.MAGIC_NUMBER, size, mtime_ns):
+        return None
+    try:
+        return marshal.loads(data[CACHE_HEADER.size:])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def _store(cache_file, code, size, mtime_ns):
+    """Écriture atomique (fichier temporaire puis renommage): plusieurs processus peuvent démarrer ensemble"""
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(CACHE_HEADER.pack(importlib.util.MAGIC_NUMBER, size, mtime_ns) + marshal.dumps(code))
+        os.replace(temporary, cache_file)
+    except OSError as e:
+        logger.debug(f"Cache MIB non écrit ({cache_file}): {str(e)}")
+
+
+def compiled(source_path, cache_dir=None):
+    """Code compilé d'un module MIB: mémoire, puis cache disque, puis compilation de la source"""
+    stat = os.stat(source_path)
+    key = (source_path, stat.st_size, stat.st_mtime_ns)
+    code = _code.get(key)
+    if code is not None:
+        return code
+    with _code_lock:
+        code = _code.get(key)
+        if code is None:
+            cache_file = _cache_path(cache_dir, source_path) if cache_dir else None
+            code = _load(cache_file, stat.st_size, stat.st_mtime_ns) if cache_file else None
+            if code is None:
+                with open(source_path, 'r') as f:
+                    code = compile(f.read(), source_path, 'exec')
+                if cache_file:
+                    _store(cache_file, code, stat.st_size, stat.st_mtime_ns)
+            _code[key] = code
+    return code
+
+
+class NoMibCompiler:
+    """Tient la place du compilateur pysmi: un module MIB absent reste introuvable, sans analyse ASN.1"""
+
+    def compile(self, *names, **options):
+        return {name: "missing" for name in names}
+
+
+class CachedMibSource(builder.DirMibSource):
+    """Répertoire de MIB pysnmp dont les modules sont compilés une seule fois"""
+
+    def __init__(self, directory, cache_dir=None):
+        super().__init__(directory)
+        self.cache_dir = cache_dir
+
+    def read(self, f):
+        path = os.path.join(self._srcName, f + ".py")
+        if not os.path.isfile(path):
+            # Module fourni sous forme compilée seulement: chargement habituel de pysnmp
+            return super().read(f)
+        return compiled(path, self.cache_dir), ".py"
+
+
+def mib_builder(cache_dir=None):
+    """MibBuilder dont les répertoires de MIB passent par le cache (les archives restent inchangées)"""
+    mib_builder = builder.MibBuilder()
+    sources = mib_builder.getMibSources()
+    mib_builder.setMibSources(*[
+        CachedMibSource(source.fullPath(), cache_dir) if isinstance(source, builder.DirMibSource) else source
+        for source in sources
+    ])
+    # Compilateur déjà « présent »: pysnmp ne construit pas celui de pysmi (répertoire cible: MIB de pysnmp)
+    mib_builder.setMibCompiler(NoMibCompiler(), sources[0].fullPath())
+    return mib_builder
+
+
+def snmp_engine(cache_dir=None, **options):
+    """SnmpEngine pysnmp dont les MIB sont chargées depuis le cache (options: snmpEngineID, ...)"""
+    from pysnmp.entity import engine
+    from pysnmp.proto.rfc3412 import MsgAndPduDispatcher
+    from pysnmp.smi import instrum
+    dispatcher = MsgAndPduDispatcher(instrum.MibInstrumController(mib_builder(cache_dir)))
+    return engine.SnmpEngine(msgAndPduDsp=dispatcher, **options)
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark de bout en bout du collecteur DME
+Lance localement un agent SNMPv3 (simulateur multi-équipements, mode contexte),
+un proxy UDP injectant une latence réseau et un serveur TCP tenant lieu de
+Logstash, puis exécute le collecteur sur une matrice de charges
+(équipements x nombre d'OIDs x latence).
+
+Pour chaque charge: cycles/s, latence de cycle p50/p95/p99, répartition du
+temps entre collecte SNMP et traitement (CSV, Logstash), CPU et RSS du
+collecteur, documents reçus par le faux Logstash. Les résultats sont écrits en
+JSON; --baseline compare à un fichier de résultats précédent.
+
+Pilotes:
+  threads : DMECollector.run_collection_cycle par équipement, dans un pool de threads
+  fleet   : FleetPoller.run_cycle (pysnmp asyncio, Python <= 3.10)
+  auto    : fleet si l'API asyncio de pysnmp est disponible, sinon threads
+
+Exemple:
+    python scripts/bench_collector.py --devices 1,100,1000 --oids 6,26 --latency 0,0.02 \\
+        --cycles 10 --output bench_collector.json --baseline bench_collector.previous.json
+
+Auteur: arthur
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import socket
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import selectors
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO_ROOT, "vm2_data_collector"))
+
+SIMULATOR = os.path.join(REPO_ROOT, "vm1_dme_simulator", "multi_dme_simulator.py")
+
+
+def free_port(kind=socket.SOCK_DGRAM):
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    """Percentile par rang le plus proche"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def current_rss_kb():
+    """RSS courant du processus (Linux), sinon pic RSS"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class LogstashSink:
+    """Serveur TCP json_lines minimal: compte les documents et les octets reçus"""
+
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(16)
+        self.port = self.server.getsockname()[1]
+        self.documents = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self._accept, name="bench-logstash", daemon=True).start()
+
+    def _accept(self):
+        while True:
+            connection, _ = self.server.accept()
+            threading.Thread(target=self._read, args=(connection,), daemon=True).start()
+
+    def _read(self, connection):
+        with connection:
+            while True:
+                chunk = connection.recv(65536)
+                if not chunk:
+                    return
+                with self.lock:
+                    self.bytes += len(chunk)
+                    self.documents += chunk.count(b"\n")
+
+    def snapshot(self):
+        with self.lock:
+            return self.documents, self.bytes
+
+
+class UdpDelayProxy:
+    """Proxy UDP ajoutant un délai fixe (plus une gigue) dans chaque sens"""
+
+    def __init__(self, upstream, delay=0.0, jitter=0.0):
+        self.upstream = upstream
+        self.delay = delay
+        self.jitter = jitter
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.setblocking(False)
+        self.port = self.listener.getsockname()[1]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        # Un socket amont par client, pour retrouver le destinataire des réponses
+        self.upstream_sockets = {}
+        self.pending = []
+        self.sequence = 0
+        threading.Thread(target=self._run, name="bench-udp-proxy", daemon=True).start()
+
+    def _schedule(self, sock, payload, address):
+        due = time.monotonic() + self.delay + random.uniform(0, self.jitter)
+        self.sequence += 1
+        heapq.heappush(self.pending, (due, self.sequence, sock, payload, address))
+
+    def _upstream_socket(self, client):
+        sock = self.upstream_sockets.get(client)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.connect(self.upstream)
+            self.selector.register(sock, selectors.EVENT_READ, client)
+            self.upstream_sockets[client] = sock
+        return sock
+
+    def _run(self):
+        while True:
+            timeout = max(0.0, self.pending[0][0] - time.monotonic()) if self.pending else None
+            for key, _ in self.selector.select(timeout):
+                try:
+                    if key.data is None:
+                        payload, client = self.listener.recvfrom(65535)
+                        self._schedule(self._upstream_socket(client), payload, None)
+                    else:
+                        payload = key.fileobj.recv(65535)
+                        self._schedule(self.listener, payload, key.data)
+                except BlockingIOError:
+                    continue
+            now = time.monotonic()
+            while self.pending and self.pending[0][0] <= now:
+                _, _, sock, payload, address = heapq.heappop(self.pending)
+                try:
+                    if address is None:
+                        sock.send(payload)
+                    else:
+                        sock.sendto(payload, address)
+                except OSError:
+                    pass
+
+
+class SimulatorProcess:
+    """Simulateur multi-équipements lancé en sous-processus (mode contexte)"""
+
+    def __init__(self, devices, workdir, startup_timeout=300.0):
+        self.port = free_port()
+        self.inventory = os.path.join(workdir, "simulator_inventory.json")
+        self.log_path = os.path.join(workdir, "simulator.log")
+        self.log = open(self.log_path, "w")
+        self.process = subprocess.Popen(
+            [sys.executable, SIMULATOR, "--mode", "context", "--devices", str(devices),
+             "--port", str(self.port), "--inventory", self.inventory],
+            cwd=os.path.dirname(SIMULATOR), stdout=self.log, stderr=subprocess.STDOUT,
+            env=dict(os.environ, SIM_UPDATE_INTERVAL="1"),
+        )
+        deadline = time.monotonic() + startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Le simulateur s'est arrêté au démarrage (voir {self.log_path})")
+            with open(self.log_path) as f:
+                if "Simulateur prêt" in f.read():
+                    return
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"Simulateur non prêt après {startup_timeout}s (voir {self.log_path})")
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+def fleet_available():
+    try:
+        from pysnmp.hlapi import asyncio as _hlapi  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+class PhaseTimer:
+    """Accumule les durées par phase (collecte SNMP, traitement des sorties)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.device_latencies = []
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.totals[phase] = self.totals.get(phase, 0.0) + seconds
+            if phase == "collect":
+                self.device_latencies.append(seconds)
+
+    def wrap(self, phase, function):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - started)
+        return timed
+
+    def wrap_async(self, phase, function):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - started)
+        return timed
+
+
+def build_devices(inventory_path, count, oid_count, port, workload_id):
+    """Équipements de l'inventaire du simulateur, redirigés vers le proxy, profil tronqué à oid_count OIDs"""
+    from fleet_poller import load_inventory
+
+    devices = load_inventory(inventory_path)[:count]
+    for device in devices:
+        device.port = port
+        device.oids = device.oids[:oid_count]
+        device.profile = f"bench-{oid_count}"
+        # Un fichier CSV distinct par charge
+        device.name = f"{workload_id}-{device.name}"
+    return devices
+
+
+def flush_logstash(sink, documents_before, timeout=10.0):
+    """
+    Vide l'expéditeur Logstash en fin de charge et retourne les documents reçus
+    par le puits depuis le début de la charge (cycle de chauffe compris).
+
+    L'expéditeur est fermé: la charge suivante en démarre un neuf, dont les
+    compteurs ne mélangent pas deux charges.
+    """
+    from logstash_shipper import close_shipper
+
+    shipper = close_shipper(os.environ["LOGSTASH_HOST"], int(os.environ["LOGSTASH_PORT"]), timeout)
+    sent = shipper.stats["sent"] if shipper is not None else 0
+    # Les documents envoyés peuvent encore être en transit vers le thread de lecture du puits
+    deadline = time.monotonic() + timeout
+    while sink.snapshot()[0] - documents_before < sent and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return sink.snapshot()[0] - documents_before
+
+
+def run_workload(args, driver, inventory_path, proxy_port, sink, devices_count, oid_count, latency):
+    from dme_collector_snmpv3 import DMECollector
+
+    workload_id = f"d{devices_count}-o{oid_count}-l{int(latency * 1000)}"
+    documents_before = sink.snapshot()[0]
+    devices = build_devices(inventory_path, devices_count, oid_count, proxy_port, workload_id)
+    timer = PhaseTimer()
+    cycle_times = []
+
+    if driver == "fleet":
+        from fleet_poller import FleetPoller
+
+        poller = FleetPoller(devices, max_in_flight=args.in_flight, interval=1.0)
+        poller.fetch = timer.wrap_async("collect", poller.fetch)
+        for collector in poller.collectors.values():
+            collector.process_data = timer.wrap("process", collector.process_data)
+
+        async def run():
+            await poller.run_cycle()
+            timer.totals.clear()
+            timer.device_latencies.clear()
+            cpu_start = time.process_time()
+            for _ in range(args.cycles):
+                started = time.perf_counter()
+                succeeded = await poller.run_cycle()
+                cycle_times.append(time.perf_counter() - started)
+            return succeeded, time.process_time() - cpu_start
+
+        succeeded, cpu = asyncio.run(run())
+    else:
+        collectors = [DMECollector(device=device) for device in devices]
+        for collector in collectors:
+            collector.collect_data = timer.wrap("collect", collector.collect_data)
+            collector.process_data = timer.wrap("process", collector.process_data)
+
+        with ThreadPoolExecutor(max_workers=min(args.in_flight, len(collectors))) as pool:
+            def cycle():
+                return sum(1 for ok in pool.map(lambda collector: collector.run_collection_cycle(), collectors) if ok)
+
+            # Cycle de chauffe non mesuré (découverte SNMPv3, ouverture des fichiers)
+            cycle()
+            timer.totals.clear()
+            timer.device_latencies.clear()
+            cpu_start = time.process_time()
+            for _ in range(args.cycles):
+                started = time.perf_counter()
+                succeeded = cycle()
+                cycle_times.append(time.perf_counter() - started)
+            cpu = time.process_time() - cpu_start
+
+        for collector in collectors:
+            collector.csv_sink.close()
+
+    logstash_documents = flush_logstash(sink, documents_before)
+    total_wall = sum(cycle_times)
+    samples = devices_count * args.cycles
+    return {
+        "workload": workload_id,
+        "driver": driver,
+        "devices": devices_count,
+        "oids": oid_count,
+        "latency_ms": latency * 1000,
+        "cycles": args.cycles,
+        "succeeded_last_cycle": succeeded,
+        "cycles_per_s": round(args.cycles / total_wall, 3) if total_wall else None,
+        "samples_per_s": round(samples / total_wall, 1) if total_wall else None,
+        "cycle_p50_ms": round(percentile(cycle_times, 0.50) * 1000, 2),
+        "cycle_p95_ms": round(percentile(cycle_times, 0.95) * 1000, 2),
+        "cycle_p99_ms": round(percentile(cycle_times, 0.99) * 1000, 2),
+        "device_p50_ms": round(percentile(timer.device_latencies, 0.50) * 1000, 2) if timer.device_latencies else None,
+        "device_p99_ms": round(percentile(timer.device_latencies, 0.99) * 1000, 2) if timer.device_latencies else None,
+        "collect_s": round(timer.totals.get("collect", 0.0), 4),
+        "process_s": round(timer.totals.get("process", 0.0), 4),
+        "cpu_s": round(cpu, 4),
+        "cpu_per_sample_ms": round(cpu / samples * 1000, 3) if samples else None,
+        "rss_kb": current_rss_kb(),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "logstash_documents": logstash_documents,
+    }
+
+
+def compare(results, baseline_path):
+    """Affiche l'écart relatif avec un fichier de résultats précédent"""
+    with open(baseline_path) as f:
+        baseline = {entry["workload"]: entry for entry in json.load(f)["results"]}
+    print(f"\nComparaison avec {baseline_path}:")
+    for entry in results:
+        previous = baseline.get(entry["workload"])
+        if previous is None:
+            continue
+        changes = []
+        for key in ("cycles_per_s", "cycle_p99_ms", "cpu_per_sample_ms", "rss_kb"):
+            if previous.get(key) and entry.get(key) is not None:
+                changes.append(f"{key} {100.0 * (entry[key] - previous[key]) / previous[key]:+.1f}%")
+        print(f"  {entry['workload']}: " + ", ".join(changes))
+
+
+def parse_list(text, cast):
+    return [cast(value) for value in text.split(",") if value.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de bout en bout du collecteur DME")
+    parser.add_argument("--devices", default="1,100", help="Nombres d'équipements (liste séparée par des virgules)")
+    parser.add_argument("--oids", default="26", help="Nombres d'OIDs par équipement (liste)")
+    parser.add_argument("--latency", default="0", help="Latences réseau injectées par sens, en secondes (liste)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Gigue maximale ajoutée à la latence (s)")
+    parser.add_argument("--cycles", type=int, default=10, help="Cycles mesurés par charge")
+    parser.add_argument("--in-flight", type=int, default=64, help="Collectes simultanées maximum")
+    parser.add_argument("--driver", choices=("auto", "fleet", "threads"), default="auto")
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    parser.add_argument("--baseline", help="Fichier JSON de résultats à comparer")
+    args = parser.parse_args()
+
+    device_counts = parse_list(args.devices, int)
+    oid_counts = parse_list(args.oids, int)
+    latencies = parse_list(args.latency, float)
+    driver = args.driver
+    if driver == "auto":
+        driver = "fleet" if fleet_available() else "threads"
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    # Sorties du collecteur dans un répertoire temporaire
+    workdir = tempfile.mkdtemp(prefix="bench_collector_")
+    sink = LogstashSink()
+    os.environ.update({
+        "OUTPUT_FILE": os.path.join(workdir, "dme_data.csv"),
+        "LOGSTASH_ENABLED": "true",
+        "LOGSTASH_HOST": "127.0.0.1",
+        "LOGSTASH_PORT": str(sink.port),
+        "TIMEOUT": "2",
+        "MAX_RETRIES": "1",
+    })
+    os.chdir(workdir)
+
+    import logging
+    import dme_collector_snmpv3  # noqa: F401  (configuration du logging du collecteur)
+    logging.getLogger().setLevel(logging.WARNING)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (resource.getrlimit(resource.RLIMIT_NOFILE)[1],) * 2)
+
+    print(f"Démarrage du simulateur ({max(device_counts)} équipements)...", file=sys.stderr)
+    simulator = SimulatorProcess(max(device_counts), workdir)
+    results = []
+    try:
+        for latency in latencies:
+            proxy = UdpDelayProxy(("127.0.0.1", simulator.port), latency, args.jitter)
+            for devices_count in device_counts:
+                for oid_count in oid_counts:
+                    result = run_workload(args, driver, simulator.inventory, proxy.port, sink, devices_count, oid_count, latency)
+                    results.append(result)
+                    print(
+                        f"{result['workload']:>18}: {result['cycles_per_s']} cycles/s, p50 {result['cycle_p50_ms']} ms, "
+                        f"p99 {result['cycle_p99_ms']} ms, CPU {result['cpu_per_sample_ms']} ms/échantillon, "
+                        f"{result['succeeded_last_cycle']}/{devices_count} OK",
+                        file=sys.stderr,
+                    )
+    finally:
+        simulator.stop()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "driver": driver,
+        "workdir": workdir,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
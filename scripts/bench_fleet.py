@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark du collecteur en mode flotte
+Mesure le temps CPU consommé par cycle de FleetPoller et en déduit le nombre
+d'équipements qu'un cœur peut suivre à un intervalle donné (10 s par défaut).
+
+Deux modes:
+  --synthetic : la requête SNMP est remplacée par une attente asyncio
+                (latence réseau simulée), seul le coût du pipeline est mesuré
+  --inventory : interrogation SNMPv3 réelle des équipements de l'inventaire
+
+Exemple:
+    python scripts/bench_fleet.py --synthetic --devices 500 --cycles 5
+
+Auteur: arthur
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vm2_data_collector"))
+
+
+def synthetic_fetch_factory(latency, jitter):
+    """Crée une fonction fetch simulant un équipement répondant après une latence"""
+    from dme_collector_snmpv3 import OID_LIST
+
+    async def fetch(device, collector):
+        await asyncio.sleep(latency + random.uniform(0, jitter))
+        return {OID_LIST[oid]: random.randint(0, 50000) for oid in device.oids}
+
+    return fetch
+
+
+def synthetic_devices(count):
+    """Inventaire synthétique de count équipements"""
+    from fleet_poller import DeviceSpec, DEVICE_DEFAULTS
+    from dme_collector_snmpv3 import OID_LIST
+
+    devices = []
+    for index in range(count):
+        params = dict(DEVICE_DEFAULTS)
+        params.update(name=f"bench-{index:05d}", host="127.0.0.1", oids=list(OID_LIST))
+        devices.append(DeviceSpec(**params))
+    return devices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du collecteur DME en mode flotte")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--synthetic", action="store_true", help="SNMP simulé par une attente asyncio")
+    mode.add_argument("--inventory", help="Inventaire JSON d'équipements réels")
+    parser.add_argument("--devices", type=int, default=200, help="Nombre d'équipements synthétiques")
+    parser.add_argument("--cycles", type=int, default=5, help="Nombre de cycles mesurés")
+    parser.add_argument("--in-flight", type=int, default=64, help="Requêtes simultanées maximum")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latence simulée (s)")
+    parser.add_argument("--interval", type=float, default=10.0, help="Intervalle de collecte cible (s)")
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    # Sorties CSV dans un répertoire temporaire, Logstash désactivé
+    workdir = tempfile.mkdtemp(prefix="bench_fleet_")
+    os.environ["OUTPUT_FILE"] = os.path.join(workdir, "dme_data.csv")
+    os.environ["LOGSTASH_ENABLED"] = "false"
+    os.chdir(workdir)
+
+    import logging
+    from fleet_poller import FleetPoller, load_inventory
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.synthetic:
+        devices = synthetic_devices(args.devices)
+        fetch = synthetic_fetch_factory(args.latency, args.latency / 2)
+    else:
+        devices = load_inventory(args.inventory)
+        fetch = None
+
+    poller = FleetPoller(devices, max_in_flight=args.in_flight, interval=args.interval, fetch=fetch)
+
+    async def run():
+        # Cycle de chauffe non mesuré (création des moteurs, découverte SNMPv3)
+        await poller.run_cycle()
+        samples = []
+        for _ in range(args.cycles):
+            cpu_start = time.process_time()
+            wall_start = time.monotonic()
+            succeeded = await poller.run_cycle()
+            samples.append((time.process_time() - cpu_start, time.monotonic() - wall_start, succeeded))
+        return samples
+
+    samples = asyncio.run(run())
+
+    cpu_per_cycle = sum(sample[0] for sample in samples) / len(samples)
+    wall_per_cycle = sum(sample[1] for sample in samples) / len(samples)
+    cpu_per_device = cpu_per_cycle / len(devices)
+    result = {
+        "mode": "synthetic" if args.synthetic else "snmp",
+        "devices": len(devices),
+        "cycles": args.cycles,
+        "max_in_flight": args.in_flight,
+        "cpu_per_cycle_s": round(cpu_per_cycle, 4),
+        "wall_per_cycle_s": round(wall_per_cycle, 4),
+        "cpu_per_device_ms": round(cpu_per_device * 1000, 3),
+        "interval_s": args.interval,
+        "devices_per_core": int(args.interval / cpu_per_device) if cpu_per_device else None,
+        "succeeded_last_cycle": samples[-1][2],
+    }
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
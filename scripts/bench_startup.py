@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark du démarrage à froid du collecteur et du simulateur
+Chaque mesure est faite dans un processus neuf (comme après un redémarrage du
+conteneur). Pour le collecteur, face à un simulateur local (mode contexte):
+import du module, construction de DMECollector, premier cycle (import de
+pysnmp, moteur SNMP, découverte de l'agent, GET) et cycle suivant, ainsi que
+le délai total entre le lancement du processus et le premier échantillon.
+Pour le simulateur: import et configuration des moteurs SNMP.
+
+Trois états du cache des MIB compilées (common/mib_cache.py):
+  cold  : répertoire de cache vide (premier démarrage)
+  warm  : cache rempli par un démarrage précédent
+  off   : cache disque désactivé (MIB_CACHE_DIR vide)
+
+Exemple:
+    python scripts/bench_startup.py --runs 5 --sim-devices 50 --sim-mode port --output bench_startup.json
+
+Auteur: arthur
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.join(SCRIPTS_DIR, "..")
+CACHE_STATES = ("cold", "warm", "off")
+
+
+def child_collector():
+    """Processus mesuré: import, initialisation et deux cycles du collecteur (résultat JSON sur stdout)"""
+    started = time.perf_counter()
+    sys.path.insert(0, os.path.join(REPO_ROOT, "vm2_data_collector"))
+    import logging
+    import dme_collector_snmpv3
+    imported = time.perf_counter()
+    logging.getLogger().setLevel(logging.WARNING)
+    collector = dme_collector_snmpv3.DMECollector()
+    initialized = time.perf_counter()
+    success = collector.run_collection_cycle()
+    first_sample = time.perf_counter()
+    first_sample_epoch = time.time()
+    collector.run_collection_cycle()
+    second = time.perf_counter()
+    print(json.dumps({
+        "import_s": imported - started,
+        "init_s": initialized - imported,
+        "first_cycle_s": first_sample - initialized,
+        "next_cycle_s": second - first_sample,
+        "first_sample_epoch": first_sample_epoch,
+        "success": bool(success),
+        "pysnmp_modules": sum(1 for name in sys.modules if name.startswith("pysnmp")),
+    }))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def child_simulator(devices, mode, port):
+    """Processus mesuré: import du simulateur et configuration des moteurs SNMP (sans servir de requêtes)"""
+    started = time.perf_counter()
+    sys.path.insert(0, os.path.join(REPO_ROOT, "vm1_dme_simulator"))
+    import logging
+    import multi_dme_simulator
+    imported = time.perf_counter()
+    logging.getLogger().setLevel(logging.WARNING)
+    simulator = multi_dme_simulator.MultiDMESimulator(devices, mode, port)
+    state = time.perf_counter()
+    if mode == "context":
+        simulator.setup_context_mode()
+    else:
+        simulator.setup_port_mode()
+    ready = time.perf_counter()
+    print(json.dumps({
+        "import_s": imported - started,
+        "state_s": state - imported,
+        "setup_s": ready - state,
+    }))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def run_child(arguments, env, cwd):
+    """Lance un processus mesuré; retourne (résultat JSON, instant de lancement)"""
+    launched = time.time()
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)] + arguments,
+        env=env, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=600,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Mesure en échec ({' '.join(arguments)}): {process.stderr.strip()[-2000:]}")
+    return json.loads(process.stdout.strip().splitlines()[-1]), launched
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def summarize(samples):
+    """Médiane (ms) de chaque mesure numérique"""
+    keys = [key for key, value in samples[0].items() if isinstance(value, float) and not key.endswith("_epoch")]
+    return {key[:-2] + "_ms": round(median([sample[key] for sample in samples]) * 1000, 1) for key in keys}
+
+
+def cache_env(base_env, state, cache_dir):
+    env = dict(base_env)
+    if state == "off":
+        env["MIB_CACHE_DIR"] = ""
+    else:
+        if state == "cold":
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        env["MIB_CACHE_DIR"] = cache_dir
+    return env
+
+
+def bench_collector(args, workdir):
+    from bench_collector import SimulatorProcess, free_port
+    simulator = SimulatorProcess(1, workdir)
+    cache_dir = os.path.join(workdir, "mib_cache")
+    base_env = dict(
+        os.environ,
+        SNMP_HOST="127.0.0.1",
+        SNMP_PORT=str(simulator.port),
+        OUTPUT_FILE=os.path.join(workdir, "dme_data.csv"),
+        METRICS_PORT=str(free_port(socket.SOCK_STREAM)),
+        TIMEOUT="2",
+        MAX_RETRIES="1",
+    )
+    results = {}
+    try:
+        for state in CACHE_STATES:
+            samples = []
+            for _ in range(args.runs):
+                sample, launched = run_child(["--child", "collector"], cache_env(base_env, state, cache_dir), workdir)
+                if not sample["success"]:
+                    raise RuntimeError(f"Premier cycle sans échantillon (voir {workdir})")
+                sample["time_to_first_sample_s"] = sample["first_sample_epoch"] - launched
+                samples.append(sample)
+            results[state] = summarize(samples)
+            results[state]["pysnmp_modules"] = samples[-1]["pysnmp_modules"]
+            print(f"collecteur [{state:>4}]: " + ", ".join(f"{key} {value}" for key, value in results[state].items()), file=sys.stderr)
+    finally:
+        simulator.stop()
+    return results
+
+
+def bench_simulator(args, workdir):
+    from bench_collector import free_port
+    cache_dir = os.path.join(workdir, "mib_cache_simulator")
+    results = {}
+    for state in CACHE_STATES:
+        samples = []
+        for _ in range(args.runs):
+            port = args.sim_port if args.sim_mode == "port" else free_port()
+            sample, _ = run_child(["--child", "simulator", "--sim-devices", str(args.sim_devices),
+                                   "--sim-mode", args.sim_mode, "--sim-port", str(port)],
+                                  cache_env(os.environ, state, cache_dir), workdir)
+            samples.append(sample)
+        results[state] = summarize(samples)
+        print(f"simulateur [{state:>4}]: " + ", ".join(f"{key} {value}" for key, value in results[state].items()), file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps de démarrage à froid du collecteur et du simulateur DME")
+    parser.add_argument("--runs", type=int, default=3, help="Processus lancés par mesure (médiane)")
+    parser.add_argument("--sim-devices", type=int, default=50, help="Stations virtuelles du simulateur mesuré")
+    parser.add_argument("--sim-mode", choices=("context", "port"), default="port")
+    parser.add_argument("--sim-port", type=int, default=17161, help="Premier port UDP (mode port)")
+    parser.add_argument("--skip", choices=("collector", "simulator"), action="append", default=[])
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    parser.add_argument("--child", choices=("collector", "simulator"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "collector":
+        child_collector()
+    elif args.child == "simulator":
+        child_simulator(args.sim_devices, args.sim_mode, args.sim_port)
+
+    sys.path.insert(0, SCRIPTS_DIR)
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "runs": args.runs,
+        "workdir": workdir,
+    }
+    if "collector" not in args.skip:
+        report["collector"] = bench_collector(args, workdir)
+    if "simulator" not in args.skip:
+        report["simulator"] = {"mode": args.sim_mode, "devices": args.sim_devices, **bench_simulator(args, workdir)}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
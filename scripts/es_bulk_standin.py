@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Serveur HTTP local imitant l'API _bulk d'Elasticsearch
+Permet de tester la sortie directe du collecteur (es_bulk.py) sans cluster:
+les documents sont conservés en mémoire par index et par _id (un _id déjà
+présent est remplacé, comme dans Elasticsearch), la connexion reste ouverte
+entre les requêtes (HTTP/1.1 keep-alive) et des rejets peuvent être injectés.
+--ids-only ne garde que les identifiants (essais de charge de plusieurs
+millions de documents).
+
+Points d'accès:
+  POST /_bulk                      indexation NDJSON (réponse au format Elasticsearch)
+  GET  /<index>/_count             nombre de documents d'un index (jokers * acceptés)
+  GET  /_standin/stats             compteurs (requêtes, connexions, rejets...)
+
+Exemple:
+    python scripts/es_bulk_standin.py --port 19200 --reject-rate 0.1
+    ES_BULK_ENABLED=true ES_URL=http://127.0.0.1:19200 python vm2_data_collector/simple_collector.py
+
+Auteur: arthur
+"""
+
+import json
+import random
+import fnmatch
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class BulkStore:
+    """Documents indexés et compteurs du serveur"""
+
+    def __init__(self, reject_rate=0.0, fail_rate=0.0, seed=None, ids_only=False):
+        self.reject_rate = reject_rate
+        self.fail_rate = fail_rate
+        self.ids_only = ids_only
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.indices = {}
+        self.stats = {"requests": 0, "connections": 0, "items": 0, "indexed": 0, "updated": 0, "rejected_items": 0, "failed_requests": 0}
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+
+class BulkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    store = None
+
+    def setup(self):
+        super().setup()
+        self.store.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.path.split("?")[0] != "/_bulk":
+            self._reply(404, {"error": "not_found"})
+            return
+
+        store = self.store
+        store.count("requests")
+        if store.random.random() < store.fail_rate:
+            store.count("failed_requests")
+            self._reply(503, {"error": {"type": "unavailable_shards_exception"}, "status": 503})
+            return
+
+        lines = [line for line in body.split(b"\n") if line.strip()]
+        items = []
+        errors = False
+        for action_line, document_line in zip(lines[0::2], lines[1::2]):
+            action = json.loads(action_line)
+            operation, meta = next(iter(action.items()))
+            index = meta.get("_index", "default")
+            document = None if store.ids_only else json.loads(document_line)
+            store.count("items")
+            if store.random.random() < store.reject_rate:
+                errors = True
+                store.count("rejected_items")
+                items.append({operation: {"_index": index, "status": 429,
+                                          "error": {"type": "es_rejected_execution_exception"}}})
+                continue
+            with store.lock:
+                documents = store.indices.setdefault(index, {})
+                document_id = meta.get("_id") or f"auto-{len(documents) + 1}"
+                created = document_id not in documents
+                documents[document_id] = document
+            store.count("indexed" if created else "updated")
+            items.append({operation: {"_index": index, "_id": document_id, "result": "created" if created else "updated",
+                                      "status": 201 if created else 200}})
+
+        self._reply(200, {"took": 1, "errors": errors, "items": items})
+
+    def do_GET(self):
+        path = self.path.split("?")[0].strip("/")
+        store = self.store
+        if path == "_standin/stats":
+            with store.lock:
+                payload = dict(store.stats)
+                payload["indices"] = {name: len(documents) for name, documents in store.indices.items()}
+            self._reply(200, payload)
+        elif path.endswith("/_count"):
+            pattern = path[:-len("/_count")]
+            with store.lock:
+                total = sum(len(documents) for name, documents in store.indices.items() if fnmatch.fnmatchcase(name, pattern))
+            self._reply(200, {"count": total})
+        else:
+            self._reply(200, {"name": "es-bulk-standin", "version": {"number": "7.14.0"}})
+
+
+def serve(port, reject_rate=0.0, fail_rate=0.0, seed=None, host="127.0.0.1", ids_only=False):
+    """Démarre le serveur dans un thread et retourne (serveur, stockage)"""
+    store = BulkStore(reject_rate, fail_rate, seed, ids_only)
+    handler = type("StandinHandler", (BulkHandler,), {"store": store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="es-bulk-standin", daemon=True).start()
+    return server, store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur local imitant l'API _bulk d'Elasticsearch")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=19200)
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="Part des éléments rejetés en 429")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Part des requêtes refusées en 503")
+    parser.add_argument("--seed", type=int, help="Graine des rejets injectés")
+    parser.add_argument("--ids-only", action="store_true", help="Ne conserve que les _id des documents")
+    args = parser.parse_args()
+
+    store = BulkStore(args.reject_rate, args.fail_rate, args.seed, args.ids_only)
+    handler = type("StandinHandler", (BulkHandler,), {"store": store})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"Stand-in _bulk à l'écoute sur http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
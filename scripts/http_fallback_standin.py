@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Serveur HTTP local imitant l'API /all du simulateur DME
+Permet de tester le repli HTTP du collecteur (http_fallback.py) sans
+simulateur: authentification Basic, réponse {"status", "timestamp", "data"},
+connexions persistantes (HTTP/1.1 keep-alive), latence et erreurs injectables.
+
+Points d'accès:
+  GET /all                 toutes les métriques (401 sans identifiants valides)
+  GET /_standin/stats      compteurs (requêtes, connexions, refus...)
+
+Exemple:
+    python scripts/http_fallback_standin.py --port 15000 --delay 0.05
+    SNMP_HOST=127.0.0.1 SNMP_PORT=1 HTTP_FALLBACK_PORT=15000 python vm2_data_collector/dme_collector_snmpv3.py
+
+Auteur: arthur
+"""
+
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Métriques servies et valeurs de départ (mêmes noms que le collecteur)
+BASE_VALUES = {
+    "mtuExecTXPADelayCurrentValue": 0,
+    "mtuExecTXPBDelayCurrentValue": 49200,
+    "mtuExecTXPAPulsePairSpacing": 0,
+    "mtuExecTXPBPulsePairSpacing": 12000,
+    "mtuExecTXPATransmittedPowerCurrentValue": 0,
+    "mtuExecTXPBTransmittedPowerCurrentValue": 1000,
+    "mtuExecTXPAEfficiency": 0,
+    "mtuExecTXPBEfficiency": 85,
+    "mtuExecTXPATxFreqError": 0,
+    "mtuExecTXPBTxFreqError": 0,
+    "mtuExecRadiatedPowerCurrentValue": 980,
+    "mtuExecTransmissionRate": 840,
+    "mtuExecIdentStatus": 1,
+}
+INSTANCES = (0, 3)
+
+
+class StandinState:
+    """Identifiants attendus, défauts injectés et compteurs"""
+
+    def __init__(self, user, password, delay=0.0, error_rate=0.0, seed=None):
+        self.authorization = "Basic " + base64.b64encode(f"{user}:{password}".encode()).decode()
+        self.delay = delay
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "unauthorized": 0, "errors": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def payload(self):
+        data = {}
+        for name, value in BASE_VALUES.items():
+            for instance in INSTANCES:
+                data[f"{name}-{instance}"] = value + (self.random.randint(-20, 20) if value else 0)
+        return {"status": "ok", "timestamp": datetime.now().isoformat(), "data": data}
+
+
+class FallbackHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state = None
+
+    def setup(self):
+        super().setup()
+        self.state.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload, headers=()):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.state
+        path = self.path.split("?")[0]
+        if path == "/_standin/stats":
+            with state.lock:
+                self._reply(200, dict(state.stats))
+            return
+        if path != "/all":
+            self._reply(404, {"error": "not_found"})
+            return
+
+        state.count("requests")
+        if self.headers.get("Authorization") != state.authorization:
+            state.count("unauthorized")
+            self._reply(401, {"error": "unauthorized"}, [("WWW-Authenticate", 'Basic realm="dme"')])
+            return
+        if state.delay:
+            time.sleep(state.delay)
+        if state.random.random() < state.error_rate:
+            state.count("errors")
+            self._reply(503, {"error": "unavailable"})
+            return
+        self._reply(200, state.payload())
+
+
+def serve(port, user="dmeuser", password="authpassword", delay=0.0, error_rate=0.0, seed=None, host="127.0.0.1"):
+    """Démarre le serveur dans un thread et retourne (serveur, état)"""
+    state = StandinState(user, password, delay, error_rate, seed)
+    handler = type("StandinHandler", (FallbackHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="http-fallback-standin", daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur local imitant l'API /all du simulateur DME")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=15000)
+    parser.add_argument("--user", default="dmeuser")
+    parser.add_argument("--password", default="authpassword")
+    parser.add_argument("--delay", type=float, default=0.0, help="Latence ajoutée à chaque réponse (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Part des requêtes refusées en 503")
+    parser.add_argument("--seed", type=int, help="Graine des valeurs et des erreurs injectées")
+    args = parser.parse_args()
+
+    server, _ = serve(args.port, args.user, args.password, args.delay, args.error_rate, args.seed, args.host)
+    print(f"Stand-in /all à l'écoute sur http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Serveur local compatible Redis (protocole RESP) pour la coordination des collecteurs
+Permet de tester lease_coordinator.py (COORD_BACKEND=resp) sans Redis: les
+clés sont conservées en mémoire avec leur expiration, et les commandes
+utilisées par les baux sont reprises avec la sémantique de Redis, y compris
+les transactions optimistes (WATCH/MULTI/EXEC).
+
+Commandes: PING, AUTH, SELECT, GET, SET [NX|XX] [PX|EX], DEL, PEXPIRE, PTTL,
+MGET, KEYS, SCAN, WATCH, UNWATCH, MULTI, EXEC, DISCARD, FLUSHALL, QUIT.
+
+Exemple:
+    python scripts/resp_standin.py --port 16379
+    COORD_BACKEND=resp COORD_URL=redis://127.0.0.1:16379/0 python vm2_data_collector/lease_coordinator.py inventaire.json
+
+Auteur: arthur
+"""
+
+import time
+import fnmatch
+import argparse
+import threading
+import socketserver
+
+
+class Status(str):
+    """Réponse simple (+OK)"""
+
+
+class Error(str):
+    """Réponse d'erreur (-ERR ...)"""
+
+
+class NullArray:
+    """Transaction annulée (*-1)"""
+
+
+class RespStore:
+    """Clés, échéances et versions (WATCH) du serveur"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = {}
+        self.expires = {}
+        self.versions = {}
+        self.stats = {"connections": 0, "commands": 0, "transactions": 0, "aborted": 0}
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _alive(self, key):
+        """Supprime la clé si elle a expiré; retourne True si elle existe"""
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            del self.data[key]
+            del self.expires[key]
+            self._touch(key)
+        return key in self.data
+
+    def version(self, key):
+        self._alive(key)
+        return self.versions.get(key, 0)
+
+    def get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    def set(self, key, value, ttl_ms=None):
+        self.data[key] = value
+        if ttl_ms is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.monotonic() + ttl_ms / 1000
+        self._touch(key)
+
+    def delete(self, key):
+        if not self._alive(key):
+            return False
+        del self.data[key]
+        self.expires.pop(key, None)
+        self._touch(key)
+        return True
+
+    def keys(self, pattern):
+        return [key for key in list(self.data) if self._alive(key) and fnmatch.fnmatchcase(key, pattern)]
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    store = None
+
+    def _write(self, reply):
+        self.wfile.write(self._encode(reply))
+
+    def _encode(self, reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, Status):
+            return b"+%s\r\n" % reply.encode()
+        if isinstance(reply, Error):
+            return b"-%s\r\n" % reply.encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % int(reply)
+        if isinstance(reply, NullArray):
+            return b"*-1\r\n"
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(self._encode(item) for item in reply)
+        data = reply.encode() if isinstance(reply, str) else reply
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Commande en ligne (telnet, nc)
+            return line.decode().split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def handle(self):
+        store = self.store
+        with store.lock:
+            store.stats["connections"] += 1
+        self.watched = {}
+        self.queued = None
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            if not args:
+                continue
+            name = args[0].upper()
+            if name == "QUIT":
+                self._write(Status("OK"))
+                return
+            with store.lock:
+                store.stats["commands"] += 1
+                reply = self._dispatch(name, args[1:])
+            try:
+                self._write(reply)
+                self.wfile.flush()
+            except OSError:
+                return
+
+    def _dispatch(self, name, args):
+        store = self.store
+        if self.queued is not None and name not in ("EXEC", "DISCARD", "MULTI", "WATCH"):
+            self.queued.append((name, args))
+            return Status("QUEUED")
+        if name == "MULTI":
+            if self.queued is not None:
+                return Error("ERR MULTI calls can not be nested")
+            self.queued = []
+            return Status("OK")
+        if name == "WATCH":
+            if self.queued is not None:
+                return Error("ERR WATCH inside MULTI is not allowed")
+            for key in args:
+                self.watched.setdefault(key, store.version(key))
+            return Status("OK")
+        if name == "UNWATCH":
+            self.watched = {}
+            return Status("OK")
+        if name == "DISCARD":
+            if self.queued is None:
+                return Error("ERR DISCARD without MULTI")
+            self.queued = None
+            self.watched = {}
+            return Status("OK")
+        if name == "EXEC":
+            if self.queued is None:
+                return Error("ERR EXEC without MULTI")
+            queued, self.queued = self.queued, None
+            watched, self.watched = self.watched, {}
+            store.stats["transactions"] += 1
+            if any(store.version(key) != version for key, version in watched.items()):
+                store.stats["aborted"] += 1
+                return NullArray()
+            return [self._command(command, command_args) for command, command_args in queued]
+        return self._command(name, args)
+
+    def _command(self, name, args):
+        store = self.store
+        try:
+            if name == "PING":
+                return Status("PONG") if not args else args[0]
+            if name in ("AUTH", "SELECT"):
+                return Status("OK")
+            if name == "GET":
+                return store.get(args[0])
+            if name == "SET":
+                key, value, options = args[0], args[1], [option.upper() for option in args[2:]]
+                ttl_ms = None
+                if "PX" in options:
+                    ttl_ms = int(args[2 + options.index("PX") + 1])
+                elif "EX" in options:
+                    ttl_ms = int(args[2 + options.index("EX") + 1]) * 1000
+                exists = store.get(key) is not None
+                if ("NX" in options and exists) or ("XX" in options and not exists):
+                    return None
+                store.set(key, value, ttl_ms)
+                return Status("OK")
+            if name == "DEL":
+                return sum(store.delete(key) for key in args)
+            if name == "PEXPIRE":
+                value = store.get(args[0])
+                if value is None:
+                    return 0
+                store.set(args[0], value, int(args[1]))
+                return 1
+            if name == "PTTL":
+                if store.get(args[0]) is None:
+                    return -2
+                deadline = store.expires.get(args[0])
+                return -1 if deadline is None else int((deadline - time.monotonic()) * 1000)
+            if name == "MGET":
+                return [store.get(key) for key in args]
+            if name == "KEYS":
+                return store.keys(args[0])
+            if name == "SCAN":
+                # Un seul passage: toutes les clés correspondantes, curseur 0
+                options = [option.upper() for option in args[1:]]
+                pattern = args[1 + options.index("MATCH") + 1] if "MATCH" in options else "*"
+                return ["0", store.keys(pattern)]
+            if name == "FLUSHALL":
+                for key in list(store.data):
+                    store.delete(key)
+                return Status("OK")
+        except (IndexError, ValueError):
+            return Error(f"ERR wrong number of arguments or syntax error for '{name.lower()}' command")
+        return Error(f"ERR unknown command '{name.lower()}'")
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(port, host="127.0.0.1"):
+    """Démarre le serveur dans un thread et retourne (serveur, stockage)"""
+    store = RespStore()
+    handler = type("StandinHandler", (RespHandler,), {"store": store})
+    server = RespServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="resp-standin", daemon=True).start()
+    return server, store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur local compatible Redis pour la coordination des collecteurs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=16379)
+    args = parser.parse_args()
+
+    store = RespStore()
+    handler = type("StandinHandler", (RespHandler,), {"store": store})
+    server = RespServer((args.host, args.port), handler)
+    print(f"Stand-in RESP à l'écoute sur {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
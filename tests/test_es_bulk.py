@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests de la sortie directe Elasticsearch _bulk (vm2_data_collector/es_bulk.py)
+La sortie est exercée contre le stand-in scripts/es_bulk_standin.py: renvoi
+des éléments rejetés (429) et des requêtes refusées (503), connexions
+persistantes, connexion fermée par le serveur, requête refusée en bloc.
+
+Exécution:
+    python -m pytest tests
+    python -m unittest discover tests
+
+Auteur: arthur
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import unittest
+import threading
+from http.server import ThreadingHTTPServer
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO_ROOT, "vm2_data_collector"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts"))
+
+import es_bulk_standin
+from es_bulk import ElasticsearchBulkSink, RequestRefused
+from spool import Spool
+
+
+class ClosingHandler(es_bulk_standin.BulkHandler):
+    """Ferme la connexion après chaque réponse sans l'annoncer (keep-alive coupé côté serveur)"""
+
+    def do_POST(self):
+        super().do_POST()
+        self.close_connection = True
+
+
+class RefusingHandler(es_bulk_standin.BulkHandler):
+    """Refuse toute requête _bulk en 401 tant que store.refuse est vrai (mot de passe expiré)"""
+
+    def do_POST(self):
+        if not self.store.refuse:
+            return super().do_POST()
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.store.count("requests")
+        self._reply(401, {"error": {"type": "security_exception"}, "status": 401})
+
+
+class ErrorRecords(logging.Handler):
+    """Erreurs journalisées pendant un test"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+def documents(count):
+    return [{"@timestamp": f"2025-06-02T14:{index // 60 % 60:02d}:{index % 60:02d}", "metrics": {"valeur": index}}
+            for index in range(count)]
+
+
+class ElasticsearchBulkSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def standin(self, handler_base=es_bulk_standin.BulkHandler, **store_options):
+        """Stand-in _bulk sur un port libre; retourne (stockage, URL)"""
+        store = es_bulk_standin.BulkStore(**store_options)
+        handler = type("StandinHandler", (handler_base,), {"store": store})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return store, f"http://127.0.0.1:{server.server_address[1]}"
+
+    def sink(self, url, **options):
+        options = dict({"batch_size": 50, "flush_interval": 0.05, "pool_size": 2, "backoff_initial": 0.01,
+                        "backoff_max": 0.05, "max_retries": 20, "stats_interval": 3600.0}, **options)
+        return ElasticsearchBulkSink(url, **options).start()
+
+    def test_rejected_items_and_refused_requests_are_retried(self):
+        store, url = self.standin(reject_rate=0.3, fail_rate=0.2, seed=7)
+        sink = self.sink(url)
+        for document in documents(400):
+            self.assertTrue(sink.submit(document))
+        sink.close(timeout=30.0)
+
+        self.assertEqual(sink.stats["indexed"], 400)
+        self.assertEqual(sink.stats["dropped"], 0)
+        self.assertEqual(sink.stats["rejected"], 0)
+        self.assertGreater(sink.stats["retried"], 0)
+        self.assertGreater(store.stats["rejected_items"], 0)
+        self.assertGreater(store.stats["failed_requests"], 0)
+        # Éléments rejetés non enregistrés par le stand-in: chaque document est présent une seule fois
+        self.assertEqual(list(store.indices), ["rcms-dme-2025.06.02"])
+        self.assertEqual(sorted(document["metrics"]["valeur"] for document in store.indices["rcms-dme-2025.06.02"].values()),
+                         list(range(400)))
+        # Connexions persistantes: une par thread d'envoi
+        self.assertLessEqual(sink.stats["connections"], 2)
+        self.assertEqual(store.stats["connections"], sink.stats["connections"])
+
+    def test_connection_closed_by_server_is_replaced(self):
+        store, url = self.standin(handler_base=ClosingHandler)
+        errors = ErrorRecords()
+        logging.getLogger("es_bulk").addHandler(errors)
+        try:
+            sink = self.sink(url, pool_size=1, batch_size=10)
+            for document in documents(100):
+                sink.put(document)
+            sink.close(timeout=30.0)
+        finally:
+            logging.getLogger("es_bulk").removeHandler(errors)
+
+        self.assertEqual(sink.stats["indexed"], 100)
+        self.assertEqual(sink.stats["dropped"], 0)
+        self.assertEqual(sink.stats["retried"], 0)
+        self.assertGreater(sink.stats["requests"], 1)
+        # Chaque requête part sur une connexion neuve, sans erreur remontée ni renvoi de lot
+        self.assertEqual(sink.stats["connections"], sink.stats["requests"])
+        self.assertEqual(errors.records, [])
+        self.assertEqual(store.stats["items"], 100)
+
+    def test_request_refused_as_a_whole(self):
+        store, url = self.standin()
+        # Chemin inexistant: 404 pour la requête entière
+        sink = ElasticsearchBulkSink(url + "/mauvais", backoff_initial=0.01)
+        batch = [sink._encode(document) for document in documents(3)]
+        sink._send(None, batch)
+        self.assertEqual(sink.stats["rejected"], 3)
+        self.assertEqual(sink.stats["retried"], 0)
+
+        strict = ElasticsearchBulkSink(url + "/mauvais", backoff_initial=0.01, raise_on_refusal=True)
+        with self.assertRaisesRegex(RequestRefused, "404"):
+            strict._send(None, batch)
+        self.assertEqual(strict.stats["rejected"], 0)
+        self.assertEqual(store.stats["items"], 0)
+
+    def test_spooled_backlog_survives_a_refused_request(self):
+        store, url = self.standin(handler_base=RefusingHandler)
+        store.refuse = True
+        with tempfile.TemporaryDirectory() as directory:
+            spool = Spool(directory)
+            sink = self.sink(url, spool=spool, backoff_initial=0.01, backoff_max=0.05)
+            try:
+                for document in documents(50):
+                    sink.submit(document)
+                deadline = time.monotonic() + 10
+                while store.stats["requests"] < 5 and time.monotonic() < deadline:
+                    time.sleep(0.02)
+                # Requêtes refusées en 401: rien n'est acquitté ni compté en rejet
+                self.assertGreaterEqual(store.stats["requests"], 5)
+                self.assertGreater(spool.pending_bytes(), 0)
+                self.assertEqual(sink.stats["rejected"], 0)
+                self.assertEqual(store.stats["items"], 0)
+
+                # Identifiants corrigés: l'arriéré est repris depuis le journal
+                store.refuse = False
+                while spool.pending_bytes() and time.monotonic() < deadline + 10:
+                    time.sleep(0.02)
+                self.assertEqual(spool.pending_bytes(), 0)
+            finally:
+                sink.close(timeout=5.0)
+        self.assertEqual(len(store.indices["rcms-dme-2025.06.02"]), 50)
+        self.assertEqual(sink.stats["rejected"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
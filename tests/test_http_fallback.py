@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests du client HTTP de repli (vm2_data_collector/http_fallback.py)
+Le client est exercé contre le stand-in scripts/http_fallback_standin.py:
+décodage au fil de l'eau avec des blocs de quelques octets, authentification,
+et remplacement d'une connexion persistante fermée par le serveur.
+
+Exécution:
+    python -m pytest tests
+    python -m unittest discover tests
+
+Auteur: arthur
+"""
+
+import io
+import os
+import sys
+import json
+import unittest
+import threading
+from http.server import ThreadingHTTPServer
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO_ROOT, "vm2_data_collector"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "scripts"))
+
+import http_fallback_standin
+from http_fallback import HttpFallbackClient, iter_object_items
+
+
+def start_standin(handler_base=http_fallback_standin.FallbackHandler, **state_options):
+    """Stand-in /all sur un port libre; retourne (serveur, état, port)"""
+    state = http_fallback_standin.StandinState("dmeuser", "authpassword", **state_options)
+    handler = type("StandinHandler", (handler_base,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, server.server_address[1]
+
+
+class ClosingHandler(http_fallback_standin.FallbackHandler):
+    """Ferme la connexion après chaque réponse sans l'annoncer (keep-alive coupé côté serveur)"""
+
+    def do_GET(self):
+        super().do_GET()
+        self.close_connection = True
+
+
+class IterObjectItemsTest(unittest.TestCase):
+    DOCUMENT = {
+        "status": "ok",
+        "timestamp": "2025-06-02T14:00:00.123456",
+        "nested": {"list": [1, 2.5, {"a": None}], "texte": "échelle"},
+        "data": {
+            "mtuExecTXPBDelayCurrentValue-0": 49200,
+            "mtuExecTXPBEfficiency-3": 85.25,
+            "mtuExecRadiatedPowerCurrentValue-0": -1.5e3,
+            "mesure-é€": "valeur ünicode",
+            "vide": None,
+            "vrai": True,
+        },
+        "après": [0, 1],
+    }
+
+    def items(self, text, chunk_size):
+        return list(iter_object_items(io.BytesIO(text.encode("utf-8")).read, "data", chunk_size))
+
+    def test_every_chunk_size_gives_the_same_items(self):
+        expected = list(self.DOCUMENT["data"].items())
+        for indent in (None, 2):
+            text = json.dumps(self.DOCUMENT, ensure_ascii=False, indent=indent)
+            for chunk_size in (1, 2, 3, 5, 7, 16, 16384):
+                with self.subTest(indent=indent, chunk_size=chunk_size):
+                    self.assertEqual(self.items(text, chunk_size), expected)
+
+    def test_number_split_across_chunks(self):
+        # "12" puis ".5e3": le nombre ne doit pas être rendu avant la fin de sa lecture
+        self.assertEqual(self.items('{"data": {"x": 12.5e3, "y": 7}}', 10), [("x", 12500.0), ("y", 7)])
+
+    def test_truncated_document(self):
+        with self.assertRaises(ValueError):
+            self.items('{"data": {"x": 1, "y": ', 4)
+
+
+class HttpFallbackClientTest(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def standin(self, **options):
+        server, state, port = start_standin(**options)
+        self.servers.append(server)
+        return state, port
+
+    def test_fetch_decodes_all_metrics_and_reuses_the_connection(self):
+        state, port = self.standin()
+        client = HttpFallbackClient(port, "dmeuser", "authpassword", chunk_size=7)
+        try:
+            for _ in range(3):
+                data = client.fetch("127.0.0.1")
+                self.assertEqual(set(data), {f"{name}-{instance}" for name in http_fallback_standin.BASE_VALUES
+                                             for instance in http_fallback_standin.INSTANCES})
+                self.assertEqual(data["mtuExecTXPADelayCurrentValue-3"], 0)
+            stats = client.pool("127.0.0.1").stats
+        finally:
+            client.close()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["reused"], 2)
+        self.assertEqual(state.stats["connections"], 1)
+
+    def test_wrong_credentials(self):
+        state, port = self.standin()
+        client = HttpFallbackClient(port, "dmeuser", "mauvais")
+        try:
+            with self.assertRaisesRegex(ValueError, "401"):
+                client.fetch("127.0.0.1")
+        finally:
+            client.close()
+        self.assertEqual(state.stats["unauthorized"], 1)
+
+    def test_connection_closed_by_server_is_replaced(self):
+        state, port = self.standin(handler_base=ClosingHandler)
+        client = HttpFallbackClient(port, "dmeuser", "authpassword", chunk_size=5)
+        try:
+            for _ in range(3):
+                self.assertAlmostEqual(client.fetch("127.0.0.1")["mtuExecTXPBDelayCurrentValue-0"], 49200, delta=20)
+            stats = client.pool("127.0.0.1").stats
+        finally:
+            client.close()
+        # Chaque connexion réutilisée était fermée: nouvel essai transparent sur une connexion neuve
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["reused"], 2)
+        self.assertEqual(stats["connections"], 3)
+        self.assertEqual(stats["errors"], 0)
+        self.assertEqual(state.stats["connections"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,20 +4,33 @@
 """
 Vrai agent SNMPv3 DME utilisant pysnmp
 Expose tous les OIDs DME sur le port 161 UDP avec authentification et chiffrement
+Les modules MIB du moteur sont compilés une seule fois et conservés sur disque
+(common/mib_cache.py, répertoire MIB_CACHE_DIR).
 Auteur: arthur
 """
 
 import os
+import sys
 import time
-import random
+import bisect
 import logging
 import threading
-from datetime import datetime
-from pysnmp.entity import engine, config
+from pysnmp.entity import config
 from pysnmp.entity.rfc3413 import cmdrsp, context
 from pysnmp.carrier.asyncore.dgram import udp
 from pysnmp.proto.api import v2c
-from pysnmp import debug
+from pysnmp.smi import instrum
+
+try:
+    from dme_registry import REGISTRY
+    from dme_signal import SignalModel, load_models
+    from mib_cache import snmp_engine
+except ImportError:
+    # Exécution depuis le dépôt: registre partagé dans common/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+    from dme_registry import REGISTRY
+    from dme_signal import SignalModel, load_models
+    from mib_cache import snmp_engine
 
 # Configuration du logging
 logging.basicConfig(
@@ -34,42 +47,88 @@ logger = logging.getLogger("snmp_agent")
 SNMP_USER = os.environ.get('SNMP_USER', 'dmeuser')
 SNMP_AUTH_PASSWORD = os.environ.get('SNMP_AUTH_PASSWORD', 'authpassword')
 SNMP_PRIV_PASSWORD = os.environ.get('SNMP_PRIV_PASSWORD', 'privpassword')
+SNMP_PORT = int(os.environ.get('SNMP_PORT', 161))
+# Modules MIB compilés conservés entre deux démarrages ("" = en mémoire seulement)
+MIB_CACHE_DIR = os.environ.get('MIB_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'dme', 'mibs'))
+
+# Évolution des valeurs: période (s), graine (vide = aléatoire) et modèles de signaux (common/dme_signal.py)
+SIM_UPDATE_INTERVAL = float(os.environ.get('SIM_UPDATE_INTERVAL', 30))
+SIM_SEED = int(os.environ['SIM_SEED']) if os.environ.get('SIM_SEED') else None
+SIM_SIGNAL_MODELS = os.environ.get('SIM_SIGNAL_MODELS', '')
+
+# OIDs DME et leurs valeurs initiales (registre partagé common/dme_registry.py)
+DME_OIDS = {entry.oid: {"name": entry.name, "value": entry.initial} for entry in REGISTRY}
 
-# OIDs DME et leurs valeurs initiales
-DME_OIDS = {
-    "1.3.6.1.4.1.32275.2.1.2.2.5.10": {"name": "mtuExecTXPADelayCurrentValue-0", "value": 0},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.34": {"name": "mtuExecTXPBDelayCurrentValue-0", "value": 49200},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.10": {"name": "mtuExecTXPADelayCurrentValue-3", "value": 0},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.34": {"name": "mtuExecTXPBDelayCurrentValue-3", "value": 49200},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.11": {"name": "mtuExecTXPAPulsePairSpacing-0", "value": 0},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.35": {"name": "mtuExecTXPBPulsePairSpacing-0", "value": 12000},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.11": {"name": "mtuExecTXPAPulsePairSpacing-3", "value": 0},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.35": {"name": "mtuExecTXPBPulsePairSpacing-3", "value": 12000},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.12": {"name": "mtuExecTXPATransmittedPowerCurrentValue-0", "value": 0},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.36": {"name": "mtuExecTXPBTransmittedPowerCurrentValue-0", "value": 1080},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.12": {"name": "mtuExecTXPATransmittedPowerCurrentValue-3", "value": 0},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.36": {"name": "mtuExecTXPBTransmittedPowerCurrentValue-3", "value": 1125},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.13": {"name": "mtuExecTXPAEfficiency-0", "value": 0},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.37": {"name": "mtuExecTXPBEfficiency-0", "value": 90},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.13": {"name": "mtuExecTXPAEfficiency-3", "value": 0},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.37": {"name": "mtuExecTXPBEfficiency-3", "value": 91},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.14": {"name": "mtuExecTXPATxFreqError-0", "value": 0},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.38": {"name": "mtuExecTXPBTxFreqError-0", "value": 2},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.14": {"name": "mtuExecTXPATxFreqError-3", "value": 0},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.38": {"name": "mtuExecTXPBTxFreqError-3", "value": 2},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.15": {"name": "mtuExecRadiatedPowerCurrentValue-0", "value": 980},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.15": {"name": "mtuExecRadiatedPowerCurrentValue-3", "value": 970},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.16": {"name": "mtuExecTransmissionRate-0", "value": 840},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.16": {"name": "mtuExecTransmissionRate-3", "value": 840},
-    "1.3.6.1.4.1.32275.2.1.2.2.5.17": {"name": "mtuExecIdentStatus-0", "value": 1},
-    "1.3.6.1.4.1.32275.2.1.2.2.8.17": {"name": "mtuExecIdentStatus-3", "value": 1},
-}
+def build_oid_index(oids):
+    """Trie les OIDs une fois: (liste des tuples d'OID, liste des clés correspondantes)"""
+    ordered = sorted((REGISTRY.by_oid[oid_str].arcs, oid_str) for oid_str in oids)
+    return [oid_tuple for oid_tuple, _ in ordered], [oid_str for _, oid_str in ordered]
+
+class DMEMibInstrumController(instrum.AbstractMibInstrumController):
+    """
+    Instrumentation MIB des OIDs DME.
+
+    Les OIDs sont triés une fois pour toutes: GET est une recherche exacte et
+    GETNEXT/GETBULK une recherche du successeur, toutes deux par dichotomie.
+    """
+    
+    def __init__(self, oids, lock, index=None):
+        self.oids = oids
+        self.lock = lock
+        # Index trié: tuples d'OID et clés du dictionnaire DME_OIDS correspondantes
+        self.oid_index, self.oid_keys = index or build_oid_index(oids)
+    
+    def _value(self, position):
+        return v2c.Integer32(self.oids[self.oid_keys[position]]["value"])
+    
+    def _not_in_view(self, name, value, idx, acInfo):
+        """Contrôle d'accès VACM (retourne True si l'OID est hors de la vue)"""
+        acFun, acCtx = acInfo
+        return bool(acFun and acFun(name, value, idx, 'read', acCtx))
+    
+    def readVars(self, varBinds, acInfo=(None, None)):
+        """GET: recherche exacte de chaque OID dans l'index trié"""
+        result = []
+        with self.lock:
+            for idx, (name, _) in enumerate(varBinds):
+                oid = tuple(name)
+                position = bisect.bisect_left(self.oid_index, oid)
+                if position < len(self.oid_index) and self.oid_index[position] == oid:
+                    value = self._value(position)
+                    if not self._not_in_view(name, value, idx, acInfo):
+                        result.append((name, value))
+                        continue
+                    result.append((name, v2c.NoSuchObject()))
+                elif position < len(self.oid_index) and self.oid_index[position][:len(oid)] == oid:
+                    # Préfixe d'un OID existant: objet connu sans instance
+                    result.append((name, v2c.NoSuchInstance()))
+                else:
+                    result.append((name, v2c.NoSuchObject()))
+        return result
+    
+    def readNextVars(self, varBinds, acInfo=(None, None)):
+        """GETNEXT/GETBULK: premier OID strictement supérieur dans l'index trié"""
+        result = []
+        with self.lock:
+            for idx, (name, _) in enumerate(varBinds):
+                position = bisect.bisect_right(self.oid_index, tuple(name))
+                while position < len(self.oid_index):
+                    next_name = v2c.ObjectIdentifier(self.oid_index[position])
+                    value = self._value(position)
+                    if not self._not_in_view(next_name, value, idx, acInfo):
+                        result.append((next_name, value))
+                        break
+                    position += 1
+                else:
+                    result.append((name, v2c.EndOfMibView()))
+        return result
 
 class DMESNMPAgent:
     def __init__(self):
-        self.snmp_engine = engine.SnmpEngine()
+        self.snmp_engine = snmp_engine(MIB_CACHE_DIR)
         self.mib_builder = self.snmp_engine.getMibBuilder()
         self.lock = threading.Lock()
+        self.signal = SignalModel(1, load_models(SIM_SIGNAL_MODELS), SIM_SEED, order=DME_OIDS)
         
     def setup_snmpv3(self):
         """Configure SNMPv3 avec authentification et chiffrement"""
@@ -79,7 +138,7 @@ class DMESNMPAgent:
         config.addTransport(
             self.snmp_engine,
             udp.domainName + (1,),
-            udp.UdpTransport().openServerMode(('0.0.0.0', 161))
+            udp.UdpTransport().openServerMode(('0.0.0.0', SNMP_PORT))
         )
         
         # Utilisateur SNMPv3
@@ -98,25 +157,20 @@ class DMESNMPAgent:
         logger.info(f"SNMPv3 configuré pour l'utilisateur: {SNMP_USER}")
         
     def setup_mib(self):
-        """Configure la MIB avec tous les OIDs DME"""
+        """Expose les OIDs DME via une instrumentation MIB indexée et les répondeurs GET/GETNEXT/GETBULK"""
         logger.info("Configuration de la MIB DME...")
         
-        # Contexte SNMP
+        # Contexte SNMP par défaut servi par l'instrumentation DME
         snmp_context = context.SnmpContext(self.snmp_engine)
+        self.mib_controller = DMEMibInstrumController(DME_OIDS, self.lock)
+        snmp_context.unregisterContextName(v2c.OctetString(''))
+        snmp_context.registerContextName(v2c.OctetString(''), self.mib_controller)
+        
+        # Répondeurs de commandes
+        cmdrsp.GetCommandResponder(self.snmp_engine, snmp_context)
+        cmdrsp.NextCommandResponder(self.snmp_engine, snmp_context)
+        cmdrsp.BulkCommandResponder(self.snmp_engine, snmp_context)
         
-        # Ajouter tous les OIDs DME
-        for oid_str, oid_data in DME_OIDS.items():
-            oid_tuple = tuple(map(int, oid_str.split('.')))
-            
-            # Créer l'objet MIB
-            mib_node = self.mib_builder.importSymbols('SNMPv2-SMI', 'MibScalar', 'MibScalarInstance')[1]
-            
-            # Ajouter l'OID au contexte
-            snmp_context.registerContextName(
-                v2c.OctetString(''),  # contexte par défaut
-                self.mib_builder.importSymbols('SNMPv2-MIB')[0]
-            )
-            
         logger.info(f"MIB configurée avec {len(DME_OIDS)} OIDs")
         
     def get_oid_value(self, oid_str):
@@ -126,37 +180,12 @@ class DMESNMPAgent:
                 return DME_OIDS[oid_str]["value"]
             return None
             
-    def update_values(self):
-        """Met à jour les valeurs des OIDs avec de légères variations"""
+    def update_values(self, dt=None):
+        """Avance le modèle de signaux de dt secondes et publie les nouvelles valeurs"""
+        values = self.signal.advance(dt)[0].tolist()
         with self.lock:
-            # Variation des délais
-            DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.5.34"]["value"] += random.randint(-50, 50)
-            DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.8.34"]["value"] += random.randint(-50, 50)
-            
-            # Variation de la puissance
-            DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.5.36"]["value"] += random.randint(-5, 5)
-            DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.8.36"]["value"] += random.randint(-5, 5)
-            
-            # Variation de l'efficacité
-            DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.5.37"]["value"] += random.randint(-2, 2)
-            DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.8.37"]["value"] += random.randint(-2, 2)
-            
-            # Normaliser les valeurs
-            self._normalize_values()
-            
-    def _normalize_values(self):
-        """Maintient les valeurs dans des plages raisonnables"""
-        # Délais
-        DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.5.34"]["value"] = max(49000, min(49400, DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.5.34"]["value"]))
-        DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.8.34"]["value"] = max(49000, min(49400, DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.8.34"]["value"]))
-        
-        # Puissance
-        DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.5.36"]["value"] = max(1050, min(1100, DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.5.36"]["value"]))
-        DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.8.36"]["value"] = max(1100, min(1150, DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.8.36"]["value"]))
-        
-        # Efficacité
-        DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.5.37"]["value"] = max(85, min(95, DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.5.37"]["value"]))
-        DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.8.37"]["value"] = max(85, min(95, DME_OIDS["1.3.6.1.4.1.32275.2.1.2.2.8.37"]["value"]))
+            for oid_str, value in zip(self.signal.order, values):
+                DME_OIDS[oid_str]["value"] = value
     
     def start_agent(self):
         """Démarre l'agent SNMP"""
@@ -169,15 +198,15 @@ class DMESNMPAgent:
         # Thread de mise à jour des valeurs
         def update_thread():
             while True:
-                time.sleep(30)  # Mise à jour toutes les 30 secondes
-                self.update_values()
+                time.sleep(SIM_UPDATE_INTERVAL)
+                self.update_values(SIM_UPDATE_INTERVAL)
                 logger.debug("Valeurs DME mises à jour")
         
         update_thread_obj = threading.Thread(target=update_thread, daemon=True)
         update_thread_obj.start()
         
         # Démarrer l'agent
-        logger.info("Agent SNMPv3 démarré sur le port 161")
+        logger.info(f"Agent SNMPv3 démarré sur le port {SNMP_PORT}")
         logger.info("Prêt à recevoir des requêtes SNMPv3...")
         
         # Boucle principale
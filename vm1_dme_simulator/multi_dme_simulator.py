@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Simulateur SNMPv3 multi-équipements
+Un seul processus émule N stations DME virtuelles, chacune avec son propre état
+(dérivé du gabarit DME_OIDS) qui évolue indépendamment. L'état de toute la
+flotte tient dans quelques matrices (stations x OIDs) avancées en un seul pas
+NumPy par le modèle de signaux (common/dme_signal.py): 5 000 stations de 26 OIDs
+occupent environ 1,5 Mo et évoluent à des cadences inférieures à la seconde.
+
+Deux modes de sélection de la station:
+  context : un seul moteur SNMP, chaque station est un contexte SNMPv3
+            (dme-00000, dme-00001, ...). Mode adapté à des milliers de stations;
+            les stations partagent l'engine ID du moteur.
+  port    : un moteur SNMP par station, avec son propre engine ID, sur une plage
+            de ports UDP servie par un dispatcher commun. Chaque moteur charge
+            ses propres MIB système: mode destiné à quelques centaines de stations.
+
+Démarrage: les modules MIB sont compilés une seule fois pour tous les moteurs
+et conservés sur disque (common/mib_cache.py, MIB_CACHE_DIR); les clés USM sont
+dérivées des mots de passe une seule fois, puis localisées par moteur.
+
+Dépendances: pysnmp 4.4 et numpy (hors image Docker de l'agent simplifié).
+
+Exemple:
+    SIM_DEVICES=1000 SIM_MODE=context python multi_dme_simulator.py --inventory /tmp/fleet.json
+    python multi_dme_simulator.py --devices 5000 --interval 0.5 --seed 42 --models signal_models.json
+
+Auteur: arthur
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+
+from pysnmp.entity import config
+from pysnmp.entity.rfc3413 import cmdrsp, context
+from pysnmp.carrier.asyncore.dgram import udp
+from pysnmp.carrier.asyncore.dispatch import AsyncoreDispatcher
+from pysnmp.proto.api import v2c
+
+from dme_simulator_snmpv3 import (
+    DME_OIDS, SNMP_USER, SNMP_AUTH_PASSWORD, SNMP_PRIV_PASSWORD, MIB_CACHE_DIR,
+    DMEMibInstrumController, build_oid_index,
+)
+from dme_signal import SignalModel, load_models
+import mib_cache
+
+logger = logging.getLogger("multi_dme_simulator")
+
+# Configuration de la flotte virtuelle
+SIM_DEVICES = int(os.environ.get('SIM_DEVICES', 100))
+SIM_MODE = os.environ.get('SIM_MODE', 'context')
+SIM_PORT = int(os.environ.get('SIM_PORT', 161))
+SIM_SEED = int(os.environ.get('SIM_SEED', 0))
+SIM_UPDATE_INTERVAL = float(os.environ.get('SIM_UPDATE_INTERVAL', 30))
+# Durée de référence d'un pas de marche aléatoire (pas plus courts: amplitude en racine du temps)
+SIM_REFERENCE_INTERVAL = float(os.environ.get('SIM_REFERENCE_INTERVAL', 30))
+# Modèles de signaux par métrique (JSON, voir common/dme_signal.py); vide = marches du registre
+SIM_SIGNAL_MODELS = os.environ.get('SIM_SIGNAL_MODELS', '')
+
+# Numéro d'entreprise IANA des OIDs DME (1.3.6.1.4.1.32275)
+ENTERPRISE_ID = 32275
+CONTEXT_PREFIX = "dme-"
+DME_SUBTREE = (1, 3, 6, 1, 4, 1, ENTERPRISE_ID)
+VACM_GROUP = "dme-fleet"
+VACM_VIEW = "dme-view"
+
+# Clés maîtresses USM (hachage de 1 Mo par mot de passe), calculées une fois pour tous les moteurs
+_master_keys = None
+
+
+def context_name(index):
+    """Nom de contexte SNMPv3 d'une station virtuelle"""
+    return f"{CONTEXT_PREFIX}{index:05d}"
+
+
+def virtual_engine_id(index):
+    """Engine ID RFC 3411 (format texte) dérivé du numéro de station"""
+    return (
+        (0x80000000 | ENTERPRISE_ID).to_bytes(4, 'big')
+        + b'\x04'
+        + f"DME{index:05d}".encode()
+    )
+
+
+class VirtualDMEState:
+    """État compact de la flotte: une ligne int32 par station, une colonne par OID (ordre trié)"""
+
+    def __init__(self, count, seed=0, models=None):
+        self.lock = threading.Lock()
+        self.oid_index, self.oid_keys = build_oid_index(DME_OIDS)
+        # Modèle de signaux vectorisé et reproductible (common/dme_signal.py), colonnes dans l'ordre trié
+        self.model = SignalModel(count, models, seed, reference_interval=SIM_REFERENCE_INTERVAL, order=self.oid_keys)
+        # Point de départ différent pour chaque station
+        self.update()
+
+    def __len__(self):
+        return len(self.model)
+
+    @property
+    def values(self):
+        return self.model.values
+
+    def update(self, dt=None):
+        """Fait évoluer toutes les stations en une seule opération vectorisée"""
+        # La matrice de valeurs est remplacée d'un bloc: les lectures en cours restent cohérentes
+        with self.lock:
+            self.model.advance(dt)
+
+    def nbytes(self):
+        return self.model.nbytes()
+
+
+class VirtualDMEController(DMEMibInstrumController):
+    """Instrumentation MIB d'une station virtuelle: lit sa ligne de la matrice d'état"""
+
+    def __init__(self, state, row):
+        self.state = state
+        self.row = row
+        # Index trié partagé par toutes les stations
+        super().__init__(None, state.lock, index=(state.oid_index, state.oid_keys))
+
+    def _value(self, position):
+        return v2c.Integer32(int(self.state.values[self.row, position]))
+
+
+def _user_keys():
+    global _master_keys
+    if _master_keys is None:
+        _master_keys = (
+            config.authServices[config.usmHMACSHAAuthProtocol].hashPassphrase(SNMP_AUTH_PASSWORD),
+            config.privServices[config.usmAesCfb128Protocol].hashPassphrase(config.usmHMACSHAAuthProtocol, SNMP_PRIV_PASSWORD),
+        )
+    return _master_keys
+
+
+def _configure_security(snmp_engine, context_names=()):
+    """Utilisateur USM et droits VACM en lecture sur la branche DME"""
+    auth_key, priv_key = _user_keys()
+    config.addV3User(
+        snmp_engine,
+        SNMP_USER,
+        config.usmHMACSHAAuthProtocol, auth_key,
+        config.usmAesCfb128Protocol, priv_key,
+        authKeyType=config.usmKeyTypeMaster,
+        privKeyType=config.usmKeyTypeMaster
+    )
+    config.addVacmGroup(snmp_engine, VACM_GROUP, 3, SNMP_USER)
+    config.addVacmView(snmp_engine, VACM_VIEW, 'included', DME_SUBTREE, '')
+    # Contexte par défaut: correspondance exacte
+    config.addContext(snmp_engine, '')
+    config.addVacmAccess(snmp_engine, VACM_GROUP, '', 3, 'authPriv', 'exact', VACM_VIEW, '', '')
+    if context_names:
+        # Contextes des stations virtuelles: une seule règle d'accès par préfixe
+        for name in context_names:
+            config.addContext(snmp_engine, name)
+        config.addVacmAccess(snmp_engine, VACM_GROUP, CONTEXT_PREFIX, 3, 'authPriv', 'prefix', VACM_VIEW, '', '')
+
+
+def _register_responders(snmp_engine, snmp_context):
+    cmdrsp.GetCommandResponder(snmp_engine, snmp_context)
+    cmdrsp.NextCommandResponder(snmp_engine, snmp_context)
+    cmdrsp.BulkCommandResponder(snmp_engine, snmp_context)
+
+
+class MultiDMESimulator:
+    """Agent SNMPv3 hébergeant N stations DME virtuelles"""
+
+    def __init__(self, count, mode=SIM_MODE, port=SIM_PORT, seed=SIM_SEED, models=None, interval=SIM_UPDATE_INTERVAL):
+        if mode not in ("context", "port"):
+            raise ValueError(f"Mode de simulation inconnu: {mode}")
+        self.count = count
+        self.mode = mode
+        self.port = port
+        self.interval = interval
+        self.state = VirtualDMEState(count, seed, models)
+        self.dispatcher = AsyncoreDispatcher()
+        self.engines = []
+
+    def setup_context_mode(self):
+        """Un moteur, un contexte SNMPv3 par station (le contexte par défaut sert la station 0)"""
+        snmp_engine = mib_cache.snmp_engine(MIB_CACHE_DIR, snmpEngineID=v2c.OctetString(virtual_engine_id(0)))
+        snmp_engine.registerTransportDispatcher(self.dispatcher)
+        config.addTransport(snmp_engine, udp.domainName + (1,), udp.UdpTransport().openServerMode(('0.0.0.0', self.port)))
+
+        names = [context_name(index) for index in range(self.count)]
+        _configure_security(snmp_engine, names)
+
+        snmp_context = context.SnmpContext(snmp_engine)
+        snmp_context.unregisterContextName(v2c.OctetString(''))
+        snmp_context.registerContextName(v2c.OctetString(''), VirtualDMEController(self.state, 0))
+        for index, name in enumerate(names):
+            snmp_context.registerContextName(v2c.OctetString(name), VirtualDMEController(self.state, index))
+        _register_responders(snmp_engine, snmp_context)
+        self.engines.append(snmp_engine)
+        logger.info(f"{self.count} stations virtuelles exposées en contextes {context_name(0)}..{context_name(self.count - 1)} sur le port {self.port}")
+
+    def setup_port_mode(self):
+        """Un moteur par station (engine ID propre), ports port..port+N-1, dispatcher UDP partagé"""
+        # Les messages reçus sont routés vers le moteur propriétaire du transport
+        self.dispatcher.registerRoutingCbFun(lambda transport_domain, transport_address, message: transport_domain)
+        for index in range(self.count):
+            domain = udp.domainName + (index + 1,)
+            snmp_engine = mib_cache.snmp_engine(MIB_CACHE_DIR, snmpEngineID=v2c.OctetString(virtual_engine_id(index)))
+            snmp_engine.registerTransportDispatcher(self.dispatcher, domain)
+            config.addTransport(snmp_engine, domain, udp.UdpTransport().openServerMode(('0.0.0.0', self.port + index)))
+            _configure_security(snmp_engine)
+
+            snmp_context = context.SnmpContext(snmp_engine)
+            snmp_context.unregisterContextName(v2c.OctetString(''))
+            snmp_context.registerContextName(v2c.OctetString(''), VirtualDMEController(self.state, index))
+            _register_responders(snmp_engine, snmp_context)
+            self.engines.append(snmp_engine)
+        logger.info(f"{self.count} stations virtuelles exposées sur les ports {self.port}..{self.port + self.count - 1}")
+
+    def inventory(self, host):
+        """Inventaire JSON compatible avec le collecteur en mode flotte"""
+        devices = []
+        for index in range(self.count):
+            if self.mode == "context":
+                devices.append({"name": context_name(index), "host": host, "port": self.port, "context": context_name(index)})
+            else:
+                devices.append({"name": context_name(index), "host": host, "port": self.port + index})
+        return {
+            "defaults": {
+                "user": SNMP_USER,
+                "auth_protocol": "SHA",
+                "auth_password": SNMP_AUTH_PASSWORD,
+                "priv_protocol": "AES",
+                "priv_password": SNMP_PRIV_PASSWORD,
+            },
+            "devices": devices,
+        }
+
+    def start(self):
+        """Configure les moteurs, lance l'évolution des états et sert les requêtes"""
+        started = time.monotonic()
+        if self.mode == "context":
+            self.setup_context_mode()
+        else:
+            self.setup_port_mode()
+        logger.info(f"Simulateur prêt en {time.monotonic() - started:.1f}s (état: {self.state.nbytes() / 1024:.0f} Ko)")
+
+        def update_thread():
+            # Pas à cadence fixe, avancés du temps réellement écoulé (intervalles inférieurs à la seconde possibles)
+            last = time.monotonic()
+            deadline = last
+            while True:
+                deadline += self.interval
+                time.sleep(max(0.0, deadline - time.monotonic()))
+                now = time.monotonic()
+                self.state.update(now - last)
+                last = now
+                logger.debug("Valeurs des stations virtuelles mises à jour")
+
+        threading.Thread(target=update_thread, daemon=True).start()
+
+        self.dispatcher.jobStarted(1)
+        try:
+            self.dispatcher.runDispatcher()
+        finally:
+            self.dispatcher.closeDispatcher()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulateur SNMPv3 de N stations DME")
+    parser.add_argument("--devices", type=int, default=SIM_DEVICES, help="Nombre de stations virtuelles")
+    parser.add_argument("--mode", choices=("context", "port"), default=SIM_MODE, help="Sélection par contexte SNMPv3 ou par port")
+    parser.add_argument("--port", type=int, default=SIM_PORT, help="Port UDP (premier port en mode port)")
+    parser.add_argument("--seed", type=int, default=SIM_SEED, help="Graine du générateur")
+    parser.add_argument("--interval", type=float, default=SIM_UPDATE_INTERVAL, help="Période d'évolution des valeurs (s)")
+    parser.add_argument("--models", default=SIM_SIGNAL_MODELS, help="Modèles de signaux par métrique (JSON)")
+    parser.add_argument("--inventory", help="Écrit l'inventaire du collecteur dans ce fichier")
+    parser.add_argument("--inventory-host", default="127.0.0.1", help="Adresse du simulateur vue par le collecteur")
+    args = parser.parse_args()
+
+    try:
+        simulator = MultiDMESimulator(args.devices, args.mode, args.port, args.seed, load_models(args.models), args.interval)
+        if args.inventory:
+            with open(args.inventory, 'w') as f:
+                json.dump(simulator.inventory(args.inventory_host), f, indent=2)
+            logger.info(f"Inventaire écrit: {args.inventory}")
+        simulator.start()
+    except KeyboardInterrupt:
+        logger.info("Arrêt du simulateur multi-équipements")
+    except Exception as e:
+        logger.critical(f"Erreur critique: {str(e)}")
+        sys.exit(1)
@@ -8,13 +8,22 @@ Auteur: arthur
 """
 
 import os
+import sys
 import time
-import random
 import logging
 import threading
 import socket
 from datetime import datetime
 
+try:
+    from dme_registry import REGISTRY
+    from dme_signal import SignalModel, load_models
+except ImportError:
+    # Exécution depuis le dépôt: registre partagé dans common/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+    from dme_registry import REGISTRY
+    from dme_signal import SignalModel, load_models
+
 # Configuration du logging
 logging.basicConfig(
     level=logging.INFO,
@@ -31,66 +40,28 @@ SNMP_USER = os.environ.get('SNMP_USER', 'dmeuser')
 SNMP_AUTH_PASSWORD = os.environ.get('SNMP_AUTH_PASSWORD', 'authpassword')
 SNMP_PRIV_PASSWORD = os.environ.get('SNMP_PRIV_PASSWORD', 'privpassword')
 
+# Évolution des valeurs: période (s), graine (vide = aléatoire) et modèles de signaux (common/dme_signal.py)
+SIM_UPDATE_INTERVAL = float(os.environ.get('SIM_UPDATE_INTERVAL', 30))
+SIM_SEED = int(os.environ['SIM_SEED']) if os.environ.get('SIM_SEED') else None
+SIM_SIGNAL_MODELS = os.environ.get('SIM_SIGNAL_MODELS', '')
+
 # Données DME simulées
 class DMEDataStore:
     def __init__(self):
-        self.data = {
-            "1.3.6.1.4.1.32275.2.1.2.2.5.10": 0,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.34": 49200,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.10": 0,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.34": 49200,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.11": 0,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.35": 12000,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.11": 0,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.35": 12000,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.12": 0,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.36": 1080,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.12": 0,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.36": 1125,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.13": 0,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.37": 90,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.13": 0,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.37": 91,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.14": 0,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.38": 2,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.14": 0,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.38": 2,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.15": 980,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.15": 970,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.16": 840,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.16": 840,
-            "1.3.6.1.4.1.32275.2.1.2.2.5.17": 1,
-            "1.3.6.1.4.1.32275.2.1.2.2.8.17": 1,
-        }
+        self.data = {entry.oid: entry.initial for entry in REGISTRY}
         self.lock = threading.Lock()
+        # Modèle de signaux vectorisé (common/dme_signal.py), une seule station
+        self.signal = SignalModel(1, load_models(SIM_SIGNAL_MODELS), SIM_SEED)
     
     def get_value(self, oid):
         with self.lock:
             return self.data.get(oid, 0)
     
-    def update_values(self):
+    def update_values(self, dt=None):
+        self.signal.advance(dt)
+        values = self.signal.device_values(0)
         with self.lock:
-            # Variation des délais
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.5.34"] += random.randint(-50, 50)
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.8.34"] += random.randint(-50, 50)
-            
-            # Variation de la puissance
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.5.36"] += random.randint(-5, 5)
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.8.36"] += random.randint(-5, 5)
-            
-            # Variation de l'efficacité
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.5.37"] += random.randint(-2, 2)
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.8.37"] += random.randint(-2, 2)
-            
-            # Normaliser
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.5.34"] = max(49000, min(49400, self.data["1.3.6.1.4.1.32275.2.1.2.2.5.34"]))
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.8.34"] = max(49000, min(49400, self.data["1.3.6.1.4.1.32275.2.1.2.2.8.34"]))
-            
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.5.36"] = max(1050, min(1100, self.data["1.3.6.1.4.1.32275.2.1.2.2.5.36"]))
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.8.36"] = max(1100, min(1150, self.data["1.3.6.1.4.1.32275.2.1.2.2.8.36"]))
-            
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.5.37"] = max(85, min(95, self.data["1.3.6.1.4.1.32275.2.1.2.2.5.37"]))
-            self.data["1.3.6.1.4.1.32275.2.1.2.2.8.37"] = max(85, min(95, self.data["1.3.6.1.4.1.32275.2.1.2.2.8.37"]))
+            self.data = values
 
 # Instance globale des données
 dme_store = DMEDataStore()
@@ -110,9 +81,9 @@ class WorkingSNMPAgent:
         # Thread de mise à jour des valeurs
         def update_thread():
             while self.running:
-                time.sleep(30)  # Mise à jour toutes les 30 secondes
-                dme_store.update_values()
-                logger.info("Valeurs DME mises à jour")
+                time.sleep(SIM_UPDATE_INTERVAL)
+                dme_store.update_values(SIM_UPDATE_INTERVAL)
+                logger.debug("Valeurs DME mises à jour")
         
         update_thread_obj = threading.Thread(target=update_thread, daemon=True)
         update_thread_obj.start()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Détection d'anomalies en continu dans le collecteur
+Chaque échantillon est évalué dès sa collecte contre des règles déclarées par
+nom de métrique (motifs fnmatch):
+
+  range  : valeur hors de [min, max]
+  rate   : variation absolue sur lag échantillons supérieure à max_delta
+  zscore : écart à la moyenne mobile exponentielle (EWMA) supérieur à
+           threshold écarts-types, après warmup échantillons
+
+L'état de tous les équipements est tenu dans des tableaux NumPy préalloués:
+un tampon circulaire (équipements x fenêtre x métriques) pour les variations,
+la moyenne et la variance EWMA (équipements x métriques) et l'état des alertes
+actives. L'évaluation d'un lot d'échantillons est vectorisée sur toutes les
+métriques et tous les équipements du lot; seules les transitions (déclenchement,
+retour à la normale) produisent un événement "dme_alert".
+
+Format du fichier de règles (ALERT_RULES):
+{
+    "rules": [
+        {"name": "delai-txpb", "metrics": "mtuExecTXPBDelayCurrentValue-*", "type": "range",
+         "min": 49000, "max": 49400, "severity": "critical"},
+        {"name": "saut-delai", "metrics": "mtuExecTXPBDelayCurrentValue-*", "type": "rate", "max_delta": 150},
+        {"name": "derive-puissance", "metrics": "mtuExecTXPB*", "type": "zscore",
+         "alpha": 0.05, "threshold": 4, "warmup": 30}
+    ]
+}
+Pour un type donné, la première règle dont le motif correspond s'applique.
+
+Auteur: arthur
+"""
+
+import json
+import fnmatch
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger("alerts")
+
+KIND_RANGE = "range"
+KIND_RATE = "rate"
+KIND_ZSCORE = "zscore"
+KINDS = (KIND_RANGE, KIND_RATE, KIND_ZSCORE)
+
+# Paramètres obligatoires et valeurs par défaut de chaque type de règle
+RULE_DEFAULTS = {
+    KIND_RANGE: {"min": -np.inf, "max": np.inf},
+    KIND_RATE: {"lag": 1},
+    KIND_ZSCORE: {"alpha": 0.05, "threshold": 4.0, "warmup": 30, "min_std": 0.0},
+}
+RULE_REQUIRED = {
+    KIND_RANGE: (),
+    KIND_RATE: ("max_delta",),
+    KIND_ZSCORE: (),
+}
+
+# Moteurs partagés, un par fichier de règles (tous les équipements d'un processus)
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def load_rules(path):
+    """Charge et valide le fichier JSON de règles"""
+    with open(path, 'r') as f:
+        rules = json.load(f).get("rules", [])
+    for index, rule in enumerate(rules):
+        kind = rule.get("type")
+        if kind not in KINDS:
+            raise ValueError(f"Type de règle inconnu (règle {index}): {kind}")
+        if "metrics" not in rule:
+            raise ValueError(f"Règle {index} sans motif 'metrics'")
+        for key in RULE_REQUIRED[kind]:
+            if key not in rule:
+                raise ValueError(f"Paramètre '{key}' manquant dans la règle {rule.get('name', index)}")
+        rule.setdefault("name", f"{kind}-{index}")
+        rule.setdefault("severity", "warning")
+        for key, value in RULE_DEFAULTS[kind].items():
+            rule.setdefault(key, value)
+    return rules
+
+
+def _json_number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 4)
+
+
+class AlertEngine:
+    """Évaluation vectorisée des règles pour un ensemble d'équipements"""
+
+    def __init__(self, columns, rules, capacity=16):
+        self.columns = list(columns)
+        self.rules = rules
+        count = len(self.columns)
+
+        # Règle appliquée à chaque métrique, par type (-1: aucune)
+        self.rule_index = {kind: np.full(count, -1, dtype=np.intp) for kind in KINDS}
+        self.range_low = np.full(count, -np.inf)
+        self.range_high = np.full(count, np.inf)
+        self.rate_max = np.full(count, np.inf)
+        self.rate_lag = np.ones(count, dtype=np.intp)
+        self.z_alpha = np.zeros(count)
+        self.z_threshold = np.full(count, np.inf)
+        self.z_warmup = np.zeros(count, dtype=np.int64)
+        self.z_min_std = np.zeros(count)
+
+        for position, column in enumerate(self.columns):
+            for kind in KINDS:
+                rule_id = next(
+                    (i for i, rule in enumerate(rules) if rule["type"] == kind and fnmatch.fnmatchcase(column, rule["metrics"])),
+                    -1
+                )
+                if rule_id < 0:
+                    continue
+                rule = rules[rule_id]
+                self.rule_index[kind][position] = rule_id
+                if kind == KIND_RANGE:
+                    self.range_low[position] = rule["min"]
+                    self.range_high[position] = rule["max"]
+                elif kind == KIND_RATE:
+                    self.rate_max[position] = rule["max_delta"]
+                    self.rate_lag[position] = max(1, int(rule["lag"]))
+                else:
+                    self.z_alpha[position] = rule["alpha"]
+                    self.z_threshold[position] = rule["threshold"]
+                    self.z_warmup[position] = rule["warmup"]
+                    self.z_min_std[position] = rule["min_std"]
+
+        # Fenêtre du tampon circulaire: plus grand décalage des règles de variation
+        self.window = int(self.rate_lag.max()) + 1 if count else 2
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.stats = {"samples": 0, "fired": 0, "resolved": 0}
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """(Ré)alloue les tableaux d'état pour capacity équipements, en conservant l'existant"""
+        count = len(self.columns)
+        ring = np.full((capacity, self.window, count), np.nan)
+        head = np.zeros(capacity, dtype=np.intp)
+        samples = np.zeros(capacity, dtype=np.int64)
+        mean = np.full((capacity, count), np.nan)
+        var = np.zeros((capacity, count))
+        active = np.zeros((capacity, len(KINDS), count), dtype=bool)
+        if self.devices:
+            used = len(self.devices)
+            ring[:used] = self.ring[:used]
+            head[:used] = self.head[:used]
+            samples[:used] = self.samples[:used]
+            mean[:used] = self.mean[:used]
+            var[:used] = self.var[:used]
+            active[:used] = self.active[:used]
+        self.ring, self.head, self.samples = ring, head, samples
+        self.mean, self.var, self.active = mean, var, active
+        self.capacity = capacity
+
+    def _row(self, device):
+        row = self.devices.get(device)
+        if row is None:
+            row = len(self.devices)
+            if row >= self.capacity:
+                self._allocate(self.capacity * 2)
+            self.devices[device] = row
+        return row
+
+    def evaluate(self, device, data, timestamp=None):
+        """Évalue un échantillon (dictionnaire nom -> valeur) et retourne les événements d'alerte"""
+        return self.evaluate_many([(device, data)], timestamp)
+
+    def evaluate_many(self, samples, timestamp=None):
+        """
+        Évalue un lot d'échantillons [(équipement, données)], au plus un par équipement.
+        timestamp: instant commun du lot ou liste d'instants, un par échantillon.
+
+        Retourne la liste des événements (déclenchements et retours à la normale).
+        """
+        if not samples:
+            return []
+        if isinstance(timestamp, (list, tuple)):
+            timestamps = timestamp
+        else:
+            timestamps = [timestamp or datetime.now()] * len(samples)
+        values = np.array(
+            [[np.nan if data.get(column) is None else float(data[column]) for column in self.columns] for _, data in samples]
+        )
+        valid = ~np.isnan(values)
+
+        with self.lock:
+            rows = np.array([self._row(device) for device, _ in samples], dtype=np.intp)
+            positions = np.arange(len(self.columns))
+
+            # Plage
+            range_hit = (values < self.range_low) | (values > self.range_high)
+
+            # Variation sur lag échantillons (valeur lue dans le tampon circulaire)
+            slots = (self.head[rows][:, None] - self.rate_lag[None, :]) % self.window
+            previous = self.ring[rows[:, None], slots, positions[None, :]]
+            delta = np.abs(values - previous)
+            with np.errstate(invalid='ignore'):
+                rate_hit = delta > self.rate_max
+
+            # Écart à la moyenne EWMA
+            mean = self.mean[rows]
+            std = np.sqrt(self.var[rows])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                zscore = np.where(std > self.z_min_std, (values - mean) / std, 0.0)
+                z_hit = (np.abs(zscore) > self.z_threshold) & (self.samples[rows][:, None] >= self.z_warmup)
+
+            # Mise à jour de l'état: EWMA, tampon circulaire, compteurs
+            first = np.isnan(mean)
+            diff = np.where(first, 0.0, values - mean)
+            increment = self.z_alpha * diff
+            new_mean = np.where(first, values, mean + increment)
+            new_var = np.where(first, 0.0, (1.0 - self.z_alpha) * (self.var[rows] + diff * increment))
+            self.mean[rows] = np.where(valid, new_mean, self.mean[rows])
+            self.var[rows] = np.where(valid, new_var, self.var[rows])
+            self.ring[rows, self.head[rows]] = values
+            self.head[rows] = (self.head[rows] + 1) % self.window
+            self.samples[rows] += 1
+
+            # Transitions d'état (une valeur absente ne change pas l'état de l'alerte)
+            hits = np.stack([range_hit, rate_hit, z_hit], axis=1) & valid[:, None, :]
+            was_active = self.active[rows]
+            now_active = np.where(valid[:, None, :], hits, was_active)
+            self.active[rows] = now_active
+            fired = now_active & ~was_active
+            resolved = ~now_active & was_active
+
+        events = []
+        for state, mask in (("firing", fired), ("resolved", resolved)):
+            for sample, kind_index, position in zip(*np.nonzero(mask)):
+                kind = KINDS[kind_index]
+                rule = self.rules[self.rule_index[kind][position]]
+                event = {
+                    "@timestamp": timestamps[sample].isoformat(),
+                    "type": "dme_alert",
+                    "metric": self.columns[position],
+                    "rule": rule["name"],
+                    "kind": kind,
+                    "severity": rule["severity"],
+                    "state": state,
+                    "value": _json_number(values[sample, position]),
+                }
+                device = samples[sample][0]
+                if device is not None:
+                    event["device"] = device
+                if kind == KIND_RANGE:
+                    event["min"] = _json_number(self.range_low[position])
+                    event["max"] = _json_number(self.range_high[position])
+                elif kind == KIND_RATE:
+                    event["delta"] = _json_number(delta[sample, position])
+                    event["max_delta"] = _json_number(self.rate_max[position])
+                else:
+                    event["zscore"] = round(float(zscore[sample, position]), 2)
+                    event["mean"] = _json_number(mean[sample, position])
+                events.append(event)
+
+        self.stats["samples"] += len(samples)
+        self.stats["fired"] += int(fired.sum())
+        self.stats["resolved"] += int(resolved.sum())
+        return events
+
+    def active_alerts(self, device):
+        """Liste des (métrique, type) en alerte pour un équipement"""
+        row = self.devices.get(device)
+        if row is None:
+            return []
+        kinds, positions = np.nonzero(self.active[row])
+        return [(self.columns[position], KINDS[kind]) for kind, position in zip(kinds, positions)]
+
+
+def get_engine(columns, rules_path):
+    """Retourne le moteur partagé pour un fichier de règles (créé au premier appel)"""
+    key = (rules_path, tuple(columns))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            rules = load_rules(rules_path)
+            engine = AlertEngine(columns, rules)
+            _engines[key] = engine
+            logger.info(f"Moteur d'alertes chargé: {len(rules)} règles depuis {rules_path}")
+    return engine
+
+
+def log_event(event):
+    """Journalise un événement d'alerte"""
+    device = f" [{event['device']}]" if "device" in event else ""
+    message = f"Alerte {event['severity']} {event['state']}{device}: {event['metric']} = {event['value']} (règle {event['rule']}, {event['kind']})"
+    if event["state"] == "firing":
+        logger.warning(message)
+    else:
+        logger.info(message)
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Rattrapage en masse de l'historique CSV dans Elasticsearch
+Après une coupure prolongée de la chaîne ELK, le fichier OUTPUT_FILE du
+collecteur est la seule copie des données. Ce chargeur l'indexe directement
+via l'API _bulk, dans les index quotidiens rcms-dme-AAAA.MM.JJ:
+
+- chaque fichier (segments tournés compris) est découpé en tranches d'octets
+  alignées sur les lignes; un segment .gz forme une seule tranche;
+- un pool de processus analyse les tranches en parallèle; chaque processus
+  garde sa connexion HTTP persistante et envoie ses propres requêtes _bulk
+  (renvois, backoff et découpage des requêtes trop volumineuses de es_bulk);
+- l'identifiant de chaque document est dérivé de (équipement, horodatage):
+  relancer le chargement remplace les documents au lieu de les dupliquer;
+- un fichier de reprise (<fichier>.backfill.json) note les tranches dont
+  chaque document a été indexé ou rejeté individuellement par Elasticsearch;
+  après un arrêt, seules les tranches restantes sont rechargées;
+- une requête refusée en bloc (authentification, droits, URL: 401, 403,
+  404...) arrête le chargement avec un code d'erreur, sans rien noter.
+
+Seules les lignes complètes présentes au lancement sont chargées: le fichier
+courant peut continuer à grossir, la relance suivante reprendra la suite.
+
+Exemples:
+    python backfill.py --file /app/data/dme_data.csv --workers 4
+    python backfill.py --file /app/data/dme_data.csv --device dme-nord --device dme-sud --start "2025-06-02"
+
+Auteur: arthur
+"""
+
+import os
+import sys
+import json
+import time
+import gzip
+import hashlib
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+
+from csv_sink import list_segments
+from es_bulk import ElasticsearchBulkSink, RequestRefused
+from replay import parse_value, device_path
+
+logger = logging.getLogger("backfill")
+
+CHECKPOINT_VERSION = 1
+# Format des horodatages CSV (centièmes de seconde), pour les bornes --start/--end
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class Config:
+    ES_URL = os.environ.get("ES_URL", "http://elasticsearch:9200")
+    ES_USER = os.environ.get("ES_USER", "elastic")
+    ES_PASSWORD = os.environ.get("ES_PASSWORD", "")
+    ES_INDEX_PREFIX = os.environ.get("ES_INDEX_PREFIX", "rcms-dme")
+    ES_MAX_RETRIES = int(os.environ.get("ES_MAX_RETRIES", 5))
+    ES_CA_FILE = os.environ.get("ES_CA_FILE") or None
+
+    OUTPUT_FILE = os.environ.get("OUTPUT_FILE", "dme_data.csv")
+    # Processus d'analyse et d'envoi (0 = nombre de cœurs)
+    BACKFILL_WORKERS = int(os.environ.get("BACKFILL_WORKERS", 0))
+    # Taille des tranches d'un fichier non compressé (octets)
+    BACKFILL_CHUNK_BYTES = int(os.environ.get("BACKFILL_CHUNK_BYTES", 8 * 1024 * 1024))
+    # Documents et taille maximale d'une requête _bulk
+    BACKFILL_BATCH_SIZE = int(os.environ.get("BACKFILL_BATCH_SIZE", 2000))
+    BACKFILL_BATCH_BYTES = int(os.environ.get("BACKFILL_BATCH_BYTES", 8 * 1024 * 1024))
+    BACKFILL_TIMEOUT = float(os.environ.get("BACKFILL_TIMEOUT", 60.0))
+
+
+def document_id(device, timestamp):
+    """Identifiant stable d'un échantillon: un rechargement remplace le document existant"""
+    return hashlib.blake2b(f"{device or ''}|{timestamp}".encode(), digest_size=12).hexdigest()
+
+
+def checkpoint_path(base_path):
+    return base_path + ".backfill.json"
+
+
+class Checkpoint:
+    """Tranches déjà indexées, par fichier (chemin et inode), écrites de façon atomique"""
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+            if state.get("version") == CHECKPOINT_VERSION:
+                self.files = state.get("files", {})
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning(f"Fichier de reprise illisible, chargement complet: {path}")
+
+    def _chunks(self, path, inode):
+        entry = self.files.get(path)
+        if entry is None or entry.get("inode") != inode:
+            # Fichier remplacé (rotation): les tranches notées ne le concernent plus
+            entry = {"inode": inode, "chunks": {}}
+            self.files[path] = entry
+        return entry["chunks"]
+
+    def is_done(self, chunk):
+        return chunk.key in self._chunks(chunk.path, chunk.inode)
+
+    def mark(self, chunk, rows):
+        self._chunks(chunk.path, chunk.inode)[chunk.key] = rows
+        self.save()
+
+    def rows(self):
+        return sum(sum(entry["chunks"].values()) for entry in self.files.values())
+
+    def save(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, 'w') as f:
+            json.dump({"version": CHECKPOINT_VERSION, "files": self.files}, f)
+        os.replace(temporary, self.path)
+
+
+class Chunk:
+    """Tranche [start, end[ d'un fichier de données (toute la longueur pour un segment .gz)"""
+
+    __slots__ = ("path", "inode", "device", "header", "start", "end")
+
+    def __init__(self, path, inode, device, header, start=0, end=None):
+        self.path = path
+        self.inode = inode
+        self.device = device
+        self.header = header
+        self.start = start
+        self.end = end
+
+    @property
+    def key(self):
+        return "gz" if self.end is None else f"{self.start}-{self.end}"
+
+    def lines(self):
+        """Lignes de données de la tranche: celles dont le premier octet est dans [start, end["""
+        if self.end is None:
+            with gzip.open(self.path, 'rb') as f:
+                f.readline()
+                for line in f:
+                    if line.endswith(b"\n"):
+                        yield line
+            return
+        with open(self.path, 'rb') as f:
+            position = max(self.start, 1)
+            f.seek(position - 1)
+            # Fin de la ligne en cours au début de la tranche (ou de l'en-tête)
+            position += len(f.readline()) - 1
+            if position >= self.end:
+                return
+            block = f.read(self.end - position)
+            if not block.endswith(b"\n"):
+                block += f.readline()
+        for line in block.splitlines(keepends=True):
+            yield line
+
+
+def _read_header(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rb') as f:
+        return f.readline().decode().rstrip("\r\n").split("\t")
+
+
+def _complete_size(path):
+    """Taille du fichier jusqu'à la dernière ligne complète (le collecteur peut être en cours d'écriture)"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        position = size
+        while position > 0:
+            step = min(64 * 1024, position)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                return position - step + newline + 1
+            position -= step
+    return 0
+
+
+def plan(sources, chunk_bytes):
+    """Tranches de tous les fichiers sources [(équipement ou None, chemin de base)]"""
+    chunks = []
+    for device, base_path in sources:
+        files = list_segments(base_path)
+        if os.path.isfile(base_path):
+            files.append(base_path)
+        if not files:
+            logger.warning(f"Aucun fichier de données pour {base_path}")
+        for path in files:
+            inode = os.stat(path).st_ino
+            header = _read_header(path)
+            if path.endswith(".gz"):
+                chunks.append(Chunk(path, inode, device, header))
+                continue
+            size = _complete_size(path)
+            for start in range(0, size, chunk_bytes):
+                chunks.append(Chunk(path, inode, device, header, start, min(start + chunk_bytes, size)))
+    return chunks
+
+
+class BackfillStats:
+    """Avancement global du chargement"""
+
+    def __init__(self, chunks):
+        self.started = time.monotonic()
+        self.chunks = chunks
+        self.done = 0
+        self.rows = 0
+        self.documents = 0
+        self.indexed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.failed_chunks = 0
+
+    def record(self, result):
+        self.done += 1
+        self.rows += result["rows"]
+        self.documents += result["documents"]
+        self.indexed += result["indexed"]
+        self.rejected += result["rejected"]
+        self.dropped += result["dropped"]
+        if not is_complete(result):
+            self.failed_chunks += 1
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def rows_per_minute(self):
+        elapsed = self.elapsed()
+        return self.rows * 60.0 / elapsed if elapsed > 0 else 0.0
+
+
+def is_complete(result):
+    """Tranche entièrement traitée: chaque document envoyé a été indexé ou rejeté individuellement"""
+    return not result["dropped"] and result["indexed"] + result["rejected"] == result["documents"]
+
+
+# État propre à chaque processus du pool
+_worker = {}
+
+
+def _init_worker(sink_options, batch_size, batch_bytes, window, delta):
+    # Requête refusée en bloc: exception remontée au processus principal, qui arrête le chargement
+    _worker["sink"] = ElasticsearchBulkSink(raise_on_refusal=True, **sink_options)
+    _worker["connection"] = None
+    _worker["batch_size"] = batch_size
+    _worker["batch_bytes"] = batch_bytes
+    _worker["window"] = window
+    _worker["delta"] = delta
+    # Champs ajoutés par le pipeline Logstash, identiques pour toute la tranche
+    _worker["static"] = {
+        "type": "dme_metrics",
+        "environment": "production",
+        "application": "dme_monitoring",
+        "processed_by": "backfill",
+    }
+
+
+def _encode_chunk(chunk, sink, window, delta):
+    """Génère (nombre de lignes lues, ligne _bulk encodée ou None) pour chaque ligne de la tranche"""
+    start, end = window
+    names = chunk.header[1:]
+    prefix = sink.index_prefix
+    static = dict(_worker["static"], processed_at=datetime.utcnow().isoformat() + "Z")
+    if chunk.device is not None:
+        static["device"] = chunk.device
+    actions = {}
+    for raw in chunk.lines():
+        fields = raw.decode().rstrip("\r\n").split("\t")
+        timestamp = fields[0]
+        if (start and timestamp < start) or (end and timestamp >= end):
+            yield None
+            continue
+        metrics = {name: parse_value(text) for name, text in zip(names, fields[1:]) if text != ""}
+        if not metrics:
+            yield None
+            continue
+        day = timestamp[:10]
+        action = actions.get(day)
+        if action is None:
+            # Horodatage de largeur fixe: l'index quotidien se lit directement dans le texte
+            action = actions[day] = '{"index": {"_index": "%s-%s", "_id": "' % (prefix, day.replace("-", "."))
+        # Même instant que datetime.isoformat(), sans analyse de date par ligne
+        document = {"@timestamp": timestamp.replace(" ", "T"), **static, "metrics": metrics}
+        if delta:
+            document["delta"] = True
+            document["keyframe"] = len(metrics) == len(names)
+        yield (action + document_id(chunk.device, timestamp) + '"}}\n' + json.dumps(document) + "\n").encode()
+
+
+def load_chunk(chunk):
+    """Indexe une tranche (exécuté dans un processus du pool); retourne ses compteurs"""
+    sink = _worker["sink"]
+    with sink.stats_lock:
+        for key in sink.stats:
+            sink.stats[key] = 0
+    batch_size, batch_bytes = _worker["batch_size"], _worker["batch_bytes"]
+    rows = 0
+    documents = 0
+    batch = []
+    size = 0
+    for line in _encode_chunk(chunk, sink, _worker["window"], _worker["delta"]):
+        rows += 1
+        if line is None:
+            continue
+        documents += 1
+        batch.append(line)
+        size += len(line)
+        if len(batch) >= batch_size or size >= batch_bytes:
+            _worker["connection"] = sink._send(_worker["connection"], batch)
+            batch = []
+            size = 0
+    if batch:
+        _worker["connection"] = sink._send(_worker["connection"], batch)
+    return {
+        "chunk": chunk,
+        "rows": rows,
+        "documents": documents,
+        "indexed": sink.stats["indexed"],
+        "rejected": sink.stats["rejected"],
+        "dropped": sink.stats["dropped"],
+    }
+
+
+def backfill(sources, sink_options, checkpoint, workers=None, chunk_bytes=8 * 1024 * 1024, batch_size=2000,
+             batch_bytes=8 * 1024 * 1024, start=None, end=None, delta=False, progress_interval=10.0):
+    """
+    Charge les fichiers sources [(équipement ou None, chemin de base)] dans Elasticsearch.
+    Une tranche n'est notée dans le fichier de reprise que si chacun de ses documents a été
+    indexé ou rejeté individuellement (is_complete). Une requête refusée en bloc lève
+    RequestRefused et arrête le chargement.
+    Retourne les statistiques du chargement (BackfillStats).
+    """
+    chunks = plan(sources, chunk_bytes)
+    pending = [chunk for chunk in chunks if not checkpoint.is_done(chunk)]
+    stats = BackfillStats(len(pending))
+    logger.info(f"{len(chunks)} tranches, {len(chunks) - len(pending)} déjà chargées "
+                f"({checkpoint.rows()} lignes), {len(pending)} à charger")
+    if not pending:
+        return stats
+
+    window = (start.strftime(TIMESTAMP_FORMAT)[:-4] if start else None,
+              end.strftime(TIMESTAMP_FORMAT)[:-4] if end else None)
+    workers = workers or os.cpu_count() or 1
+    last_progress = time.monotonic()
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(sink_options, batch_size, batch_bytes, window, delta)) as pool:
+        # Grosses tranches d'abord: les dernières tâches du pool restent courtes
+        pending.sort(key=lambda chunk: (chunk.end is None, (chunk.end or 0) - chunk.start), reverse=True)
+        for result in pool.imap_unordered(load_chunk, pending):
+            stats.record(result)
+            chunk = result["chunk"]
+            if is_complete(result):
+                checkpoint.mark(chunk, result["rows"])
+            else:
+                missing = result["documents"] - result["indexed"] - result["rejected"]
+                logger.error(f"{missing} documents non indexés dans {chunk.path} [{chunk.key}]: tranche à recharger")
+            if time.monotonic() - last_progress >= progress_interval:
+                last_progress = time.monotonic()
+                logger.info(f"{stats.done}/{stats.chunks} tranches, {stats.rows} lignes, "
+                            f"{stats.indexed} documents indexés ({stats.rows_per_minute():.0f} lignes/min)")
+    return stats
+
+
+def _parse_bound(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    config = Config()
+    parser = argparse.ArgumentParser(description="Rattrapage de l'historique CSV DME dans Elasticsearch (_bulk)")
+    parser.add_argument("--file", default=config.OUTPUT_FILE, help="Fichier de sortie du collecteur")
+    parser.add_argument("--device", action="append", help="Équipement (mode flotte), répétable; ajoute le champ device")
+    parser.add_argument("--start", help="Début (AAAA-MM-JJ HH:MM[:SS])")
+    parser.add_argument("--end", help="Fin (AAAA-MM-JJ HH:MM[:SS])")
+    parser.add_argument("--workers", type=int, default=config.BACKFILL_WORKERS, help="Processus (0 = nombre de cœurs)")
+    parser.add_argument("--chunk-bytes", type=int, default=config.BACKFILL_CHUNK_BYTES, help="Taille des tranches")
+    parser.add_argument("--batch-size", type=int, default=config.BACKFILL_BATCH_SIZE, help="Documents par requête _bulk")
+    parser.add_argument("--delta", action="store_true", help="Fichiers écrits en mode delta: documents partiels marqués delta/keyframe")
+    parser.add_argument("--checkpoint", help="Fichier de reprise (défaut: <fichier>.backfill.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignore le fichier de reprise existant")
+    args = parser.parse_args()
+
+    if args.chunk_bytes <= 0 or args.batch_size <= 0:
+        parser.error("--chunk-bytes et --batch-size doivent être positifs")
+    if args.device:
+        sources = [(device, device_path(args.file, device)) for device in args.device]
+    else:
+        sources = [(None, args.file)]
+    checkpoint = Checkpoint(args.checkpoint or checkpoint_path(args.file))
+    if args.restart:
+        checkpoint.files = {}
+    sink_options = {
+        "url": config.ES_URL,
+        "user": config.ES_USER,
+        "password": config.ES_PASSWORD,
+        "index_prefix": config.ES_INDEX_PREFIX,
+        "timeout": config.BACKFILL_TIMEOUT,
+        "max_retries": config.ES_MAX_RETRIES,
+        "ca_file": config.ES_CA_FILE,
+    }
+
+    logger.info(f"Rattrapage de {len(sources)} fichier(s) vers {config.ES_URL}")
+    try:
+        stats = backfill(sources, sink_options, checkpoint, args.workers, args.chunk_bytes, args.batch_size,
+                         config.BACKFILL_BATCH_BYTES, _parse_bound(args.start), _parse_bound(args.end), args.delta)
+    except KeyboardInterrupt:
+        logger.warning(f"Rattrapage interrompu: reprise possible depuis {checkpoint.path}")
+        sys.exit(130)
+    except RequestRefused as e:
+        logger.error(f"{str(e)}: rattrapage arrêté (vérifier ES_URL, ES_USER et ES_PASSWORD)")
+        sys.exit(2)
+
+    logger.info(f"Rattrapage terminé: {stats.rows} lignes, {stats.indexed} documents indexés, "
+                f"{stats.rejected} rejets, {stats.dropped} abandons en {stats.elapsed():.1f}s "
+                f"({stats.rows_per_minute():.0f} lignes/min)")
+    if stats.failed_chunks:
+        logger.error(f"{stats.failed_chunks} tranche(s) incomplète(s): relancer la commande pour les recharger")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
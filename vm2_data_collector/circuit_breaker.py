@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Délais adaptatifs et disjoncteur par équipement
+Un équipement injoignable ne doit plus bloquer la collecte des autres:
+
+- AdaptiveTimeout estime le délai de retransmission (RTO) d'après les temps
+  d'aller-retour observés, comme TCP (RFC 6298): RTO = SRTT + k * RTTVAR,
+  borné entre un minimum et TIMEOUT, doublé à chaque expiration (Karn). Les
+  mesures susceptibles d'inclure une retransmission sont ignorées.
+- CircuitBreaker ouvre le circuit après failure_threshold échecs consécutifs:
+  l'équipement est ignoré pendant reset_timeout secondes, puis une seule
+  collecte d'essai (semi-ouvert) décide de sa réadmission. Chaque essai
+  raté double le délai, jusqu'à max_reset_timeout.
+
+L'état est partagé par clé (nom de l'équipement, ou hôte:port et contexte) dans le processus.
+
+Auteur: arthur
+"""
+
+import math
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger("circuit_breaker")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+STATES = (STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN)
+
+# État partagé, un par équipement (hôte:port)
+_healths = {}
+_healths_lock = threading.Lock()
+
+
+class AdaptiveTimeout:
+    """Estimation du délai d'attente d'après la distribution des allers-retours"""
+
+    def __init__(self, initial=1.0, minimum=0.2, maximum=10.0, k=4.0, alpha=0.125, beta=0.25, granularity=0.1):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.k = k
+        self.alpha = alpha
+        self.beta = beta
+        self.granularity = granularity
+        self.srtt = None
+        self.rttvar = None
+        self.rto = min(self.maximum, max(self.minimum, initial))
+        self.lock = threading.Lock()
+
+    def observe(self, rtt):
+        """Intègre un aller-retour mesuré (ignoré s'il dépasse le délai courant: retransmission probable)"""
+        with self.lock:
+            if rtt > self.rto:
+                return
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+                self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+            self.rto = min(self.maximum, max(self.minimum, self.srtt + self.k * self.rttvar))
+
+    def backoff(self):
+        """Double le délai après une expiration"""
+        with self.lock:
+            self.rto = min(self.maximum, self.rto * 2)
+
+    def value(self):
+        """Délai courant, arrondi au pas supérieur (le cache de cibles pysnmp est indexé par délai)"""
+        steps = math.ceil(self.rto / self.granularity - 1e-9)
+        return round(min(self.maximum, max(self.minimum, steps * self.granularity)), 3)
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / semi-ouvert"""
+
+    def __init__(self, name, failure_threshold=1, reset_timeout=30.0, max_reset_timeout=600.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max(reset_timeout, max_reset_timeout)
+        self.clock = clock
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.reset_timeout = reset_timeout
+        self.opened_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0, "probes": 0}
+
+    def allow(self):
+        """Vrai si une collecte peut être tentée; en semi-ouvert, une seule à la fois"""
+        with self.lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and self.clock() >= self.opened_until:
+                self.state = STATE_HALF_OPEN
+                self.stats["probes"] += 1
+                logger.info(f"Circuit semi-ouvert [{self.name}]: collecte d'essai")
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state != STATE_CLOSED:
+                logger.info(f"Circuit refermé [{self.name}]: équipement réadmis")
+                self.state = STATE_CLOSED
+                self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == STATE_HALF_OPEN:
+                self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+                self._open()
+            elif self.state == STATE_CLOSED and self.failures >= self.failure_threshold:
+                self.reset_timeout = self.base_reset_timeout
+                self._open()
+
+    def _open(self):
+        # Léger aléa pour ne pas synchroniser les essais de nombreux équipements
+        delay = self.reset_timeout * random.uniform(0.9, 1.1)
+        self.state = STATE_OPEN
+        self.opened_until = self.clock() + delay
+        self.stats["opened"] += 1
+        logger.warning(f"Circuit ouvert [{self.name}] après {self.failures} échec(s): équipement ignoré pendant {delay:.0f}s")
+
+    def remaining(self):
+        """Secondes avant le prochain essai (0 si fermé ou essai possible)"""
+        with self.lock:
+            if self.state != STATE_OPEN:
+                return 0.0
+            return max(0.0, self.opened_until - self.clock())
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = dict(self.stats)
+            snapshot.update(state=self.state, failures=self.failures, reset_timeout=self.reset_timeout)
+        return snapshot
+
+
+class DeviceHealth:
+    """Délai adaptatif et disjoncteur d'un équipement"""
+
+    def __init__(self, name, timeout, breaker):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = breaker
+
+
+def get_health(key, timeout_options=None, breaker_options=None):
+    """Retourne l'état partagé d'un équipement (créé au premier appel)"""
+    with _healths_lock:
+        health = _healths.get(key)
+        if health is None:
+            health = DeviceHealth(
+                key,
+                AdaptiveTimeout(**(timeout_options or {})),
+                CircuitBreaker(key, **(breaker_options or {}))
+            )
+            _healths[key] = health
+    return health
+
+
+def breaker_summary():
+    """Nombre d'équipements par état du disjoncteur et total des collectes écartées"""
+    with _healths_lock:
+        healths = list(_healths.values())
+    counts = dict.fromkeys(STATES, 0)
+    rejected = 0
+    for health in healths:
+        snapshot = health.breaker.snapshot()
+        counts[snapshot["state"]] += 1
+        rejected += snapshot["rejected"]
+    return counts, rejected
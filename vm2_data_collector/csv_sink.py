@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Écriture CSV bufferisée avec rotation et compression
+Le fichier de sortie reste ouvert entre deux échantillons, les écritures sont
+bufferisées et synchronisées sur disque selon une politique configurable.
+Le fichier est renommé en segment horodaté lorsqu'il dépasse une taille
+maximale ou change de jour, puis compressé en gzip par un thread de fond.
+Chaque nouveau segment commence par la ligne d'en-tête.
+
+Nommage: dme_data.csv (segment courant), dme_data.20250602-181856.csv puis
+dme_data.20250602-181856.csv.gz (segments fermés, horodatés par leur première ligne).
+
+Auteur: arthur
+"""
+
+import os
+import csv
+import glob
+import gzip
+import time
+import queue
+import atexit
+import shutil
+import weakref
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger("csv_sink")
+
+# Politiques de synchronisation disque
+FSYNC_ALWAYS = "always"      # flush + fsync à chaque ligne
+FSYNC_INTERVAL = "interval"  # flush + fsync au plus toutes les fsync_interval secondes
+FSYNC_NEVER = "never"        # flush périodique, fsync laissé au système
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+SEGMENT_FORMAT = "%Y%m%d-%H%M%S"
+
+# Compression des segments fermés: un seul thread pour tous les fichiers
+_compress_queue = queue.Queue()
+_compress_thread = None
+_compress_lock = threading.Lock()
+
+# Fichiers ouverts, vidés à l'arrêt du processus
+_open_sinks = weakref.WeakSet()
+
+
+def _compress_worker():
+    while True:
+        path, on_done = _compress_queue.get()
+        try:
+            with open(path, 'rb') as source, gzip.open(path + ".gz.tmp", 'wb') as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            os.replace(path + ".gz.tmp", path + ".gz")
+            os.remove(path)
+            logger.info(f"Segment compressé: {path}.gz")
+        except Exception as e:
+            logger.error(f"Erreur lors de la compression du segment {path}: {str(e)}")
+        finally:
+            if on_done:
+                on_done()
+            _compress_queue.task_done()
+
+
+def _schedule_compression(path, on_done=None):
+    global _compress_thread
+    with _compress_lock:
+        if _compress_thread is None:
+            _compress_thread = threading.Thread(target=_compress_worker, name="csv-compress", daemon=True)
+            _compress_thread.start()
+    _compress_queue.put((path, on_done))
+
+
+def wait_compression():
+    """Attend la fin des compressions en cours"""
+    _compress_queue.join()
+
+
+def list_segments(path):
+    """Segments fermés d'un fichier de sortie, du plus ancien au plus récent"""
+    base, ext = os.path.splitext(path)
+    pattern = glob.escape(base) + ".[0-9]*" + ext
+    segments = glob.glob(pattern) + glob.glob(pattern + ".gz")
+    return sorted(segments, key=lambda segment: os.path.basename(segment))
+
+
+def parse_timestamp(value):
+    """Convertit l'horodatage CSV du collecteur (centièmes de seconde) en datetime"""
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class RotatingCSVSink:
+    """Fichier CSV ouvert en continu, bufferisé, avec rotation et compression"""
+
+    def __init__(self, path, header, delimiter='\t', fsync_policy=FSYNC_INTERVAL, fsync_interval=10.0,
+                 flush_interval=1.0, rotate_bytes=50 * 1024 * 1024, rotate_daily=True,
+                 max_segments=30, compress=True, buffer_size=64 * 1024):
+        if fsync_policy not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f"Politique fsync inconnue: {fsync_policy}")
+        self.path = path
+        self.header = header
+        self.delimiter = delimiter
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.max_segments = max_segments
+        self.compress = compress
+        self.buffer_size = buffer_size
+
+        self.lock = threading.Lock()
+        self.file = None
+        self.writer = None
+        self.segment_start = None
+        self.last_flush = time.monotonic()
+        self.last_fsync = time.monotonic()
+        self.rows = 0
+        # Fonctions appelées après chaque flush, rotation et suppression de segment (ex: index temporel)
+        self.on_flush = []
+        self.on_rotate = []
+        self.on_remove = []
+        self._open()
+        _open_sinks.add(self)
+
+    def _first_timestamp(self):
+        """Horodatage de la première ligne de données du segment courant"""
+        try:
+            with open(self.path, 'r', newline='') as f:
+                f.readline()
+                line = f.readline()
+            if line:
+                return parse_timestamp(line.split(self.delimiter, 1)[0])
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        is_new = not os.path.isfile(self.path) or os.path.getsize(self.path) == 0
+        self.file = open(self.path, 'a', newline='', buffering=self.buffer_size)
+        self.writer = csv.writer(self.file, delimiter=self.delimiter)
+        if is_new:
+            self.writer.writerow(self.header)
+            self.segment_start = None
+            logger.info(f"Fichier de sortie initialisé: {self.path}")
+        else:
+            self.segment_start = self._first_timestamp()
+
+    def _should_rotate(self, row_time):
+        if self.segment_start is None:
+            return False
+        if self.rotate_bytes and self.file.tell() >= self.rotate_bytes:
+            return True
+        return self.rotate_daily and self.segment_start.date() != row_time.date()
+
+    def will_rotate(self, row_time):
+        """Indique si une ligne horodatée row_time sera la première d'un segment"""
+        with self.lock:
+            return self.segment_start is None or self._should_rotate(row_time)
+
+    def _sync(self, force=False):
+        """Applique la politique de flush/fsync"""
+        now = time.monotonic()
+        flushed = False
+        if force or self.fsync_policy == FSYNC_ALWAYS or now - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.last_flush = now
+            flushed = True
+        if self.fsync_policy == FSYNC_ALWAYS or (force and self.fsync_policy != FSYNC_NEVER) or \
+                (self.fsync_policy == FSYNC_INTERVAL and now - self.last_fsync >= self.fsync_interval):
+            if not flushed:
+                self.file.flush()
+                flushed = True
+            os.fsync(self.file.fileno())
+            self.last_fsync = now
+        if flushed:
+            for callback in self.on_flush:
+                callback(self.path)
+
+    def rotate(self):
+        """Ferme le segment courant, le renomme puis ouvre un nouveau segment"""
+        with self.lock:
+            self._rotate()
+
+    def _rotate(self):
+        self._sync(force=True)
+        self.file.close()
+        start = self.segment_start or datetime.now()
+        base, ext = os.path.splitext(self.path)
+        segment = f"{base}.{start.strftime(SEGMENT_FORMAT)}{ext}"
+        suffix = 1
+        while os.path.exists(segment) or os.path.exists(segment + ".gz"):
+            segment = f"{base}.{start.strftime(SEGMENT_FORMAT)}-{suffix}{ext}"
+            suffix += 1
+        os.replace(self.path, segment)
+        logger.info(f"Rotation du fichier de sortie: {segment} ({self.rows} lignes écrites)")
+        for callback in self.on_rotate:
+            callback(self.path, segment)
+
+        if self.compress:
+            _schedule_compression(segment, self._prune)
+        else:
+            self._prune()
+        self._open()
+
+    def _prune(self):
+        """Supprime les segments les plus anciens au-delà de max_segments"""
+        if not self.max_segments:
+            return
+        segments = list_segments(self.path)
+        for segment in segments[:-self.max_segments]:
+            try:
+                os.remove(segment)
+                logger.info(f"Segment supprimé (rétention {self.max_segments}): {segment}")
+                for callback in self.on_remove:
+                    callback(segment)
+            except OSError as e:
+                logger.error(f"Erreur lors de la suppression du segment {segment}: {str(e)}")
+
+    def write_row(self, row):
+        """Ajoute une ligne (le premier champ est l'horodatage du collecteur)"""
+        try:
+            row_time = parse_timestamp(str(row[0]))
+        except ValueError:
+            row_time = datetime.now()
+        with self.lock:
+            if self._should_rotate(row_time):
+                self._rotate()
+            if self.segment_start is None:
+                self.segment_start = row_time
+            self.writer.writerow(row)
+            self.rows += 1
+            self._sync()
+
+    def flush(self):
+        """Force l'écriture du buffer (et fsync sauf politique never)"""
+        with self.lock:
+            if self.file is not None:
+                self._sync(force=True)
+
+    def close(self):
+        """Vide le buffer et ferme le fichier"""
+        with self.lock:
+            if self.file is not None:
+                self._sync(force=True)
+                self.file.close()
+                self.file = None
+
+
+@atexit.register
+def _close_sinks():
+    for sink in list(_open_sinks):
+        try:
+            sink.close()
+        except Exception as e:
+            logger.error(f"Erreur lors de la fermeture de {sink.path}: {str(e)}")
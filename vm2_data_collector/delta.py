@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Émission par variations (mode delta)
+Seules les métriques dont la valeur a changé depuis la dernière émission, ou
+s'en est écartée de plus que leur bande morte, sont émises. Une image complète
+(keyframe) est émise périodiquement, ainsi qu'au premier échantillon et au
+début de chaque segment CSV, pour que les lecteurs puissent reconstruire
+l'état sans remonter tout l'historique.
+
+Dans le CSV, une cellule vide signifie "inchangé"; une ligne complète est une
+keyframe. Dans Logstash, le document porte "delta": true et "keyframe".
+
+Bandes mortes (DELTA_DEADBANDS): "motif=seuil" séparés par des virgules, motifs
+fnmatch sur les noms de métriques, ex: "mtuExecTXPBDelay*=20,mtuExecTXPBEfficiency*=1".
+
+Reconstruction en ligne de commande:
+    python delta.py reconstruct /app/data/dme_data.csv > dme_data_complet.csv
+    python delta.py stats /app/data/dme_data.csv
+
+Auteur: arthur
+"""
+
+import sys
+import csv
+import gzip
+import fnmatch
+import logging
+import argparse
+
+logger = logging.getLogger("delta")
+
+
+def parse_deadbands(text):
+    """Convertit "motif=seuil,..." en liste [(motif, seuil)]"""
+    deadbands = []
+    for item in (text or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        pattern, separator, threshold = item.partition("=")
+        if not separator:
+            raise ValueError(f"Bande morte invalide (motif=seuil attendu): {item}")
+        deadbands.append((pattern.strip(), float(threshold)))
+    return deadbands
+
+
+class DeltaEncoder:
+    """Filtre un échantillon complet en variations, avec keyframes périodiques"""
+
+    def __init__(self, columns, keyframe_interval=20, deadbands=None):
+        self.columns = list(columns)
+        self.keyframe_interval = max(1, keyframe_interval)
+        # Seuil par métrique: premier motif correspondant, 0 sinon (toute variation est émise)
+        self.deadband = {}
+        for column in self.columns:
+            self.deadband[column] = next(
+                (threshold for pattern, threshold in deadbands or () if fnmatch.fnmatchcase(column, pattern)), 0.0
+            )
+        self.last_emitted = {}
+        self.since_keyframe = None
+        self.stats = {"samples": 0, "keyframes": 0, "values": 0, "emitted": 0}
+
+    def force_keyframe(self, *args):
+        """Force une image complète au prochain échantillon (ex: callback de rotation CSV)"""
+        self.since_keyframe = None
+
+    def _changed(self, column, value):
+        previous = self.last_emitted.get(column)
+        if previous is None or value is None:
+            return previous != value
+        try:
+            return abs(float(value) - float(previous)) > self.deadband[column]
+        except (TypeError, ValueError):
+            return value != previous
+
+    def encode(self, data):
+        """
+        Retourne (métriques à émettre, keyframe).
+
+        data est le dictionnaire complet nom -> valeur d'un échantillon.
+        """
+        keyframe = self.since_keyframe is None or self.since_keyframe + 1 >= self.keyframe_interval
+        if keyframe:
+            emitted = dict(data)
+            self.last_emitted = dict(data)
+            self.since_keyframe = 0
+            self.stats["keyframes"] += 1
+        else:
+            emitted = {}
+            for column, value in data.items():
+                if self._changed(column, value):
+                    emitted[column] = value
+                    self.last_emitted[column] = value
+            self.since_keyframe += 1
+
+        self.stats["samples"] += 1
+        self.stats["values"] += len(data)
+        self.stats["emitted"] += len(emitted)
+        return emitted, keyframe
+
+    def ratio(self):
+        """Part des valeurs réellement émises"""
+        return self.stats["emitted"] / self.stats["values"] if self.stats["values"] else 1.0
+
+
+class DeltaDecoder:
+    """Reconstruit les échantillons complets à partir des variations"""
+
+    def __init__(self):
+        self.state = {}
+
+    def apply(self, metrics, keyframe=False):
+        """Applique un document (métriques émises) et retourne l'état complet courant"""
+        if keyframe:
+            self.state = {}
+        self.state.update(metrics)
+        return dict(self.state)
+
+
+def fill_rows(rows):
+    """
+    Remplit les cellules vides d'un flux de lignes CSV (en-tête en premier) avec
+    la dernière valeur connue de la colonne. Les lignes précédant la première
+    keyframe gardent des cellules vides pour les valeurs encore inconnues.
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    yield header
+    state = [""] * len(header)
+    for row in rows:
+        if not row:
+            continue
+        filled = [row[0]]
+        for index in range(1, len(row)):
+            if row[index] != "":
+                state[index] = row[index]
+            filled.append(state[index])
+        yield filled
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', newline='')
+    return open(path, 'r', newline='')
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Reconstruction des fichiers CSV écrits en mode delta")
+    parser.add_argument("command", choices=("reconstruct", "stats"))
+    parser.add_argument("file", help="Fichier CSV du collecteur (éventuellement .gz)")
+    args = parser.parse_args()
+
+    with _open_text(args.file) as f:
+        reader = csv.reader(f, delimiter='\t')
+        if args.command == "reconstruct":
+            writer = csv.writer(sys.stdout, delimiter='\t', lineterminator='\n')
+            for row in fill_rows(reader):
+                writer.writerow(row)
+            return
+
+        header = next(reader)
+        rows = cells = filled = keyframes = 0
+        for row in reader:
+            values = row[1:]
+            rows += 1
+            cells += len(values)
+            present = sum(1 for value in values if value != "")
+            filled += present
+            keyframes += present == len(header) - 1
+        print(f"Lignes: {rows}, keyframes: {keyframes}")
+        print(f"Cellules renseignées: {filled}/{cells} ({100.0 * filled / cells if cells else 0:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,17 +11,31 @@ Auteur: arthur
 """
 
 import os
+import sys
 import time
-import csv
-import json
+import re
 import logging
-import subprocess
 import threading
 from datetime import datetime
-import socket
-import ssl
-from pysnmp.hlapi import *
-from pysnmp.entity.rfc3413.oneliner import cmdgen
+from urllib.parse import urlsplit
+# pysnmp n'est importé qu'au premier cycle SNMP (snmp_session.py): démarrage et modes sans SNMP plus rapides
+from snmp_batch import BatchedGet
+from logstash_shipper import get_shipper
+from spool import get_spool
+from csv_sink import RotatingCSVSink
+from history_query import attach_index
+from scheduler import FixedRateScheduler, device_offset
+from delta import DeltaEncoder, parse_deadbands
+from circuit_breaker import get_health
+from snmp_session import SnmpSession, get_session
+import metrics_exporter
+
+try:
+    from dme_registry import REGISTRY
+except ImportError:
+    # Exécution depuis le dépôt: registre partagé dans common/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+    from dme_registry import REGISTRY
 
 # Configuration du logging
 logging.basicConfig(
@@ -44,190 +58,446 @@ class Config:
     SNMP_AUTH_PASSWORD = os.environ.get("SNMP_AUTH_PASSWORD", "authpassword")
     SNMP_PRIV_PROTOCOL = os.environ.get("SNMP_PRIV_PROTOCOL", "AES")
     SNMP_PRIV_PASSWORD = os.environ.get("SNMP_PRIV_PASSWORD", "privpassword")
+    SNMP_CONTEXT = os.environ.get("SNMP_CONTEXT", "")
     
     # Intervalle de collecte en secondes (3 minutes par défaut)
     COLLECTION_INTERVAL = int(os.environ.get("COLLECTION_INTERVAL", 180))
+    # Cadence fixe: alignement sur l'heure murale, étalement des équipements (fraction de l'intervalle)
+    COLLECTION_ALIGN = os.environ.get("COLLECTION_ALIGN", "true").lower() == "true"
+    COLLECTION_SPREAD = float(os.environ.get("COLLECTION_SPREAD", 1.0))
+    # Cycle plus long que l'intervalle: "skip" (échéances sautées) ou "concurrent"
+    COLLECTION_OVERRUN_POLICY = os.environ.get("COLLECTION_OVERRUN_POLICY", "skip")
+    COLLECTION_MAX_CONCURRENT = int(os.environ.get("COLLECTION_MAX_CONCURRENT", 2))
     
     # Chemin du fichier de sortie
     OUTPUT_FILE = os.environ.get("OUTPUT_FILE", "dme_data.csv")
+    # Écriture CSV: politique fsync (always, interval, never), rotation et rétention
+    CSV_FSYNC_POLICY = os.environ.get("CSV_FSYNC_POLICY", "interval")
+    CSV_FSYNC_INTERVAL = float(os.environ.get("CSV_FSYNC_INTERVAL", 10))
+    CSV_FLUSH_INTERVAL = float(os.environ.get("CSV_FLUSH_INTERVAL", 1))
+    CSV_ROTATE_BYTES = int(os.environ.get("CSV_ROTATE_BYTES", 50 * 1024 * 1024))
+    CSV_ROTATE_DAILY = os.environ.get("CSV_ROTATE_DAILY", "true").lower() == "true"
+    CSV_MAX_SEGMENTS = int(os.environ.get("CSV_MAX_SEGMENTS", 30))
+    CSV_COMPRESS = os.environ.get("CSV_COMPRESS", "true").lower() == "true"
+    # Index temporel creux tenu à côté de chaque fichier CSV (history_query.py)
+    HISTORY_INDEX = os.environ.get("HISTORY_INDEX", "true").lower() == "true"
+    
+    # Stockage colonnaire binaire optionnel (répertoire vide = désactivé)
+    TSSTORE_DIR = os.environ.get("TSSTORE_DIR", "")
+    
+    # Émission par variations: seules les métriques modifiées sont écrites/envoyées,
+    # avec une image complète toutes les DELTA_KEYFRAME_INTERVAL collectes (delta.py)
+    DELTA_MODE = os.environ.get("DELTA_MODE", "false").lower() == "true"
+    DELTA_KEYFRAME_INTERVAL = int(os.environ.get("DELTA_KEYFRAME_INTERVAL", 20))
+    DELTA_DEADBANDS = os.environ.get("DELTA_DEADBANDS", "")
+    
+    # Détection d'anomalies à la collecte (alerts.py): règles par nom de métrique
+    ALERTS_ENABLED = os.environ.get("ALERTS_ENABLED", "true").lower() == "true"
+    ALERT_RULES = os.environ.get("ALERT_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alert_rules.json"))
     
     # Configuration pour Logstash (à activer en production)
     LOGSTASH_ENABLED = os.environ.get("LOGSTASH_ENABLED", "false").lower() == "true"
     LOGSTASH_HOST = os.environ.get("LOGSTASH_HOST", "logstash")
     LOGSTASH_PORT = int(os.environ.get("LOGSTASH_PORT", 5044))
+    # Regroupement des envois: taille de lot, latence maximale (s) et taille de la file
+    LOGSTASH_BATCH_SIZE = int(os.environ.get("LOGSTASH_BATCH_SIZE", 100))
+    LOGSTASH_FLUSH_INTERVAL = float(os.environ.get("LOGSTASH_FLUSH_INTERVAL", 1.0))
+    LOGSTASH_QUEUE_SIZE = int(os.environ.get("LOGSTASH_QUEUE_SIZE", 10000))
+    
+    # Sortie directe vers l'API _bulk d'Elasticsearch (es_bulk.py), sans passer par Logstash
+    ES_BULK_ENABLED = os.environ.get("ES_BULK_ENABLED", "false").lower() == "true"
+    ES_URL = os.environ.get("ES_URL", "http://elasticsearch:9200")
+    ES_USER = os.environ.get("ES_USER", "elastic")
+    ES_PASSWORD = os.environ.get("ES_PASSWORD", "")
+    ES_INDEX_PREFIX = os.environ.get("ES_INDEX_PREFIX", "rcms-dme")
+    ES_BATCH_SIZE = int(os.environ.get("ES_BATCH_SIZE", 500))
+    ES_FLUSH_INTERVAL = float(os.environ.get("ES_FLUSH_INTERVAL", 1.0))
+    ES_POOL_SIZE = int(os.environ.get("ES_POOL_SIZE", 2))
+    ES_MAX_RETRIES = int(os.environ.get("ES_MAX_RETRIES", 5))
+    ES_CA_FILE = os.environ.get("ES_CA_FILE") or None
+    
+    # Journal sur disque des sorties (spool.py): aucun document perdu pendant une panne de Logstash
+    # ou d'Elasticsearch ("" = désactivé), reprise de l'arriéré à SPOOL_DRAIN_RATE documents/s
+    SPOOL_DIR = os.environ.get("SPOOL_DIR", "")
+    SPOOL_SEGMENT_BYTES = int(os.environ.get("SPOOL_SEGMENT_BYTES", 16 * 1024 * 1024))
+    SPOOL_MAX_BYTES = int(os.environ.get("SPOOL_MAX_BYTES", 1024 * 1024 * 1024))
+    SPOOL_FSYNC = os.environ.get("SPOOL_FSYNC", "false").lower() == "true"
+    SPOOL_DRAIN_RATE = float(os.environ.get("SPOOL_DRAIN_RATE", 200))
+    
+    # Métriques internes exposées au format Prometheus (metrics_exporter.py)
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_PORT = int(os.environ.get("METRICS_PORT", 9108))
+    # Libellé par équipement sur les temps d'aller-retour SNMP (désactiver pour les très grandes flottes)
+    METRICS_PER_DEVICE = os.environ.get("METRICS_PER_DEVICE", "true").lower() == "true"
+    
+    # Repli HTTP (API /all du simulateur) si SNMPv3 échoue: connexions persistantes par hôte
+    HTTP_FALLBACK_PORT = int(os.environ.get("HTTP_FALLBACK_PORT", 5000))
+    HTTP_FALLBACK_POOL_SIZE = int(os.environ.get("HTTP_FALLBACK_POOL_SIZE", 4))
+    HTTP_FALLBACK_TIMEOUT = float(os.environ.get("HTTP_FALLBACK_TIMEOUT", 3))
+    
+    # Mode flotte: inventaire des équipements et nombre de requêtes simultanées
+    FLEET_INVENTORY = os.environ.get("FLEET_INVENTORY", "")
+    FLEET_MAX_IN_FLIGHT = int(os.environ.get("FLEET_MAX_IN_FLIGHT", 64))
+    
+    # Mode flotte multi-processus (sharded_collector.py): processus de collecte (0 = nombre de cœurs),
+    # tampon partagé par processus, délai de battement de cœur et redémarrages
+    SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", 0))
+    SHARD_RING_BYTES = int(os.environ.get("SHARD_RING_BYTES", 4 * 1024 * 1024))
+    SHARD_HEARTBEAT_TIMEOUT = float(os.environ.get("SHARD_HEARTBEAT_TIMEOUT", 60))
+    SHARD_RESTART_BACKOFF = float(os.environ.get("SHARD_RESTART_BACKOFF", 1))
+    SHARD_RESTART_BACKOFF_MAX = float(os.environ.get("SHARD_RESTART_BACKOFF_MAX", 60))
+    # Au-delà de SHARD_MAX_RESTARTS arrêts en SHARD_RESTART_WINDOW secondes, le processus est retiré
+    # pendant SHARD_RESTART_WINDOW et ses équipements sont répartis sur les autres
+    SHARD_MAX_RESTARTS = int(os.environ.get("SHARD_MAX_RESTARTS", 5))
+    SHARD_RESTART_WINDOW = float(os.environ.get("SHARD_RESTART_WINDOW", 300))
+    
+    # Coordination multi-nœuds (lease_coordinator.py): baux de groupes d'équipements dans un stockage
+    # partagé ("" = désactivée, "file" = répertoire partagé COORD_DIR, "resp" = serveur compatible Redis)
+    COORD_BACKEND = os.environ.get("COORD_BACKEND", "")
+    COORD_DIR = os.environ.get("COORD_DIR", "/app/coord")
+    COORD_URL = os.environ.get("COORD_URL", "redis://127.0.0.1:6379/0")
+    COORD_PREFIX = os.environ.get("COORD_PREFIX", "dme:")
+    COORD_SHARDS = int(os.environ.get("COORD_SHARDS", 32))
+    COORD_NODE_ID = os.environ.get("COORD_NODE_ID", "")
+    # Durée d'un bail (0 = moitié de l'intervalle), renouvelé tous les tiers de bail: les groupes
+    # d'un nœud disparu sont repris en moins d'un intervalle de collecte
+    COORD_LEASE_TTL = float(os.environ.get("COORD_LEASE_TTL", 0)) or COLLECTION_INTERVAL / 2
+    # Marge d'écart d'horloge entre nœuds et de dérive locale retranchée à chaque bail (s)
+    COORD_CLOCK_SKEW = float(os.environ.get("COORD_CLOCK_SKEW", 0.5))
     
     # Paramètres de sécurité
     MAX_RETRIES = int(os.environ.get("MAX_RETRIES", 3))
     TIMEOUT = int(os.environ.get("TIMEOUT", 10))
+    
+    # Délai SNMP adaptatif (RTO estimé sur les allers-retours, plafonné à TIMEOUT) et
+    # abandon du cycle dès la première expiration
+    SNMP_ADAPTIVE_TIMEOUT = os.environ.get("SNMP_ADAPTIVE_TIMEOUT", "true").lower() == "true"
+    SNMP_RTO_INITIAL = float(os.environ.get("SNMP_RTO_INITIAL", 1.0))
+    SNMP_RTO_MIN = float(os.environ.get("SNMP_RTO_MIN", 0.2))
+    SNMP_ADAPTIVE_RETRIES = int(os.environ.get("SNMP_ADAPTIVE_RETRIES", 1))
+    # Disjoncteur par équipement: ignoré après N échecs, essai semi-ouvert après un délai croissant
+    BREAKER_ENABLED = os.environ.get("BREAKER_ENABLED", "true").lower() == "true"
+    BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 1))
+    BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", 30))
+    BREAKER_MAX_RESET_TIMEOUT = float(os.environ.get("BREAKER_MAX_RESET_TIMEOUT", 600))
+    
+    # Regroupement des OIDs dans des GET multi-varbinds
+    SNMP_BATCH_MODE = os.environ.get("SNMP_BATCH_MODE", "true").lower() == "true"
+    # Taille maximale d'un message accepté par l'agent (MTU Ethernet sans fragmentation)
+    SNMP_MAX_MSG_SIZE = int(os.environ.get("SNMP_MAX_MSG_SIZE", 1472))
+    # Nombre maximal de varbinds par PDU (0 = limité uniquement par la taille)
+    SNMP_MAX_VARBINDS = int(os.environ.get("SNMP_MAX_VARBINDS", 0))
+    # Moteur SNMP conservé entre les cycles (engineID découvert, clés USM localisées)
+    SNMP_ENGINE_REUSE = os.environ.get("SNMP_ENGINE_REUSE", "true").lower() == "true"
+    # Modules MIB compilés conservés sur disque entre deux démarrages ("" = en mémoire seulement)
+    MIB_CACHE_DIR = os.environ.get("MIB_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "dme", "mibs"))
+
+# Liste des OIDs à collecter (registre partagé common/dme_registry.py)
+OID_LIST = REGISTRY.oid_names
 
-# Liste des OIDs à collecter
-OID_LIST = {
-    "1.3.6.1.4.1.32275.2.1.2.2.5.10": "mtuExecTXPADelayCurrentValue-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.34": "mtuExecTXPBDelayCurrentValue-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.10": "mtuExecTXPADelayCurrentValue-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.34": "mtuExecTXPBDelayCurrentValue-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.11": "mtuExecTXPAPulsePairSpacing-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.35": "mtuExecTXPBPulsePairSpacing-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.11": "mtuExecTXPAPulsePairSpacing-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.35": "mtuExecTXPBPulsePairSpacing-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.12": "mtuExecTXPATransmittedPowerCurrentValue-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.36": "mtuExecTXPBTransmittedPowerCurrentValue-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.12": "mtuExecTXPATransmittedPowerCurrentValue-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.36": "mtuExecTXPBTransmittedPowerCurrentValue-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.13": "mtuExecTXPAEfficiency-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.37": "mtuExecTXPBEfficiency-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.13": "mtuExecTXPAEfficiency-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.37": "mtuExecTXPBEfficiency-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.14": "mtuExecTXPATxFreqError-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.38": "mtuExecTXPBTxFreqError-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.14": "mtuExecTXPATxFreqError-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.38": "mtuExecTXPBTxFreqError-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.15": "mtuExecRadiatedPowerCurrentValue-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.15": "mtuExecRadiatedPowerCurrentValue-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.16": "mtuExecTransmissionRate-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.16": "mtuExecTransmissionRate-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.17": "mtuExecIdentStatus-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.17": "mtuExecIdentStatus-3",
-}
+def device_output_file(output_file, device_name):
+    """Chemin du fichier CSV propre à un équipement (dme_data.csv -> dme_data_<nom>.csv)"""
+    base, ext = os.path.splitext(output_file)
+    return f"{base}_{device_name}{ext}"
 
 # Classe pour collecter et traiter les données DME
 class DMECollector:
-    def __init__(self):
+    def __init__(self, device=None, outputs=True):
         self.config = Config()
-        self.column_names = ["Timestamp"] + list(OID_LIST.values())
-        self._initialize_output_file()
+        self.device = device
+        self.oids = list(OID_LIST)
+        self.log_suffix = ""
+        if device is not None:
+            self._apply_device(device)
+        self.column_names = list(REGISTRY.column_names)
+        # Taille de message apprise (réduite à chaque réponse tooBig)
+        self.snmp_max_msg_size = self.config.SNMP_MAX_MSG_SIZE
+        # Erreurs par métrique du dernier cycle SNMP
+        self.last_errors = {}
+        # Délai adaptatif et disjoncteur de l'équipement, partagés dans le processus
+        self.health = get_health(
+            self._health_key(),
+            timeout_options={
+                "initial": self.config.SNMP_RTO_INITIAL,
+                "minimum": self.config.SNMP_RTO_MIN,
+                "maximum": self.config.TIMEOUT,
+            },
+            breaker_options={
+                "failure_threshold": self.config.BREAKER_FAILURE_THRESHOLD,
+                "reset_timeout": self.config.BREAKER_RESET_TIMEOUT,
+                "max_reset_timeout": self.config.BREAKER_MAX_RESET_TIMEOUT,
+            }
+        )
+        # Expéditeur Logstash partagé, créé au premier envoi
+        self.shipper = None
+        # Sortie Elasticsearch _bulk partagée, créée au premier envoi
+        self.es_sink = None
+        # Ordonnanceur à cadence fixe, créé au démarrage de la collecte
+        self.scheduler = None
+        self.metrics = self._initialize_metrics()
+        # Sans sorties (processus de collecte du mode multi-processus): les échantillons
+        # sont enregistrés par un autre processus
+        self.csv_sink = None
+        self.ts_store = None
+        self.delta_encoder = None
+        self.alert_engine = None
+        if outputs:
+            self._initialize_output_file()
+            self.ts_store = self._initialize_ts_store()
+            self.delta_encoder = self._initialize_delta()
+            self.alert_engine = self._initialize_alerts()
+    
+    def _apply_device(self, device):
+        """Surcharge la configuration avec les paramètres d'un équipement de l'inventaire"""
+        self.config.SNMP_HOST = device.host
+        self.config.SNMP_PORT = device.port
+        self.config.SNMP_USER = device.user
+        self.config.SNMP_AUTH_PROTOCOL = device.auth_protocol
+        self.config.SNMP_AUTH_PASSWORD = device.auth_password
+        self.config.SNMP_PRIV_PROTOCOL = device.priv_protocol
+        self.config.SNMP_PRIV_PASSWORD = device.priv_password
+        self.config.SNMP_CONTEXT = device.context
+        self.config.OUTPUT_FILE = device_output_file(self.config.OUTPUT_FILE, device.name)
+        self.oids = list(device.oids)
+        self.log_suffix = f" [{device.name}]"
+    
+    def _health_key(self):
+        """
+        Clé de l'état de santé: nom de l'équipement de l'inventaire, sinon hôte:port
+        (et contexte SNMPv3). Les stations jointes par contexte sur un même agent
+        ont chacune leur délai et leur disjoncteur.
+        """
+        if self.device is not None:
+            return self.device.name
+        key = f"{self.config.SNMP_HOST}:{self.config.SNMP_PORT}"
+        return f"{key}/{self.config.SNMP_CONTEXT}" if self.config.SNMP_CONTEXT else key
+    
+    def _initialize_metrics(self):
+        """Démarre l'exposition /metrics (une fois par processus); retourne True si activée"""
+        if not self.config.METRICS_ENABLED:
+            return False
+        metrics_exporter.start_http_server(self.config.METRICS_PORT)
+        if self.config.METRICS_PER_DEVICE:
+            self.metrics_device = self.device.name if self.device is not None else self.config.SNMP_HOST
+        else:
+            self.metrics_device = "all"
+        return True
     
     def _initialize_output_file(self):
-        """Initialise le fichier de sortie avec les en-têtes si nécessaire"""
-        file_exists = os.path.isfile(self.config.OUTPUT_FILE)
-        
-        if not file_exists:
-            try:
-                with open(self.config.OUTPUT_FILE, 'w', newline='') as csvfile:
-                    writer = csv.writer(csvfile, delimiter='\t')
-                    writer.writerow(self.column_names)
-                logger.info(f"Fichier de sortie initialisé: {self.config.OUTPUT_FILE}")
-            except Exception as e:
-                logger.error(f"Erreur lors de l'initialisation du fichier de sortie: {str(e)}")
-                raise
+        """Ouvre le fichier de sortie (en-têtes écrits si nécessaire) pour toute la durée de la collecte"""
+        try:
+            self.csv_sink = RotatingCSVSink(
+                self.config.OUTPUT_FILE,
+                self.column_names,
+                fsync_policy=self.config.CSV_FSYNC_POLICY,
+                fsync_interval=self.config.CSV_FSYNC_INTERVAL,
+                flush_interval=self.config.CSV_FLUSH_INTERVAL,
+                rotate_bytes=self.config.CSV_ROTATE_BYTES,
+                rotate_daily=self.config.CSV_ROTATE_DAILY,
+                max_segments=self.config.CSV_MAX_SEGMENTS,
+                compress=self.config.CSV_COMPRESS
+            )
+            if self.config.HISTORY_INDEX:
+                attach_index(self.csv_sink)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'initialisation du fichier de sortie: {str(e)}")
+            raise
+    
+    def _initialize_ts_store(self):
+        """Ouvre le stockage colonnaire de l'équipement si TSSTORE_DIR est défini"""
+        if not self.config.TSSTORE_DIR:
+            return None
+        # Import différé: NumPy n'est requis que si le stockage est activé
+        from tsstore import TimeSeriesStore
+        name = self.device.name if self.device is not None else "default"
+        store = TimeSeriesStore(os.path.join(self.config.TSSTORE_DIR, name), columns=self.column_names[1:])
+        logger.info(f"Stockage colonnaire activé: {store.path} ({len(store)} lignes)")
+        return store
+    
+    def _initialize_delta(self):
+        """Encodeur de variations si DELTA_MODE est activé"""
+        if not self.config.DELTA_MODE:
+            return None
+        encoder = DeltaEncoder(
+            self.column_names[1:],
+            keyframe_interval=self.config.DELTA_KEYFRAME_INTERVAL,
+            deadbands=parse_deadbands(self.config.DELTA_DEADBANDS)
+        )
+        logger.info(f"Mode delta activé{self.log_suffix}: keyframe toutes les {encoder.keyframe_interval} collectes")
+        return encoder
+    
+    def _initialize_alerts(self):
+        """Moteur d'alertes partagé par tous les équipements du processus"""
+        if not self.config.ALERTS_ENABLED:
+            return None
+        # Import différé: NumPy n'est requis que si les alertes sont activées
+        from alerts import get_engine
+        try:
+            engine = get_engine(self.column_names[1:], self.config.ALERT_RULES)
+            if self.metrics:
+                metrics_exporter.track_alert_engine(engine)
+            return engine
+        except Exception as e:
+            logger.error(f"Erreur lors du chargement des règles d'alerte {self.config.ALERT_RULES}: {str(e)}")
+            return None
     
     def collect_data_snmpv3(self):
         """Collecte les données du simulateur DME via SNMPv3"""
-        data = {}
-        
         try:
-            # Détermination du protocole d'authentification
-            if self.config.SNMP_AUTH_PROTOCOL.upper() == "SHA":
-                auth_protocol = usmHMACSHAAuthProtocol
-            else:
-                auth_protocol = usmHMACMD5AuthProtocol
+            # Moteur SNMP, engineID découvert et clés USM conservés d'un cycle à l'autre
+            session = self.snmp_session()
+            timeout, retries = self.snmp_timeout()
             
-            # Détermination du protocole de confidentialité
-            if self.config.SNMP_PRIV_PROTOCOL.upper() == "AES":
-                priv_protocol = usmAesCfb128Protocol
-            else:
-                priv_protocol = usmDESPrivProtocol
+            # Découpage des OIDs en PDU (une PDU par OID hors mode batch)
+            max_varbinds = self.config.SNMP_MAX_VARBINDS if self.config.SNMP_BATCH_MODE else 1
+            request = BatchedGet(self.oids, self.snmp_max_msg_size, max_varbinds, fail_fast=self.config.SNMP_ADAPTIVE_TIMEOUT)
+            started = time.monotonic()
             
-            # Création du générateur de commandes SNMP
-            cmd_gen = cmdgen.CommandGenerator()
-            
-            # Collecte des données pour chaque OID
-            for oid, name in OID_LIST.items():
-                # Création de l'authentification SNMPv3
-                auth_data = UsmUserData(
-                    self.config.SNMP_USER,
-                    self.config.SNMP_AUTH_PASSWORD,
-                    self.config.SNMP_PRIV_PASSWORD,
-                    authProtocol=auth_protocol,
-                    privProtocol=priv_protocol
-                )
+            while True:
+                batch = request.next_batch()
+                if batch is None:
+                    break
                 
-                # Exécution de la requête SNMP GET
-                error_indication, error_status, error_index, var_binds = cmd_gen.getCmd(
-                    auth_data,
-                    cmdgen.UdpTransportTarget((self.config.SNMP_HOST, self.config.SNMP_PORT), timeout=self.config.TIMEOUT, retries=self.config.MAX_RETRIES),
-                    ObjectIdentity(oid)
+                # Exécution de la requête SNMP GET multi-varbinds
+                sent = time.monotonic()
+                error_indication, error_status, error_index, var_binds = session.get(
+                    batch, timeout, retries, self.config.SNMP_CONTEXT, REGISTRY.object_identities()
                 )
-                
-                # Vérification des erreurs
-                if error_indication:
-                    logger.error(f"Erreur SNMP: {error_indication}")
-                    continue
-                elif error_status:
-                    logger.error(f"Erreur SNMP: {error_status.prettyPrint()} à l'index {error_index}")
-                    continue
-                
-                # Extraction de la valeur
-                for var_bind in var_binds:
-                    value = var_bind[1]
-                    data[name] = int(value)
-                    logger.debug(f"Collecté {name}: {value}")
+                request.handle_response(batch, error_indication, error_status, error_index, var_binds, time.monotonic() - sent)
             
-            logger.info("Données DME collectées avec succès via SNMPv3")
-            return data
+            elapsed = time.monotonic() - started
+            return self.collect_result(request, elapsed)
         except Exception as e:
             logger.error(f"Erreur lors de la collecte des données via SNMPv3: {str(e)}")
+            if self.metrics:
+                metrics_exporter.SNMP_ERRORS.labels("exception").inc()
             return None
     
-    def collect_data_curl(self):
-        """Collecte les données du simulateur DME via curl (méthode alternative)"""
+    def snmp_session(self):
+        """Session SNMPv3 de l'équipement: partagée et durable, ou recréée à chaque cycle si désactivé"""
+        params = (
+            self.config.SNMP_HOST,
+            self.config.SNMP_PORT,
+            self.config.SNMP_USER,
+            self.config.SNMP_AUTH_PROTOCOL,
+            self.config.SNMP_AUTH_PASSWORD,
+            self.config.SNMP_PRIV_PROTOCOL,
+            self.config.SNMP_PRIV_PASSWORD,
+        )
+        if self.config.SNMP_ENGINE_REUSE:
+            return get_session(*params, mib_cache_dir=self.config.MIB_CACHE_DIR)
+        return SnmpSession(*params, mib_cache_dir=self.config.MIB_CACHE_DIR)
+    
+    def collect_result(self, request, elapsed):
+        """Convertit le résultat d'une collecte par lots en dictionnaire nom -> valeur"""
+        self.snmp_max_msg_size = request.max_msg_size
+        self.record_round_trips(request)
+        self.last_errors = {OID_LIST[oid]: reason for oid, reason in request.errors.items()}
+        data = {OID_LIST[oid]: value for oid, value in request.values.items()}
+        if self.metrics:
+            self.record_snmp_metrics(request)
+        logger.info(f"Données DME collectées via SNMPv3{self.log_suffix}: {len(data)}/{len(self.oids)} OIDs en {request.requests} requête(s), {elapsed:.3f}s")
+        return data
+    
+    def snmp_timeout(self):
+        """Délai et nombre de réessais SNMP à appliquer (adaptatifs ou fixes)"""
+        if self.config.SNMP_ADAPTIVE_TIMEOUT:
+            return self.health.timeout.value(), self.config.SNMP_ADAPTIVE_RETRIES
+        return self.config.TIMEOUT, self.config.MAX_RETRIES
+    
+    def record_round_trips(self, request):
+        """Met à jour l'estimation du délai de l'équipement avec les allers-retours de la collecte"""
+        for _, rtt in request.round_trips:
+            self.health.timeout.observe(rtt)
+        if request.timed_out:
+            self.health.timeout.backoff()
+    
+    def admit(self):
+        """Vrai si l'équipement peut être collecté (disjoncteur fermé ou essai semi-ouvert)"""
+        if not self.config.BREAKER_ENABLED or self.health.breaker.allow():
+            return True
+        logger.debug(f"Équipement ignoré{self.log_suffix}: circuit ouvert, nouvel essai dans {self.health.breaker.remaining():.0f}s")
+        return False
+    
+    def record_outcome(self, data):
+        """Reporte le résultat d'une collecte (SNMP ou HTTP) au disjoncteur"""
+        if not self.config.BREAKER_ENABLED:
+            return
+        if data:
+            self.health.breaker.record_success()
+        else:
+            self.health.breaker.record_failure()
+    
+    def record_snmp_metrics(self, request):
+        """Reporte les allers-retours et les erreurs d'une collecte dans les métriques exposées"""
+        device_rtt = metrics_exporter.SNMP_RTT.labels(self.metrics_device)
+        for batch, rtt in request.round_trips:
+            device_rtt.observe(rtt)
+            for oid in batch:
+                metrics_exporter.OID_RTT.labels(OID_LIST[oid]).observe(rtt)
+        for reason in request.failures:
+            metrics_exporter.SNMP_ERRORS.labels(metrics_exporter.error_kind(reason)).inc()
+    
+    def record_collection(self, method, data):
+        """Compte une collecte (snmp, http) et son résultat"""
+        if self.metrics:
+            metrics_exporter.COLLECTIONS.labels(method, "success" if data else "failure").inc()
+    
+    def collect_data_http(self):
+        """Collecte les données du simulateur DME via son API HTTP (méthode alternative)"""
         try:
-            # Construction de la commande curl avec authentification SNMPv3
-            curl_command = [
-                "curl", "-s",
-                "-u", f"{self.config.SNMP_USER}:{self.config.SNMP_AUTH_PASSWORD}",
-                f"http://{self.config.SNMP_HOST}:5000/all"
-            ]
-            
-            # Exécution de la commande curl
-            process = subprocess.Popen(curl_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            
-            # Vérification des erreurs
-            if process.returncode != 0:
-                logger.error(f"Erreur curl: {stderr.decode('utf-8')}")
-                return None
-            
-            # Analyse de la réponse JSON
-            response = json.loads(stdout.decode('utf-8'))
+            # Import différé: le repli HTTP n'est chargé qu'au premier échec SNMPv3
+            from http_fallback import get_client as get_http_client
+            # Client partagé: pool de connexions persistantes par hôte, authentification en en-tête
+            client = get_http_client(
+                self.config.HTTP_FALLBACK_PORT,
+                self.config.SNMP_USER,
+                self.config.SNMP_AUTH_PASSWORD,
+                pool_size=self.config.HTTP_FALLBACK_POOL_SIZE,
+                timeout=self.config.HTTP_FALLBACK_TIMEOUT
+            )
+            data = client.fetch(self.config.SNMP_HOST)
             
-            if "data" in response:
-                logger.info("Données DME collectées avec succès via curl")
-                return response["data"]
+            if data:
+                logger.info(f"Données DME collectées avec succès via HTTP{self.log_suffix}")
+                return data
             else:
-                logger.error("Format de réponse curl invalide")
+                logger.error("Format de réponse HTTP invalide")
                 return None
         except Exception as e:
-            logger.error(f"Erreur lors de la collecte des données via curl: {str(e)}")
+            logger.error(f"Erreur lors de la collecte des données via HTTP{self.log_suffix}: {str(e)}")
             return None
     
     def collect_data(self):
-        """Collecte les données en utilisant SNMPv3 ou curl comme fallback"""
+        """Collecte les données en utilisant SNMPv3 ou HTTP comme fallback"""
+        # Équipement en panne: ignoré jusqu'au prochain essai du disjoncteur
+        if not self.admit():
+            return None
+        
         # Tentative de collecte via SNMPv3
         data = self.collect_data_snmpv3()
+        self.record_collection("snmp", data)
         
-        # Si la collecte SNMPv3 échoue, essayer avec curl
+        # Si la collecte SNMPv3 échoue, essayer via HTTP
         if not data:
-            logger.warning("Collecte SNMPv3 échouée, tentative avec curl...")
-            data = self.collect_data_curl()
+            logger.warning("Collecte SNMPv3 échouée, tentative via HTTP...")
+            if self.metrics:
+                metrics_exporter.HTTP_FALLBACKS.inc()
+            data = self.collect_data_http()
+            self.record_collection("http", data)
         
+        self.record_outcome(data)
         return data
     
-    def format_data(self, data):
-        """Formate les données collectées pour l'enregistrement"""
-        if not data:
+    def format_data(self, data, sample_time=None, missing=0):
+        """Formate les données collectées pour l'enregistrement (missing: valeur des métriques absentes)"""
+        if data is None:
             return None
         
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-4]
+        timestamp = (sample_time or datetime.now()).strftime("%Y-%m-%d %H:%M:%S.%f")[:-4]
         
-        # Création d'une ligne de données formatée
-        row = [timestamp]
-        
-        # Ajout des valeurs dans l'ordre des colonnes (en ignorant le timestamp)
-        for column in self.column_names[1:]:
-            row.append(data.get(column, 0))
-        
-        return row
+        # Ligne préallouée remplie par indice de colonne fixe (registre des OIDs)
+        return REGISTRY.format_row(data, timestamp, missing)
     
     def save_to_csv(self, row):
         """Enregistre une ligne de données dans le fichier CSV"""
@@ -235,71 +505,205 @@ class DMECollector:
             return False
         
         try:
-            with open(self.config.OUTPUT_FILE, 'a', newline='') as csvfile:
-                writer = csv.writer(csvfile, delimiter='\t')
-                writer.writerow(row)
+            started = time.monotonic()
+            self.csv_sink.write_row(row)
+            if self.metrics:
+                metrics_exporter.CSV_WRITE.observe(time.monotonic() - started)
             logger.info(f"Données enregistrées dans {self.config.OUTPUT_FILE}")
             return True
         except Exception as e:
             logger.error(f"Erreur lors de l'enregistrement des données: {str(e)}")
             return False
     
-    def send_to_logstash(self, data):
-        """Envoie les données à Logstash si activé"""
-        if not self.config.LOGSTASH_ENABLED or not data:
+    def save_to_ts_store(self, data, sample_time):
+        """Ajoute l'échantillon au stockage colonnaire"""
+        try:
+            self.ts_store.append(sample_time, data)
+            return True
+        except Exception as e:
+            logger.error(f"Erreur lors de l'enregistrement dans le stockage colonnaire: {str(e)}")
+            return False
+    
+    def _get_spool(self, name):
+        """Journal sur disque partagé d'une sortie (None si SPOOL_DIR n'est pas défini)"""
+        if not self.config.SPOOL_DIR:
+            return None
+        return get_spool(
+            os.path.join(self.config.SPOOL_DIR, re.sub(r"[^A-Za-z0-9._-]", "_", name)),
+            segment_bytes=self.config.SPOOL_SEGMENT_BYTES,
+            max_bytes=self.config.SPOOL_MAX_BYTES,
+            fsync=self.config.SPOOL_FSYNC
+        )
+    
+    def _get_shipper(self):
+        """Expéditeur Logstash partagé, créé au premier envoi"""
+        if self.shipper is None:
+            self.shipper = get_shipper(
+                self.config.LOGSTASH_HOST,
+                self.config.LOGSTASH_PORT,
+                batch_size=self.config.LOGSTASH_BATCH_SIZE,
+                flush_interval=self.config.LOGSTASH_FLUSH_INTERVAL,
+                queue_size=self.config.LOGSTASH_QUEUE_SIZE,
+                spool=self._get_spool(f"logstash-{self.config.LOGSTASH_HOST}-{self.config.LOGSTASH_PORT}"),
+                drain_rate=self.config.SPOOL_DRAIN_RATE
+            )
+            if self.metrics:
+                metrics_exporter.track_output("logstash", f"{self.config.LOGSTASH_HOST}:{self.config.LOGSTASH_PORT}", self.shipper)
+        return self.shipper
+    
+    def _get_es_sink(self):
+        """Sortie Elasticsearch _bulk partagée, créée au premier envoi"""
+        if self.es_sink is None:
+            from es_bulk import get_bulk_sink
+            self.es_sink = get_bulk_sink(
+                self.config.ES_URL,
+                user=self.config.ES_USER,
+                password=self.config.ES_PASSWORD,
+                index_prefix=self.config.ES_INDEX_PREFIX,
+                batch_size=self.config.ES_BATCH_SIZE,
+                flush_interval=self.config.ES_FLUSH_INTERVAL,
+                pool_size=self.config.ES_POOL_SIZE,
+                max_retries=self.config.ES_MAX_RETRIES,
+                ca_file=self.config.ES_CA_FILE,
+                spool=self._get_spool(f"elasticsearch-{urlsplit(self.config.ES_URL).netloc}"),
+                drain_rate=self.config.SPOOL_DRAIN_RATE
+            )
+            if self.metrics:
+                metrics_exporter.track_output("elasticsearch", self.config.ES_URL, self.es_sink)
+        return self.es_sink
+    
+    def shipping_enabled(self):
+        """Vrai si au moins une sortie (Logstash ou Elasticsearch) est activée"""
+        return self.config.LOGSTASH_ENABLED or self.config.ES_BULK_ENABLED
+    
+    def ship(self, document):
+        """Met un document en file vers chaque sortie activée (non bloquant)"""
+        if self.config.LOGSTASH_ENABLED and not self._get_shipper().submit(document):
+            logger.warning("File Logstash pleine, document le plus ancien écarté")
+        if self.config.ES_BULK_ENABLED and not self._get_es_sink().submit(document):
+            logger.warning("File Elasticsearch pleine, document le plus ancien écarté")
+    
+    def check_alerts(self, data, sample_time):
+        """Évalue l'échantillon contre les règles et émet les événements dme_alert"""
+        try:
+            events = self.alert_engine.evaluate(self.device.name if self.device is not None else None, data, sample_time)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'évaluation des alertes: {str(e)}")
+            return []
+        self.emit_alerts(events)
+        return events
+    
+    def emit_alerts(self, events):
+        """Journalise et transmet des événements dme_alert"""
+        from alerts import log_event
+        for event in events:
+            log_event(event)
+            if self.shipping_enabled():
+                self.ship(event)
+    
+    def send_to_logstash(self, data, keyframe=None, sample_time=None):
+        """Envoie les données à Logstash et/ou Elasticsearch si activé (keyframe: None hors mode delta)"""
+        if not self.shipping_enabled() or not data:
             return
         
         try:
             # Conversion des données en format JSON pour Logstash
             logstash_data = {
-                "@timestamp": datetime.now().isoformat(),
+                "@timestamp": (sample_time or datetime.now()).isoformat(),
                 "type": "dme_metrics",
                 "metrics": data
             }
+            if self.device is not None:
+                logstash_data["device"] = self.device.name
+            if keyframe is not None:
+                logstash_data["delta"] = True
+                logstash_data["keyframe"] = keyframe
             
-            # Envoi des données à Logstash via TCP
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((self.config.LOGSTASH_HOST, self.config.LOGSTASH_PORT))
-            sock.sendall(json.dumps(logstash_data).encode() + b'\n')
-            sock.close()
+            # Mise en file vers les sorties persistantes (non bloquant)
+            self.ship(logstash_data)
             
-            logger.info("Données envoyées à Logstash avec succès")
+            logger.debug("Données mises en file pour expédition")
         except Exception as e:
             logger.error(f"Erreur lors de l'envoi des données à Logstash: {str(e)}")
     
     def run_collection_cycle(self):
         """Exécute un cycle complet de collecte, formatage et enregistrement"""
         # Collecte des données
+        started = time.monotonic()
         data = self.collect_data()
+        success = self.process_data(data)
+        if self.metrics:
+            metrics_exporter.CYCLE_DURATION.labels("success" if success else "failure").observe(time.monotonic() - started)
+        return success
+    
+    def process_data(self, data, sample_time=None, alerts=True):
+        """
+        Formate, enregistre et transmet un échantillon collecté (sample_time: instant de la collecte).
+        alerts=False: détection d'anomalies laissée à l'appelant (évaluation par lots).
+        """
         if not data:
             return False
         
+        # Mode delta: seules les variations sont écrites (cellules vides = inchangé)
+        sample_time = sample_time or datetime.now()
+        emitted, keyframe = data, None
+        if self.delta_encoder is not None:
+            # Chaque segment CSV commence par une image complète
+            if self.csv_sink.will_rotate(sample_time):
+                self.delta_encoder.force_keyframe()
+            emitted, keyframe = self.delta_encoder.encode(data)
+        
         # Formatage des données
-        formatted_data = self.format_data(data)
+        formatted_data = self.format_data(emitted, sample_time, missing="" if keyframe is not None else 0)
         if not formatted_data:
             return False
         
         # Enregistrement dans le fichier CSV
         success = self.save_to_csv(formatted_data)
         
-        # Envoi à Logstash si activé
-        if success and self.config.LOGSTASH_ENABLED:
-            self.send_to_logstash(data)
+        # Enregistrement dans le stockage colonnaire si activé
+        if self.ts_store is not None:
+            self.save_to_ts_store(data, sample_time)
+        
+        # Détection d'anomalies sur l'échantillon complet
+        if alerts and self.alert_engine is not None:
+            self.check_alerts(data, sample_time)
+        
+        # Envoi à Logstash / Elasticsearch si activé (rien à envoyer si aucune métrique n'a varié)
+        if success and self.shipping_enabled():
+            self.send_to_logstash(emitted, keyframe, sample_time)
         
         return success
     
+    def create_scheduler(self, interval=None):
+        """Ordonnanceur à cadence fixe de l'équipement (décalage déterministe selon son nom)"""
+        name = self.device.name if self.device is not None else None
+        interval = interval or self.config.COLLECTION_INTERVAL
+        scheduler = FixedRateScheduler(
+            interval,
+            offset=device_offset(name, interval, self.config.COLLECTION_SPREAD),
+            align=self.config.COLLECTION_ALIGN,
+            overrun_policy=self.config.COLLECTION_OVERRUN_POLICY,
+            max_concurrent=self.config.COLLECTION_MAX_CONCURRENT,
+            name=name or "collecte"
+        )
+        if self.metrics:
+            metrics_exporter.track_scheduler(scheduler)
+        return scheduler
+    
     def start_collection(self):
         """Démarre la collecte périodique des données"""
         logger.info(f"Démarrage de la collecte de données DME (intervalle: {self.config.COLLECTION_INTERVAL}s)")
         
-        while True:
-            try:
-                self.run_collection_cycle()
-            except Exception as e:
-                logger.error(f"Erreur lors du cycle de collecte: {str(e)}")
-            
-            # Attente jusqu'au prochain cycle
-            time.sleep(self.config.COLLECTION_INTERVAL)
+        # Cadence fixe: la durée d'un cycle ne décale pas les suivants
+        self.scheduler = self.create_scheduler()
+        self.scheduler.run(self._scheduled_cycle)
+    
+    def _scheduled_cycle(self):
+        self.run_collection_cycle()
+        stats = self.scheduler.snapshot()
+        logger.info(f"Cadence{self.log_suffix}: retard {stats['lag_last_s'] * 1000:.0f} ms (max {stats['lag_max_s'] * 1000:.0f} ms), "
+                    f"{stats['skipped']} échéance(s) sautée(s) sur {stats['ticks']}")
 
 # Point d'entrée principal
 if __name__ == "__main__":
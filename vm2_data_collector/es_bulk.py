@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sortie directe vers l'API _bulk d'Elasticsearch
+Alternative au passage par Logstash pour les sites à fort débit: les documents
+sont enrichis comme dans vm4_logstash/pipeline/dme_pipeline.conf puis indexés
+directement dans les mêmes index (rcms-dme-AAAA.MM.JJ, rcms-dme-alerts-AAAA.MM.JJ).
+
+Les documents sont regroupés par nombre, taille et latence maximale, et
+envoyés par un petit pool de threads disposant chacun d'une connexion HTTP
+persistante (keep-alive). Les éléments rejetés individuellement par
+Elasticsearch (429, 5xx) sont renvoyés avec un backoff exponentiel; les rejets
+définitifs (mapping, 400) sont comptés et journalisés. Comme pour Logstash, la
+file est bornée et la boucle de collecte n'est jamais bloquée; avec un journal
+sur disque (spool.py), rien n'est écarté pendant une indisponibilité, ni
+lorsque la requête entière est refusée (identifiants, droits, URL: 401, 403, 404).
+
+Auteur: arthur
+"""
+
+import ssl
+import json
+import time
+import queue
+import base64
+import random
+import atexit
+import logging
+import threading
+import http.client
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from spool import SpooledDelivery
+
+logger = logging.getLogger("es_bulk")
+
+# Statuts d'élément ou de requête justifiant un nouvel essai
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Sorties partagées, une par URL Elasticsearch
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+class RequestRefused(Exception):
+    """Requête _bulk refusée en bloc (401, 403, 404...): aucun renvoi ne peut aboutir"""
+
+
+def index_name(document, prefix="rcms-dme"):
+    """Index quotidien du document, d'après son @timestamp (comme %{+YYYY.MM.dd} de Logstash)"""
+    day = str(document.get("@timestamp", ""))[:10]
+    try:
+        day = datetime.strptime(day, "%Y-%m-%d").strftime("%Y.%m.%d")
+    except ValueError:
+        day = datetime.utcnow().strftime("%Y.%m.%d")
+    if document.get("type") == "dme_alert":
+        return f"{prefix}-alerts-{day}"
+    return f"{prefix}-{day}"
+
+
+def enrich(document):
+    """Champs ajoutés par le filtre du pipeline Logstash"""
+    document = dict(document)
+    if document.get("type") == "dme_alert":
+        document.setdefault("application", "dme_monitoring")
+        document.setdefault("processed_by", "collector")
+        return document
+    document.setdefault("type", "dme_metrics")
+    document.setdefault("environment", "production")
+    document.setdefault("application", "dme_monitoring")
+    document.setdefault("processed_by", "collector")
+    document.setdefault("processed_at", datetime.utcnow().isoformat() + "Z")
+    if "metrics" not in document:
+        document["tags"] = list(document.get("tags", [])) + ["_data_error"]
+        document["error_reason"] = "missing_metrics_field"
+    return document
+
+
+class ElasticsearchBulkSink:
+    """Indexation asynchrone et groupée via _bulk, connexions persistantes"""
+
+    def __init__(self, url, user=None, password=None, index_prefix="rcms-dme", batch_size=500,
+                 max_bytes=5 * 1024 * 1024, flush_interval=1.0, queue_size=10000, pool_size=2,
+                 timeout=10.0, max_retries=5, backoff_initial=0.5, backoff_max=30.0,
+                 ca_file=None, verify_tls=True, stats_interval=60.0, spool=None, drain_rate=0.0,
+                 raise_on_refusal=False):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"URL Elasticsearch invalide: {url}")
+        self.url = url
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 9200)
+        self.bulk_path = parts.path.rstrip("/") + "/_bulk"
+        self.index_prefix = index_prefix
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stats_interval = stats_interval
+        # Refus d'une requête entière: exception RequestRefused au lieu d'un comptage en rejets (rattrapage)
+        self.raise_on_refusal = raise_on_refusal
+
+        self.headers = {"Content-Type": "application/x-ndjson", "Connection": "keep-alive"}
+        if user:
+            token = base64.b64encode(f"{user}:{password or ''}".encode()).decode()
+            self.headers["Authorization"] = f"Basic {token}"
+        self.ssl_context = None
+        if self.scheme == "https":
+            self.ssl_context = ssl.create_default_context(cafile=ca_file)
+            if not verify_tls:
+                self.ssl_context.check_hostname = False
+                self.ssl_context.verify_mode = ssl.CERT_NONE
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        # Levé à l'expiration du délai de fermeture: les renvois en attente sont abandonnés
+        self.abort_event = threading.Event()
+        self.threads = []
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            "submitted": 0,
+            "indexed": 0,
+            "requests": 0,
+            "connections": 0,
+            "retried": 0,
+            "rejected": 0,
+            "dropped": 0,
+        }
+        self._last_stats_log = time.monotonic()
+        # Callbacks appelés après chaque lot traité: callback(documents, secondes)
+        self.on_send = []
+
+        # Journal sur disque (Spool): envoi et reprise par SpooledDelivery, une connexion par thread
+        self.delivery = None
+        self.local = threading.local()
+        if spool is not None:
+            self.stats.update({"spooled": 0, "drained": 0, "evicted": 0, "corrupt": 0})
+            self.delivery = SpooledDelivery(
+                spool, self._encode, self._deliver, self._count, f"elasticsearch-{self.host}:{self.port}",
+                batch_size=batch_size, max_bytes=max_bytes, flush_interval=flush_interval, queue_size=queue_size,
+                drain_rate=drain_rate, backoff_initial=backoff_initial, backoff_max=backoff_max,
+                log_stats=self.log_stats, stats_interval=stats_interval
+            )
+            self.queue = self.delivery.queue
+
+    def _count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def start(self):
+        """Démarre le pool de threads d'envoi"""
+        if self.delivery is not None:
+            self.delivery.start()
+        elif not self.threads:
+            for worker in range(self.pool_size):
+                thread = threading.Thread(target=self._run, name=f"es-bulk-{worker}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+            logger.info(f"Sortie Elasticsearch _bulk démarrée vers {self.url} ({self.pool_size} connexions, "
+                        f"lot {self.batch_size}, latence max {self.flush_interval}s)")
+        return self
+
+    def submit(self, document):
+        """Ajoute un document sans bloquer; le plus ancien est écarté si la file est pleine"""
+        self._count("submitted")
+        if self.delivery is not None:
+            return self.delivery.submit(document)
+        try:
+            self.queue.put_nowait(document)
+            return True
+        except queue.Full:
+            pass
+        try:
+            self.queue.get_nowait()
+            self._count("dropped")
+        except queue.Empty:
+            pass
+        try:
+            self.queue.put_nowait(document)
+        except queue.Full:
+            self._count("dropped")
+        return False
+
+    def put(self, document, timeout=None):
+        """Ajoute un document en attendant qu'une place se libère (rejeu d'historique: rien n'est écarté)"""
+        if self.delivery is not None:
+            self._count("submitted")
+            self.delivery.submit(document)
+            return
+        self.queue.put(document, timeout=timeout)
+        self._count("submitted")
+
+    def close(self, timeout=5.0):
+        """Vide la file (dans la limite du délai) puis arrête les threads"""
+        if self.delivery is not None:
+            self.delivery.close(timeout)
+            self.log_stats()
+            return
+        if not self.threads:
+            return
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self.abort_event.set()
+        for thread in self.threads:
+            thread.join(1.0)
+        self.log_stats()
+
+    def log_stats(self):
+        """Journalise les compteurs d'indexation"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        spool = ""
+        if self.delivery is not None:
+            spool = (f", journal: {stats['drained']} repris, {stats['evicted']} perdus (quota), "
+                     f"{self.delivery.spool.pending_bytes()} octets en attente")
+        logger.info(
+            f"Elasticsearch {self.url}: {stats['indexed']} documents indexés en {stats['requests']} requêtes "
+            f"({stats['connections']} connexions), {stats['retried']} renvois, {stats['rejected']} rejets, "
+            f"{stats['dropped']} documents écartés, file {self.queue.qsize()}{spool}"
+        )
+
+    def _next_batch(self):
+        """Attend le premier document puis complète le lot (nombre, taille, latence)"""
+        try:
+            first = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [self._encode(first)]
+        size = len(batch[0])
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and size < self.max_bytes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._encode(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item)
+        return batch
+
+    def _encode(self, document):
+        """Ligne d'action et document NDJSON prêts à l'envoi"""
+        document = enrich(document)
+        action = {"index": {"_index": index_name(document, self.index_prefix)}}
+        return (json.dumps(action) + "\n" + json.dumps(document) + "\n").encode()
+
+    def _connect(self):
+        if self.scheme == "https":
+            connection = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self.ssl_context)
+        else:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self._count("connections")
+        return connection
+
+    def _post(self, connection, body):
+        """Envoie une requête _bulk; retourne (connexion, statut, réponse décodée)"""
+        for attempt in range(2):
+            if connection is None:
+                connection = self._connect()
+            try:
+                connection.request("POST", self.bulk_path, body=body, headers=self.headers)
+                response = connection.getresponse()
+                payload = response.read()
+                self._count("requests")
+                if response.getheader("Connection", "").lower() == "close":
+                    connection.close()
+                    connection = None
+                try:
+                    return connection, response.status, json.loads(payload) if payload else {}
+                except ValueError:
+                    return connection, response.status, {}
+            except (http.client.HTTPException, OSError):
+                # Connexion persistante fermée par le serveur: un seul nouvel essai immédiat
+                if connection is not None:
+                    connection.close()
+                connection = None
+                if attempt:
+                    raise
+        return connection, None, {}
+
+    def _send(self, connection, batch):
+        """
+        Indexe un lot, en renvoyant les éléments rejetés de façon transitoire.
+
+        Retourne la connexion (éventuellement recréée). Avec raise_on_refusal, un
+        refus de la requête entière lève RequestRefused.
+        """
+        backoff = self.backoff_initial
+        pending = batch
+        retries = 0
+        while pending:
+            try:
+                connection, status, response = self._post(connection, b"".join(pending))
+            except (http.client.HTTPException, OSError) as e:
+                connection, status, response = None, None, {}
+                logger.error(f"Erreur de connexion à Elasticsearch: {str(e)} (nouvel essai dans {backoff:.1f}s)")
+
+            if status == 413 and len(pending) > 1:
+                # Requête trop volumineuse: découpage en deux
+                middle = len(pending) // 2
+                connection = self._send(connection, pending[:middle])
+                pending = pending[middle:]
+                continue
+
+            if status is not None and 200 <= status < 300:
+                retry = self._item_retries(response, pending)
+                if not retry:
+                    return connection
+                self._count("retried", len(retry))
+                pending = retry
+            elif status is not None and status not in RETRY_STATUSES and status < 500:
+                if self.raise_on_refusal:
+                    raise RequestRefused(f"Requête _bulk refusée par Elasticsearch ({status}): {response.get('error')}")
+                self._count("rejected", len(pending))
+                logger.error(f"Requête _bulk refusée par Elasticsearch ({status}): {response.get('error')}")
+                return connection
+
+            retries += 1
+            if retries > self.max_retries:
+                self._count("dropped", len(pending))
+                logger.error(f"{len(pending)} documents abandonnés après {self.max_retries} renvois")
+                return connection
+            if self.abort_event.wait(backoff * random.uniform(0.8, 1.2)):
+                self._count("dropped", len(pending))
+                return connection
+            backoff = min(self.backoff_max, backoff * 2)
+        return connection
+
+    def _item_retries(self, response, pending):
+        """Compte les éléments indexés ou rejetés d'une réponse _bulk; retourne les éléments à renvoyer"""
+        retry = []
+        items = response.get("items", [])
+        for item, line in zip(items, pending):
+            result = next(iter(item.values()), {})
+            item_status = result.get("status", 500)
+            if item_status < 300:
+                self._count("indexed")
+            elif item_status in RETRY_STATUSES or item_status >= 500:
+                retry.append(line)
+            else:
+                self._count("rejected")
+                logger.error(f"Document rejeté par Elasticsearch ({item_status}): {result.get('error')}")
+        if len(items) < len(pending):
+            retry.extend(pending[len(items):])
+        return retry
+
+    def _deliver(self, pending):
+        """Un seul essai d'indexation d'un lot déjà encodé (journal sur disque); retourne les éléments à renvoyer"""
+        started = time.monotonic()
+        try:
+            self.local.connection, status, response = self._post(getattr(self.local, "connection", None), b"".join(pending))
+        except (http.client.HTTPException, OSError) as e:
+            self.local.connection = None
+            logger.error(f"Erreur de connexion à Elasticsearch: {str(e)}")
+            return pending
+
+        if status == 413 and len(pending) > 1:
+            middle = len(pending) // 2
+            return self._deliver(pending[:middle]) + self._deliver(pending[middle:])
+        if status is not None and 200 <= status < 300:
+            retry = self._item_retries(response, pending)
+        elif status == 413:
+            # Document seul trop volumineux: aucun renvoi ne peut aboutir
+            self._count("rejected", len(pending))
+            logger.error(f"Document rejeté par Elasticsearch (413): {response.get('error')}")
+            retry = []
+        elif status is not None and status not in RETRY_STATUSES and status < 500:
+            # Refus de la requête entière (identifiants, droits, URL): le lot reste dans le journal
+            logger.error(f"Requête _bulk refusée par Elasticsearch ({status}): {response.get('error')}; "
+                         f"{len(pending)} documents conservés dans le journal")
+            retry = pending
+        else:
+            retry = pending
+        if retry:
+            self._count("retried", len(retry))
+        elapsed = time.monotonic() - started
+        for callback in self.on_send:
+            callback(len(pending) - len(retry), elapsed)
+        return retry
+
+    def _run(self):
+        connection = None
+        while not (self.stop_event.is_set() and self.queue.empty()) and not self.abort_event.is_set():
+            batch = self._next_batch()
+            if batch:
+                started = time.monotonic()
+                connection = self._send(connection, batch)
+                elapsed = time.monotonic() - started
+                for callback in self.on_send:
+                    callback(len(batch), elapsed)
+
+            if time.monotonic() - self._last_stats_log >= self.stats_interval:
+                self._last_stats_log = time.monotonic()
+                self.log_stats()
+        if connection is not None:
+            connection.close()
+
+
+def get_bulk_sink(url, **options):
+    """Retourne la sortie _bulk partagée pour une URL, démarrée à la première demande"""
+    with _sinks_lock:
+        sink = _sinks.get(url)
+        if sink is None:
+            sink = ElasticsearchBulkSink(url, **options).start()
+            _sinks[url] = sink
+    return sink
+
+
+@atexit.register
+def _close_sinks():
+    for sink in list(_sinks.values()):
+        sink.close()
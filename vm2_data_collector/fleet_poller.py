@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Collecteur DME en mode flotte (asyncio)
+Un seul processus interroge en parallèle toutes les stations DME décrites dans
+un inventaire JSON, avec un nombre borné de requêtes SNMPv3 simultanées, et
+alimente les mêmes sorties que DMECollector (CSV, Logstash) pour chaque station.
+
+Format de l'inventaire:
+{
+    "defaults": {"port": 161, "user": "dmeuser", "auth_password": "...", "priv_password": "..."},
+    "profiles": {"txpb": ["mtuExecTXPBDelayCurrentValue-0", "1.3.6.1.4.1.32275.2.1.2.2.8.34"]},
+    "devices": [
+        {"name": "dme-nord", "host": "10.0.1.10"},
+        {"name": "dme-sud", "host": "10.0.2.10", "profile": "txpb"}
+    ]
+}
+
+Auteur: arthur
+"""
+
+import sys
+import json
+import time
+import asyncio
+import logging
+import resource
+
+from dme_collector_snmpv3 import Config, DMECollector, OID_LIST, REGISTRY, logger as collector_logger
+from snmp_batch import BatchedGet
+from scheduler import aggregate_stats
+from snmp_session import usm_user_data, is_usm_failure
+import metrics_exporter
+
+logger = logging.getLogger("fleet_poller")
+
+# Paramètres par défaut d'un équipement (repris de la configuration du collecteur)
+DEVICE_DEFAULTS = {
+    "port": Config.SNMP_PORT,
+    "user": Config.SNMP_USER,
+    "auth_protocol": Config.SNMP_AUTH_PROTOCOL,
+    "auth_password": Config.SNMP_AUTH_PASSWORD,
+    "priv_protocol": Config.SNMP_PRIV_PROTOCOL,
+    "priv_password": Config.SNMP_PRIV_PASSWORD,
+    "context": Config.SNMP_CONTEXT,
+    "profile": "default",
+}
+
+
+class DeviceSpec:
+    """Description d'une station DME de l'inventaire"""
+
+    def __init__(self, name, host, port, user, auth_protocol, auth_password,
+                 priv_protocol, priv_password, context, profile, oids):
+        self.name = name
+        self.host = host
+        self.port = int(port)
+        self.user = user
+        self.auth_protocol = auth_protocol
+        self.auth_password = auth_password
+        self.priv_protocol = priv_protocol
+        self.priv_password = priv_password
+        self.context = context
+        self.profile = profile
+        self.oids = oids
+
+    def __repr__(self):
+        return f"DeviceSpec({self.name}, {self.host}:{self.port}, profil={self.profile})"
+
+
+def load_inventory(path):
+    """Charge l'inventaire JSON et retourne la liste des DeviceSpec"""
+    with open(path, 'r') as f:
+        inventory = json.load(f)
+
+    defaults = dict(DEVICE_DEFAULTS)
+    defaults.update(inventory.get("defaults", {}))
+
+    profiles = {"default": list(OID_LIST)}
+    for name, entries in inventory.get("profiles", {}).items():
+        profiles[name] = REGISTRY.resolve(entries)
+
+    devices = []
+    names = set()
+    for entry in inventory.get("devices", []):
+        params = dict(defaults)
+        params.update(entry)
+        if "name" not in params or "host" not in params:
+            raise ValueError(f"Équipement sans 'name' ou 'host' dans l'inventaire: {entry}")
+        if params["name"] in names:
+            raise ValueError(f"Nom d'équipement dupliqué dans l'inventaire: {params['name']}")
+        if params["profile"] not in profiles:
+            raise ValueError(f"Profil OID inconnu pour {params['name']}: {params['profile']}")
+        names.add(params["name"])
+        devices.append(DeviceSpec(
+            name=params["name"],
+            host=params["host"],
+            port=params["port"],
+            user=params["user"],
+            auth_protocol=params["auth_protocol"],
+            auth_password=params["auth_password"],
+            priv_protocol=params["priv_protocol"],
+            priv_password=params["priv_password"],
+            context=params["context"],
+            profile=params["profile"],
+            oids=profiles[params["profile"]],
+        ))
+
+    logger.info(f"Inventaire chargé: {len(devices)} équipements, {len(profiles)} profils OID")
+    return devices
+
+
+class SnmpAsyncFetcher:
+    """Interrogation SNMPv3 asynchrone d'un équipement via l'API asyncio de pysnmp"""
+
+    def __init__(self, config):
+        from pysnmp.hlapi import asyncio as hlapi
+        from mib_cache import snmp_engine
+
+        self.hlapi = hlapi
+        self.config = config
+        # Un seul moteur SNMP pour toute la flotte (modules MIB compilés en cache)
+        self.snmp_engine = snmp_engine(config.MIB_CACHE_DIR)
+        self._auth = {}
+        self._targets = {}
+
+    def _auth_data(self, device):
+        """UsmUserData construit une seule fois par équipement, à partir des clés maîtresses en cache"""
+        auth = self._auth.get(device.name)
+        if auth is None:
+            auth = usm_user_data(
+                device.user,
+                device.auth_protocol,
+                device.auth_password,
+                device.priv_protocol,
+                device.priv_password
+            )
+            self._auth[device.name] = auth
+        return auth
+
+    def _invalidate(self, device, reason):
+        """Retire l'utilisateur USM de l'équipement du moteur: clés relocalisées à la requête suivante"""
+        logger.warning(f"État USM réinitialisé [{device.name}]: {reason}")
+        auth = self._auth.pop(device.name, None)
+        if auth is not None:
+            from pysnmp.hlapi.asyncio.cmdgen import lcd
+            try:
+                lcd.unconfigure(self.snmp_engine, auth)
+            except Exception as e:
+                logger.debug(f"Retrait de l'utilisateur USM impossible [{device.name}]: {str(e)}")
+
+    def _target(self, device, timeout, retries):
+        """Cible UDP construite une seule fois par équipement et délai (délais arrondis, en nombre borné)"""
+        key = (device.name, timeout, retries)
+        target = self._targets.get(key)
+        if target is None:
+            target = self.hlapi.UdpTransportTarget((device.host, device.port), timeout=timeout, retries=retries)
+            self._targets[key] = target
+        return target
+
+    async def fetch(self, device, collector):
+        """Collecte les OIDs du profil de l'équipement, par lots de taille bornée"""
+        hlapi = self.hlapi
+        max_varbinds = self.config.SNMP_MAX_VARBINDS if self.config.SNMP_BATCH_MODE else 1
+        request = BatchedGet(device.oids, collector.snmp_max_msg_size, max_varbinds, fail_fast=self.config.SNMP_ADAPTIVE_TIMEOUT)
+        context = hlapi.ContextData(contextName=device.context)
+        target = self._target(device, *collector.snmp_timeout())
+        identities = REGISTRY.object_identities()
+        started = time.monotonic()
+
+        while True:
+            batch = request.next_batch()
+            if batch is None:
+                break
+            sent = time.monotonic()
+            error_indication, error_status, error_index, var_binds = await hlapi.getCmd(
+                self.snmp_engine,
+                self._auth_data(device),
+                target,
+                context,
+                *[hlapi.ObjectType(identities[oid]) for oid in batch],
+                lookupMib=False
+            )
+            request.handle_response(batch, error_indication, error_status, error_index, var_binds, time.monotonic() - sent)
+            if error_indication and is_usm_failure(error_indication):
+                self._invalidate(device, error_indication)
+
+        return collector.collect_result(request, time.monotonic() - started)
+
+
+class FleetPoller:
+    """Interroge toutes les stations de l'inventaire en parallèle à intervalle fixe"""
+
+    def __init__(self, devices, max_in_flight=None, interval=None, fetch=None, outputs=True):
+        self.config = Config()
+        self.devices = devices
+        self.max_in_flight = max_in_flight or self.config.FLEET_MAX_IN_FLIGHT
+        self.interval = interval or self.config.COLLECTION_INTERVAL
+        self.collectors = {device.name: DMECollector(device=device, outputs=outputs) for device in devices}
+        # fetch(device, collector) -> coroutine retournant le dictionnaire nom -> valeur
+        self.fetch = fetch or SnmpAsyncFetcher(self.config).fetch
+        self.cycles = 0
+        # Ordonnanceurs par équipement (run_forever)
+        self.schedulers = []
+
+    async def poll_device(self, device, semaphore):
+        """Collecte un équipement puis alimente ses sorties"""
+        collector = self.collectors[device.name]
+        # Équipement en panne: ignoré sans occuper de place parmi les requêtes simultanées
+        if not collector.admit():
+            return False
+        started = time.monotonic()
+        async with semaphore:
+            try:
+                data = await self.fetch(device, collector)
+            except Exception as e:
+                logger.error(f"Erreur SNMP asynchrone [{device.name}]: {str(e)}")
+                if collector.metrics:
+                    metrics_exporter.SNMP_ERRORS.labels("exception").inc()
+                data = None
+        collector.record_collection("snmp", data)
+
+        loop = asyncio.get_running_loop()
+        if not data:
+            # Repli HTTP identique au mode mono-équipement, hors boucle asyncio (pool de connexions partagé)
+            logger.warning(f"Collecte SNMPv3 échouée [{device.name}], tentative via HTTP...")
+            if collector.metrics:
+                metrics_exporter.HTTP_FALLBACKS.inc()
+            data = await loop.run_in_executor(None, collector.collect_data_http)
+            collector.record_collection("http", data)
+        collector.record_outcome(data)
+
+        # Les sorties (fichier, TCP) sont bloquantes: exécutées dans le pool de threads
+        success = await loop.run_in_executor(None, self.process, device, collector, data)
+        if collector.metrics:
+            metrics_exporter.CYCLE_DURATION.labels("success" if success else "failure").observe(time.monotonic() - started)
+        return success
+
+    def process(self, device, collector, data):
+        """Enregistre et transmet l'échantillon d'un équipement (sorties du collecteur)"""
+        return collector.process_data(data)
+
+    async def run_cycle(self):
+        """Exécute un cycle de collecte sur toute la flotte"""
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        started = time.monotonic()
+        results = await asyncio.gather(
+            *[self.poll_device(device, semaphore) for device in self.devices],
+            return_exceptions=True
+        )
+        elapsed = time.monotonic() - started
+        succeeded = sum(1 for result in results if result is True)
+        self.cycles += 1
+        logger.info(f"Cycle flotte {self.cycles}: {succeeded}/{len(self.devices)} équipements collectés en {elapsed:.2f}s")
+        return succeeded
+
+    async def run_forever(self):
+        """Collecte périodique: chaque équipement suit sa propre cadence fixe, décalée dans la période"""
+        logger.info(f"Démarrage du mode flotte: {len(self.devices)} équipements, {self.max_in_flight} requêtes simultanées max, intervalle {self.interval}s")
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.schedulers = [self.collectors[device.name].create_scheduler(self.interval) for device in self.devices]
+        jobs = [
+            scheduler.run_async(lambda device=device: self.poll_device(device, semaphore))
+            for device, scheduler in zip(self.devices, self.schedulers)
+        ]
+        await asyncio.gather(self._log_schedule_stats(), *jobs)
+
+    async def _log_schedule_stats(self):
+        """Journalise à chaque période le retard et les échéances sautées de la flotte"""
+        while True:
+            await asyncio.sleep(self.interval)
+            stats = aggregate_stats(self.schedulers)
+            logger.info(
+                f"Cadence flotte: {stats['runs']} collectes, retard moyen {stats['lag_avg_s'] * 1000:.0f} ms "
+                f"(max {stats['lag_max_s'] * 1000:.0f} ms), {stats['skipped']} échéance(s) sautée(s), "
+                f"{stats['running']} en cours"
+            )
+
+
+def raise_open_files_limit():
+    """Relève la limite de descripteurs ouverts (un fichier CSV ouvert par équipement)"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        logger.info(f"Limite de fichiers ouverts relevée de {soft} à {hard}")
+
+
+# Point d'entrée principal
+if __name__ == "__main__":
+    inventory_path = sys.argv[1] if len(sys.argv) > 1 else Config.FLEET_INVENTORY
+    if not inventory_path:
+        collector_logger.critical("Aucun inventaire fourni (argument ou variable FLEET_INVENTORY)")
+        exit(1)
+    try:
+        raise_open_files_limit()
+        poller = FleetPoller(load_inventory(inventory_path))
+        asyncio.run(poller.run_forever())
+    except KeyboardInterrupt:
+        logger.info("Collecte flotte interrompue par l'utilisateur")
+    except Exception as e:
+        logger.critical(f"Erreur critique: {str(e)}")
+        exit(1)
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Requêtes par plage temporelle sur l'historique CSV du collecteur
+Un index creux (horodatage -> position en octets) est tenu à côté de chaque
+fichier de données (<fichier>.idx). Une requête ne lit que les segments dont
+la période recoupe la fenêtre demandée, se positionne directement au plus
+proche point d'index et ne décode que les colonnes demandées.
+
+L'index est mis à jour de façon incrémentale: seuls les octets ajoutés depuis
+la dernière indexation sont parcourus. Le collecteur le met à jour à chaque
+flush du fichier CSV et le renomme avec le segment lors des rotations. Une
+requête ne l'écrit jamais: elle complète en mémoire l'index enregistré (ou le
+construit entièrement s'il est absent ou illisible), ce qui permet d'interroger
+un répertoire en lecture seule.
+
+Exemple:
+    python history_query.py --file /app/data/dme_data.csv --device dme-nord \\
+        --start "2025-06-02 14:00" --end "2025-06-02 14:20" \\
+        --columns "mtuExecTXPBDelayCurrentValue-*"
+
+Auteur: arthur
+"""
+
+import os
+import sys
+import gzip
+import time
+import fcntl
+import struct
+import bisect
+import fnmatch
+import logging
+import argparse
+from datetime import datetime
+
+from csv_sink import list_segments
+
+logger = logging.getLogger("history_query")
+
+INDEX_MAGIC = b"DMEIDX1\0"
+# magic, inode, octets indexés, lignes depuis le dernier point, dernier horodatage (ms)
+INDEX_HEADER = struct.Struct("<8sqqqq")
+INDEX_ENTRY = struct.Struct("<qq")
+# Un point d'index toutes les INDEX_EVERY lignes
+INDEX_EVERY = 256
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def timestamp_ms(text):
+    """Horodatage CSV -> millisecondes epoch"""
+    return int(datetime.strptime(text, TIMESTAMP_FORMAT).timestamp() * 1000)
+
+
+def index_path(data_path):
+    return data_path + ".idx"
+
+
+def _open_data(path):
+    """Ouvre un fichier de données en binaire (décompression transparente des segments .gz)"""
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+class SparseIndex:
+    """Index creux d'un fichier de données CSV"""
+
+    def __init__(self, data_path, every=INDEX_EVERY):
+        self.data_path = data_path
+        self.path = index_path(data_path)
+        self.every = every
+        self.entries_ts = []
+        self.entries_offset = []
+        self.indexed_bytes = 0
+        self.rows_since_entry = 0
+        self.last_ts = None
+
+    def _inode(self):
+        # Un segment compressé est immuable: pas de contrôle d'inode
+        if self.data_path.endswith(".gz"):
+            return 0
+        return os.stat(self.data_path).st_ino
+
+    def _adopt_uncompressed_index(self):
+        """Reprend l'index du segment non compressé (mêmes positions dans le flux décompressé)"""
+        if self.data_path.endswith(".gz") and not os.path.exists(self.path):
+            plain_index = index_path(self.data_path[:-3])
+            if os.path.exists(plain_index):
+                try:
+                    os.replace(plain_index, self.path)
+                except OSError:
+                    pass
+
+    def _reset(self):
+        self.entries_ts = []
+        self.entries_offset = []
+        self.indexed_bytes = 0
+        self.rows_since_entry = 0
+        self.last_ts = None
+
+    def _load(self, f):
+        f.seek(0)
+        raw = f.read()
+        self._reset()
+        if len(raw) < INDEX_HEADER.size:
+            return False
+        magic, inode, indexed_bytes, rows_since_entry, last_ts = INDEX_HEADER.unpack_from(raw)
+        # Segment compressé: index hérité du segment non compressé (inode d'origine, non vérifiable)
+        if magic != INDEX_MAGIC or (not self.data_path.endswith(".gz") and inode != self._inode()):
+            return False
+        for offset in range(INDEX_HEADER.size, len(raw) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size):
+            ts, position = INDEX_ENTRY.unpack_from(raw, offset)
+            self.entries_ts.append(ts)
+            self.entries_offset.append(position)
+        self.indexed_bytes = indexed_bytes
+        self.rows_since_entry = rows_since_entry
+        self.last_ts = last_ts if self.entries_ts else None
+        return True
+
+    def _scan(self):
+        """Indexe en mémoire les lignes ajoutées depuis indexed_bytes; retourne les nouveaux points"""
+        if not self.data_path.endswith(".gz") and os.path.getsize(self.data_path) < self.indexed_bytes:
+            raise ValueError(f"Fichier tronqué depuis l'indexation: {self.data_path}")
+
+        new_entries = []
+        last_line = None
+        with _open_data(self.data_path) as data:
+            position = self.indexed_bytes
+            data.seek(position)
+            if position == 0:
+                # Saut de la ligne d'en-tête
+                header = data.readline()
+                if not header.endswith(b"\n"):
+                    return new_entries
+                position += len(header)
+            for line in data:
+                # Ligne partielle en cours d'écriture: reprise au prochain passage
+                if not line.endswith(b"\n"):
+                    break
+                if line.strip():
+                    # Horodatage analysé seulement pour les points d'index et la dernière ligne
+                    if not self.entries_ts or self.rows_since_entry >= self.every:
+                        ts = timestamp_ms(line.split(b"\t", 1)[0].decode())
+                        new_entries.append((ts, position))
+                        self.entries_ts.append(ts)
+                        self.entries_offset.append(position)
+                        self.rows_since_entry = 0
+                    self.rows_since_entry += 1
+                    last_line = line
+                position += len(line)
+            self.indexed_bytes = position
+        if last_line is not None:
+            self.last_ts = timestamp_ms(last_line.split(b"\t", 1)[0].decode())
+        return new_entries
+
+    def load(self):
+        """
+        Charge l'index enregistré sans le modifier: le sien, sinon celui du segment
+        avant compression (mêmes positions dans le flux décompressé).
+        Retourne False (index vide) s'il est absent, illisible ou périmé.
+        """
+        candidates = [self.path]
+        if self.data_path.endswith(".gz"):
+            candidates.append(index_path(self.data_path[:-3]))
+        for candidate in candidates:
+            try:
+                with open(candidate, 'rb') as f:
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                    try:
+                        if self._load(f):
+                            return True
+                    finally:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            except OSError:
+                continue
+        self._reset()
+        return False
+
+    def refresh(self):
+        """
+        Index à jour pour une lecture: index enregistré complété en mémoire par les
+        lignes ajoutées depuis. Rien n'est écrit (répertoire en lecture seule possible):
+        seul le collecteur enregistre l'index (update, à chaque flush).
+        """
+        self.load()
+        try:
+            self._scan()
+        except ValueError:
+            # Fichier tronqué depuis l'indexation: index reconstruit en mémoire
+            self._reset()
+            self._scan()
+        return self
+
+    def update(self):
+        """Indexe les lignes ajoutées depuis la dernière mise à jour et enregistre l'index"""
+        self._adopt_uncompressed_index()
+        # Lecture/écriture sans O_APPEND: l'en-tête est réécrit en place
+        with os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if not self._load(f):
+                    # Index absent, corrompu ou fichier remplacé: reconstruction complète
+                    f.seek(0)
+                    f.truncate()
+                    f.write(INDEX_HEADER.pack(INDEX_MAGIC, self._inode(), 0, 0, 0))
+
+                new_entries = self._scan()
+                f.seek(0, os.SEEK_END)
+                for entry in new_entries:
+                    f.write(INDEX_ENTRY.pack(*entry))
+                f.seek(0)
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, self._inode(), self.indexed_bytes, self.rows_since_entry, self.last_ts or 0))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return self
+
+    def first_ts(self):
+        return self.entries_ts[0] if self.entries_ts else None
+
+    def seek_offset(self, start_ms, back=0):
+        """Position du dernier point d'index antérieur ou égal à start_ms (reculée de back points)"""
+        if start_ms is None or not self.entries_ts:
+            return self.entries_offset[0] if self.entries_offset else 0
+        position = bisect.bisect_right(self.entries_ts, start_ms) - 1 - back
+        return self.entries_offset[max(0, position)]
+
+
+def rename_index(old_path, new_path):
+    """Suit la rotation d'un fichier de données (callback RotatingCSVSink.on_rotate)"""
+    if os.path.exists(index_path(old_path)):
+        os.replace(index_path(old_path), index_path(new_path))
+
+
+def remove_index(data_path):
+    """Supprime l'index d'un segment supprimé (callback RotatingCSVSink.on_remove)"""
+    candidates = [index_path(data_path)]
+    if data_path.endswith(".gz"):
+        candidates.append(index_path(data_path[:-3]))
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            os.remove(candidate)
+
+
+def update_index(data_path):
+    """Met à jour l'index d'un fichier (callback RotatingCSVSink.on_flush)"""
+    try:
+        SparseIndex(data_path).update()
+    except Exception as e:
+        logger.error(f"Erreur lors de la mise à jour de l'index {index_path(data_path)}: {str(e)}")
+
+
+def attach_index(sink):
+    """Maintient l'index d'un RotatingCSVSink à jour (flush et rotations)"""
+    sink.on_flush.append(update_index)
+    sink.on_rotate.append(rename_index)
+    sink.on_remove.append(remove_index)
+    update_index(sink.path)
+
+
+def data_files(base_path):
+    """Segments fermés puis fichier courant, dans l'ordre chronologique"""
+    files = list_segments(base_path)
+    if os.path.isfile(base_path):
+        files.append(base_path)
+    return files
+
+
+def _select_columns(header, patterns):
+    """Indices des colonnes correspondant aux motifs (noms exacts ou jokers)"""
+    if not patterns:
+        return list(range(1, len(header)))
+    selected = []
+    for index, name in enumerate(header[1:], start=1):
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns):
+            selected.append(index)
+    return selected
+
+
+def query(base_path, start=None, end=None, columns=None, fill=False, fill_window=INDEX_EVERY):
+    """
+    Génère l'en-tête puis les lignes [horodatage, valeurs...] de la fenêtre [start, end].
+
+    start et end sont des datetime (ou None pour une borne ouverte), columns une
+    liste de noms ou de motifs fnmatch. Avec fill, les cellules vides d'un fichier
+    écrit en mode delta sont complétées par la dernière valeur connue; la lecture
+    commence alors fill_window lignes plus tôt (au moins l'intervalle de keyframe).
+    """
+    start_ms = int(start.timestamp() * 1000) if start else None
+    end_ms = int(end.timestamp() * 1000) if end else None
+    start_text = start.strftime(TIMESTAMP_FORMAT)[:-4] if start else None
+    end_text = end.strftime(TIMESTAMP_FORMAT)[:-4] if end else None
+    header_sent = False
+
+    for path in data_files(base_path):
+        # Lecture seule: l'index enregistré par le collecteur est complété en mémoire
+        index = SparseIndex(path).refresh()
+        if index.first_ts() is None:
+            continue
+        if start_ms is not None and index.last_ts < start_ms:
+            continue
+        if end_ms is not None and index.first_ts() > end_ms:
+            continue
+
+        with _open_data(path) as data:
+            header = data.readline().decode().rstrip("\r\n").split("\t")
+            selected = _select_columns(header, columns)
+            if not header_sent:
+                yield [header[0]] + [header[i] for i in selected]
+                header_sent = True
+
+            # Chaque segment commence par une keyframe: l'état repart de zéro
+            back = -(-fill_window // index.every) if fill else 0
+            state = [""] * len(header)
+            data.seek(index.seek_offset(start_ms, back))
+            remaining = index.indexed_bytes - data.tell()
+            for line in data:
+                if remaining <= 0:
+                    break
+                remaining -= len(line)
+                fields = line.decode().rstrip("\r\n").split("\t")
+                if fill:
+                    for i in selected:
+                        if fields[i] != "":
+                            state[i] = fields[i]
+                        else:
+                            fields[i] = state[i]
+                # Horodatages de largeur fixe: comparaison lexicographique sans décodage
+                timestamp = fields[0]
+                if start_text and timestamp < start_text:
+                    continue
+                if end_text and timestamp > end_text:
+                    break
+                yield [timestamp] + [fields[i] for i in selected]
+
+
+def _parse_bound(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Requête par plage temporelle sur l'historique CSV DME")
+    parser.add_argument("--file", default=os.environ.get("OUTPUT_FILE", "dme_data.csv"), help="Fichier de sortie du collecteur")
+    parser.add_argument("--device", help="Équipement (mode flotte): fichier <base>_<équipement>.csv")
+    parser.add_argument("--start", help="Début (AAAA-MM-JJ HH:MM[:SS])")
+    parser.add_argument("--end", help="Fin (AAAA-MM-JJ HH:MM[:SS])")
+    parser.add_argument("--columns", help="Colonnes séparées par des virgules (jokers autorisés)")
+    parser.add_argument("--fill", action="store_true", help="Complète les cellules vides (fichiers écrits en mode delta)")
+    args = parser.parse_args()
+
+    base_path = args.file
+    if args.device:
+        base, ext = os.path.splitext(base_path)
+        base_path = f"{base}_{args.device}{ext}"
+    columns = [column.strip() for column in args.columns.split(",")] if args.columns else None
+
+    started = time.perf_counter()
+    rows = 0
+    for row in query(base_path, _parse_bound(args.start), _parse_bound(args.end), columns, fill=args.fill):
+        sys.stdout.write("\t".join(row) + "\n")
+        rows += 1
+    logger.info(f"{max(0, rows - 1)} lignes retournées en {time.perf_counter() - started:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Client HTTP de repli (remplace l'appel à curl)
+Lorsque la collecte SNMPv3 échoue, le collecteur interroge l'API HTTP /all du
+simulateur. Le client est interne au processus: pas de fork par cycle, pas
+d'identifiants sur la ligne de commande (authentification Basic en en-tête).
+
+Chaque hôte dispose d'un petit pool de connexions persistantes (keep-alive),
+partagé par tous les équipements et threads du processus; plusieurs requêtes
+vers un même hôte peuvent être en cours simultanément, dans la limite du pool.
+La réponse {"data": {nom: valeur, ...}} est décodée au fil de la lecture, par
+blocs, sans charger le corps entier en mémoire.
+
+Auteur: arthur
+"""
+
+import json
+import queue
+import base64
+import codecs
+import logging
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("http_fallback")
+
+WHITESPACE = " \t\n\r"
+NUMBER_CONTINUATION = "0123456789.eE+-"
+
+# Clients partagés, un par (port, identifiants)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class _StreamReader:
+    """Tampon de texte alimenté par blocs depuis un flux binaire (read(n))"""
+
+    def __init__(self, read, chunk_size):
+        self.read = read
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def fill(self):
+        """Lit le bloc suivant; retourne False en fin de flux"""
+        if self.eof:
+            return False
+        chunk = self.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buffer = self.buffer[self.position:] + self.decoder.decode(b"", final=True)
+            self.position = 0
+            return False
+        self.buffer = self.buffer[self.position:] + self.decoder.decode(chunk)
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Premier caractère significatif (espaces ignorés)"""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                raise ValueError("Fin de flux JSON inattendue")
+
+    def expect(self, character):
+        if self.peek() != character:
+            raise ValueError(f"JSON invalide: '{character}' attendu, '{self.buffer[self.position]}' trouvé")
+        self.position += 1
+
+    def value(self, decoder):
+        """Décode une valeur JSON complète, en lisant d'autres blocs si elle est tronquée"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+            # Un nombre coupé en fin de tampon ("12" pour "12.5e3") se poursuit dans le bloc suivant
+            if isinstance(value, (int, float)) and not self.eof and \
+                    (end == len(self.buffer) or self.buffer[end] in NUMBER_CONTINUATION):
+                self.fill()
+                continue
+            self.position = end
+            return value
+
+
+def iter_object_items(read, key="data", chunk_size=16384):
+    """
+    Parcourt au fil de l'eau l'objet associé à key dans un document JSON
+    {"...": ..., key: {nom: valeur, ...}} et produit les paires (nom, valeur).
+
+    read(n) est la méthode de lecture du flux (réponse HTTP, fichier binaire).
+    Les autres membres de premier niveau sont décodés puis ignorés.
+    """
+    decoder = json.JSONDecoder()
+    stream = _StreamReader(read, chunk_size)
+    stream.expect("{")
+    while stream.peek() != "}":
+        name = stream.value(decoder)
+        stream.expect(":")
+        if name != key:
+            stream.value(decoder)
+        else:
+            stream.expect("{")
+            while stream.peek() != "}":
+                item = stream.value(decoder)
+                stream.expect(":")
+                yield item, stream.value(decoder)
+                if stream.peek() == ",":
+                    stream.position += 1
+            stream.position += 1
+        if stream.peek() == ",":
+            stream.position += 1
+
+
+class HttpConnectionPool:
+    """Connexions persistantes vers un hôte, réutilisées d'une requête à l'autre"""
+
+    def __init__(self, host, port, size=4, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        # Jetons: au plus size requêtes simultanées vers l'hôte
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0, "reused": 0, "errors": 0}
+
+    def _count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def _acquire(self):
+        try:
+            connection = self.idle.get_nowait()
+            self._count("reused")
+            return connection, True
+        except queue.Empty:
+            self._count("connections")
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def request(self, method, path, headers, handle):
+        """
+        Exécute une requête et passe la réponse à handle(response), dont le
+        résultat est retourné. Une connexion persistante fermée par le serveur
+        est remplacée une fois, de façon transparente.
+        """
+        with self.slots:
+            for attempt in range(2):
+                connection, reused = self._acquire()
+                try:
+                    connection.request(method, path, headers=headers)
+                    response = connection.getresponse()
+                except (http.client.HTTPException, OSError):
+                    connection.close()
+                    if reused and not attempt:
+                        continue
+                    self._count("errors")
+                    raise
+                self._count("requests")
+                try:
+                    result = handle(response)
+                    # Le corps doit être lu en entier pour réutiliser la connexion
+                    response.read()
+                except Exception:
+                    connection.close()
+                    self._count("errors")
+                    raise
+                if response.will_close:
+                    connection.close()
+                else:
+                    self.idle.put(connection)
+                return result
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class HttpFallbackClient:
+    """Collecte de repli via l'API HTTP /all du simulateur, un pool par hôte"""
+
+    def __init__(self, port=5000, user=None, password=None, pool_size=4, timeout=5.0,
+                 path="/all", chunk_size=16384):
+        self.port = port
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.path = path
+        self.chunk_size = chunk_size
+        self.headers = {"Accept": "application/json", "Connection": "keep-alive"}
+        if user:
+            token = base64.b64encode(f"{user}:{password or ''}".encode()).decode()
+            self.headers["Authorization"] = f"Basic {token}"
+        self.pools = {}
+        self.pools_lock = threading.Lock()
+        self.executor = None
+
+    def pool(self, host):
+        """Pool de connexions de l'hôte (créé à la première requête)"""
+        pool = self.pools.get(host)
+        if pool is None:
+            with self.pools_lock:
+                pool = self.pools.setdefault(host, HttpConnectionPool(host, self.port, self.pool_size, self.timeout))
+        return pool
+
+    def _decode(self, response):
+        if response.status != 200:
+            raise ValueError(f"Réponse HTTP {response.status} {response.reason}")
+        return dict(iter_object_items(response.read, "data", self.chunk_size))
+
+    def fetch(self, host):
+        """Retourne le dictionnaire nom -> valeur de l'hôte (lève une exception en cas d'échec)"""
+        return self.pool(host).request("GET", self.path, self.headers, self._decode)
+
+    def fetch_many(self, hosts, max_workers=16):
+        """Interroge plusieurs hôtes simultanément; retourne {hôte: données ou exception}"""
+        with self.pools_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="http-fallback")
+        futures = {host: self.executor.submit(self.fetch, host) for host in hosts}
+        results = {}
+        for host, future in futures.items():
+            try:
+                results[host] = future.result()
+            except Exception as e:
+                results[host] = e
+        return results
+
+    def close(self):
+        for pool in list(self.pools.values()):
+            pool.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+def get_client(port, user=None, password=None, **options):
+    """Retourne le client partagé pour un port et des identifiants"""
+    key = (port, user, password)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = HttpFallbackClient(port, user, password, **options)
+            _clients[key] = client
+    return client
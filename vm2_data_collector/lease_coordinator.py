@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Coordination de plusieurs collecteurs par baux renouvelables
+Plusieurs instances du collecteur (nœuds) se partagent l'inventaire sans
+interroger deux fois la même station:
+
+- chaque équipement appartient à un groupe fixe (hachage de son nom modulo
+  COORD_SHARDS), indépendant de l'inventaire et des nœuds;
+- un nœud n'interroge que les équipements des groupes dont il détient le bail
+  dans un stockage partagé: répertoire partagé (COORD_BACKEND=file) ou serveur
+  compatible Redis (COORD_BACKEND=resp). La prise d'un bail est exclusive;
+- chaque nœud renouvelle aussi un bail d'appartenance (node-<id>). Les groupes
+  sont répartis entre les nœuds vivants par hachage de rendez-vous (groupe,
+  nœud) borné à ceil(groupes / nœuds) par nœud: la charge reste équilibrée et
+  l'arrivée ou le départ d'un nœud déplace peu de groupes;
+- les baux sont renouvelés tous les tiers de COORD_LEASE_TTL (par défaut la
+  moitié de l'intervalle de collecte): les groupes d'un nœud disparu sont
+  repris par les autres en moins d'un intervalle.
+
+Un nœud ne se considère propriétaire d'un groupe que jusqu'à l'instant de sa
+demande de renouvellement augmenté de la durée du bail, moins COORD_CLOCK_SKEW:
+il cesse d'interroger les équipements d'un groupe avant qu'un autre nœud
+puisse en prendre le bail, même si le stockage devient injoignable. Une
+collecte déjà commencée se termine normalement.
+
+Les sorties (CSV, stockage colonnaire, Logstash, Elasticsearch) restent
+propres à chaque nœud: seule la collecte est répartie.
+
+Usage:
+    COORD_BACKEND=file COORD_DIR=/mnt/partage/coord python lease_coordinator.py inventaire.json
+    COORD_BACKEND=resp COORD_URL=redis://coord:6379/0 python lease_coordinator.py inventaire.json
+
+Auteur: arthur
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import socket
+import signal
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from dme_collector_snmpv3 import Config, logger as collector_logger
+from fleet_poller import FleetPoller, load_inventory, raise_open_files_limit
+from sharded_collector import shard_weight
+
+logger = logging.getLogger("lease_coordinator")
+
+NODE_PREFIX = "node-"
+SHARD_PREFIX = "shard-"
+
+
+def device_shard(name, shards):
+    """Groupe d'un équipement (stable, indépendant de l'inventaire et des nœuds)"""
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "big") % shards
+
+
+def shard_key(shard):
+    return f"{SHARD_PREFIX}{shard:04d}"
+
+
+class RespError(Exception):
+    """Erreur retournée par le serveur RESP"""
+
+
+class FileLeaseStore:
+    """Baux dans un répertoire partagé: un fichier JSON par bail, modifié sous verrou exclusif"""
+
+    def __init__(self, directory, clock_skew=0.5):
+        self.directory = directory
+        # Les échéances sont écrites avec l'horloge du détenteur: marge pour l'écart entre nœuds
+        self.clock_skew = clock_skew
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".lease")
+
+    @contextmanager
+    def _locked(self, path):
+        with open(path[:-len(".lease")] + ".lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self, path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _live(self, lease):
+        return lease is not None and lease["expires"] + self.clock_skew > time.time()
+
+    def acquire(self, key, owner, ttl):
+        """Prend ou prolonge le bail s'il est libre, expiré ou déjà détenu par owner"""
+        path = self._path(key)
+        with self._locked(path):
+            lease = self._read(path)
+            if self._live(lease) and lease["owner"] != owner:
+                return False
+            # Remplacement atomique: les lectures sans verrou (holders) voient l'ancien ou le nouveau bail
+            temporary = path + ".tmp"
+            with open(temporary, 'w') as f:
+                json.dump({"owner": owner, "expires": time.time() + ttl}, f)
+            os.replace(temporary, path)
+            return True
+
+    def release(self, key, owner):
+        """Libère le bail s'il est détenu par owner"""
+        path = self._path(key)
+        with self._locked(path):
+            lease = self._read(path)
+            if lease is None or lease["owner"] != owner:
+                return False
+            os.unlink(path)
+            return True
+
+    def holders(self, prefix):
+        """Baux vivants dont la clé commence par prefix: {clé: détenteur}"""
+        result = {}
+        for entry in os.listdir(self.directory):
+            if entry.startswith(prefix) and entry.endswith(".lease"):
+                lease = self._read(os.path.join(self.directory, entry))
+                if self._live(lease):
+                    result[entry[:-len(".lease")]] = lease["owner"]
+        return result
+
+    def close(self):
+        pass
+
+
+class RespLeaseStore:
+    """Baux dans un serveur compatible Redis: expiration tenue par le serveur, prolongation sous WATCH/MULTI"""
+
+    def __init__(self, url, prefix="dme:", timeout=2.0):
+        parsed = urlparse(url if "://" in url else f"redis://{url}")
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", self.db)
+        logger.info(f"Connecté au stockage des baux {self.host}:{self.port}")
+
+    def _disconnect(self):
+        if self.sock is not None:
+            try:
+                self.reader.close()
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.reader = None
+
+    def _reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connexion au stockage des baux fermée")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RespError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return self.reader.read(length + 2)[:-2].decode()
+        if kind == b"*":
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self._reply() for _ in range(count)]
+        raise ConnectionError(f"Réponse RESP inattendue: {line[:40]!r}")
+
+    def _call(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+        return self._reply()
+
+    def _execute(self, operation):
+        """Exécute operation() sur la connexion; toute erreur abandonne la connexion (état WATCH/MULTI inconnu)"""
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self._connect()
+                return operation()
+            except Exception:
+                self._disconnect()
+                raise
+
+    def _if_owner(self, key, owner, *command):
+        """Exécute command si key vaut owner, sans écriture concurrente possible entre le test et l'écriture"""
+        self._call("WATCH", key)
+        if self._call("GET", key) != owner:
+            self._call("UNWATCH")
+            return False
+        self._call("MULTI")
+        self._call(*command)
+        return self._call("EXEC") is not None
+
+    def acquire(self, key, owner, ttl):
+        """Prend ou prolonge le bail s'il est libre, expiré ou déjà détenu par owner"""
+        key = self.prefix + key
+        ttl_ms = max(1, int(ttl * 1000))
+
+        def operation():
+            if self._call("SET", key, owner, "NX", "PX", ttl_ms) == "OK":
+                return True
+            return self._if_owner(key, owner, "PEXPIRE", key, ttl_ms)
+        return self._execute(operation)
+
+    def release(self, key, owner):
+        """Libère le bail s'il est détenu par owner"""
+        key = self.prefix + key
+        return self._execute(lambda: self._if_owner(key, owner, "DEL", key))
+
+    def holders(self, prefix):
+        """Baux vivants dont la clé commence par prefix: {clé: détenteur}"""
+        pattern = re.sub(r"([*?\[\]\\])", r"\\\1", self.prefix + prefix) + "*"
+
+        def operation():
+            keys, cursor = set(), "0"
+            while True:
+                cursor, batch = self._call("SCAN", cursor, "MATCH", pattern, "COUNT", 500)
+                keys.update(batch)
+                if cursor == "0":
+                    break
+            if not keys:
+                return {}
+            keys = sorted(keys)
+            owners = self._call("MGET", *keys)
+            return {key[len(self.prefix):]: owner for key, owner in zip(keys, owners) if owner is not None}
+        return self._execute(operation)
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+
+def make_store(config):
+    """Stockage des baux selon COORD_BACKEND"""
+    if config.COORD_BACKEND == "file":
+        return FileLeaseStore(config.COORD_DIR, config.COORD_CLOCK_SKEW)
+    if config.COORD_BACKEND == "resp":
+        return RespLeaseStore(config.COORD_URL, config.COORD_PREFIX, timeout=config.TIMEOUT)
+    raise ValueError(f"COORD_BACKEND inconnu: {config.COORD_BACKEND!r} (file ou resp)")
+
+
+class LeaseCoordinator:
+    """Répartit les groupes d'équipements entre les nœuds vivants et tient les baux de ce nœud"""
+
+    def __init__(self, store, node_id=None, shards=None, ttl=None, clock_skew=None):
+        config = Config()
+        self.store = store
+        self.node_id = node_id or config.COORD_NODE_ID or f"{socket.gethostname()}-{os.getpid()}"
+        self.shards = shards or config.COORD_SHARDS
+        self.ttl = ttl or config.COORD_LEASE_TTL
+        self.clock_skew = config.COORD_CLOCK_SKEW if clock_skew is None else clock_skew
+        if self.ttl <= 2 * self.clock_skew:
+            raise ValueError(f"Durée de bail trop courte ({self.ttl}s) pour la marge d'horloge ({self.clock_skew}s)")
+        self.renew_interval = self.ttl / 3
+        # Groupe -> échéance locale du bail (horloge monotone)
+        self.owned = {}
+        self.nodes = []
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {"acquired": 0, "released": 0, "lost": 0, "errors": 0}
+
+    def owns_shard(self, shard):
+        return self.owned.get(shard, 0) > time.monotonic()
+
+    def owns(self, name):
+        return self.owns_shard(device_shard(name, self.shards))
+
+    def assignment(self, nodes):
+        """
+        Répartition des groupes entre les nœuds vivants: {groupe: nœud}.
+
+        Hachage de rendez-vous borné: chaque groupe revient au nœud de plus fort
+        poids qui en détient moins de ceil(groupes / nœuds). Le calcul ne dépend
+        que de la liste des nœuds: tous les nœuds obtiennent la même répartition.
+        """
+        capacity = -(-self.shards // len(nodes))
+        load = dict.fromkeys(nodes, 0)
+        result = {}
+        for shard in range(self.shards):
+            ranked = sorted(nodes, key=lambda node: shard_weight(shard_key(shard), node), reverse=True)
+            node = next(node for node in ranked if load[node] < capacity)
+            load[node] += 1
+            result[shard] = node
+        return result
+
+    def tick(self):
+        """Renouvelle l'appartenance et les baux détenus, puis ajuste les groupes à la répartition des nœuds vivants"""
+        # Échéance locale comptée depuis l'envoi des demandes: toujours antérieure à celle du stockage
+        deadline = time.monotonic() + self.ttl - self.clock_skew
+        self.store.acquire(NODE_PREFIX + self.node_id, self.node_id, self.ttl)
+        nodes = sorted(set(self.store.holders(NODE_PREFIX).values()) | {self.node_id})
+        holders = {}
+        for key, owner in self.store.holders(SHARD_PREFIX).items():
+            suffix = key[len(SHARD_PREFIX):]
+            if suffix.isdigit():
+                holders[int(suffix)] = owner
+        if nodes != self.nodes:
+            logger.info(f"Nœuds actifs: {', '.join(nodes)}")
+            self.nodes = nodes
+
+        desired = {shard for shard, node in self.assignment(nodes).items() if node == self.node_id}
+        acquired, released, lost = [], [], []
+        for shard in range(self.shards):
+            if shard in desired:
+                if self.store.acquire(shard_key(shard), self.node_id, self.ttl):
+                    if shard not in self.owned:
+                        acquired.append(shard)
+                    self.owned[shard] = deadline
+                elif self.owned.pop(shard, None) is not None:
+                    lost.append(shard)
+            elif shard in self.owned or holders.get(shard) == self.node_id:
+                # Groupe revenant à un autre nœud: abandonné avant la libération du bail
+                if self.owned.pop(shard, None) is not None:
+                    released.append(shard)
+                self.store.release(shard_key(shard), self.node_id)
+
+        self.stats["acquired"] += len(acquired)
+        self.stats["released"] += len(released)
+        self.stats["lost"] += len(lost)
+        if acquired or released or lost:
+            logger.info(
+                f"Groupes du nœud {self.node_id}: {len(self.owned)}/{self.shards} "
+                f"(+{len(acquired)} pris, -{len(released)} cédés, -{len(lost)} perdus)"
+            )
+        if lost:
+            logger.warning(f"Baux perdus par {self.node_id} (renouvellement trop tardif?): {lost}")
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                # Baux non renouvelés: ils expirent localement avant de pouvoir être repris ailleurs
+                self.stats["errors"] += 1
+                logger.warning(f"Coordination impossible pour {self.node_id}: {str(e)}")
+            self.stop_event.wait(self.renew_interval)
+
+    def start(self):
+        """Démarre le renouvellement périodique des baux"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="lease-coordinator", daemon=True)
+            self.thread.start()
+            logger.info(f"Coordination démarrée: nœud {self.node_id}, {self.shards} groupes, bail {self.ttl:g}s")
+        return self
+
+    def stop(self, release=True):
+        """Arrête le renouvellement et libère les baux du nœud (reprise immédiate par les autres)"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if release:
+            shards = list(self.owned)
+            self.owned.clear()
+            try:
+                for shard in shards:
+                    self.store.release(shard_key(shard), self.node_id)
+                self.store.release(NODE_PREFIX + self.node_id, self.node_id)
+            except Exception as e:
+                logger.warning(f"Libération des baux impossible pour {self.node_id}: {str(e)}")
+        self.store.close()
+        logger.info(f"Coordination arrêtée: nœud {self.node_id}, {self.stats}")
+
+
+class CoordinatedPoller(FleetPoller):
+    """FleetPoller qui n'interroge que les équipements des groupes dont le nœud détient le bail"""
+
+    def __init__(self, devices, coordinator, **kwargs):
+        super().__init__(devices, **kwargs)
+        self.coordinator = coordinator
+        self.device_shards = {device.name: device_shard(device.name, coordinator.shards) for device in devices}
+
+    async def poll_device(self, device, semaphore):
+        if not self.coordinator.owns_shard(self.device_shards[device.name]):
+            return False
+        return await super().poll_device(device, semaphore)
+
+
+# Point d'entrée principal
+if __name__ == "__main__":
+    inventory_path = sys.argv[1] if len(sys.argv) > 1 else Config.FLEET_INVENTORY
+    if not inventory_path:
+        collector_logger.critical("Aucun inventaire fourni (argument ou variable FLEET_INVENTORY)")
+        exit(1)
+    coordinator = None
+    try:
+        raise_open_files_limit()
+        poller = CoordinatedPoller(load_inventory(inventory_path), LeaseCoordinator(make_store(Config())))
+        coordinator = poller.coordinator.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        asyncio.run(poller.run_forever())
+    except KeyboardInterrupt:
+        logger.info("Collecte coordonnée interrompue par l'utilisateur")
+    except Exception as e:
+        logger.critical(f"Erreur critique: {str(e)}")
+        exit(1)
+    finally:
+        if coordinator is not None:
+            coordinator.stop()
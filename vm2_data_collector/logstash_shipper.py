@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Expéditeur Logstash persistant
+Maintient une connexion TCP longue durée vers l'entrée json_lines de Logstash,
+regroupe les documents par nombre et par latence maximale, et se reconnecte avec
+un backoff exponentiel. La file d'attente est bornée: si Logstash est lent ou
+indisponible, les documents les plus anciens sont écartés et la boucle de
+collecte n'est jamais bloquée.
+
+Avec un journal sur disque (spool.py), chaque document y est écrit avant
+l'envoi: rien n'est écarté pendant une panne de Logstash, l'arriéré est
+renvoyé à débit limité dès le rétablissement de la connexion.
+
+Auteur: arthur
+"""
+
+import json
+import time
+import queue
+import random
+import select
+import socket
+import atexit
+import logging
+import threading
+
+from spool import SpooledDelivery
+
+logger = logging.getLogger("logstash_shipper")
+
+# Expéditeurs partagés, un par destination (hôte, port)
+_shippers = {}
+_shippers_lock = threading.Lock()
+
+
+class LogstashShipper:
+    """Envoi asynchrone et groupé de documents JSON vers Logstash"""
+
+    def __init__(self, host, port, batch_size=100, flush_interval=1.0, queue_size=10000,
+                 connect_timeout=5.0, backoff_initial=0.5, backoff_max=30.0, stats_interval=60.0,
+                 spool=None, drain_rate=0.0):
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.connect_timeout = connect_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stats_interval = stats_interval
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.sock = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            "submitted": 0,
+            "sent": 0,
+            "flushes": 0,
+            "reconnects": 0,
+            "send_errors": 0,
+            "dropped": 0,
+        }
+        self._last_stats_log = time.monotonic()
+        # Callbacks appelés après chaque lot traité: callback(documents, secondes)
+        self.on_send = []
+
+        # Journal sur disque (Spool): envoi et reprise par SpooledDelivery, sans file mémoire propre
+        self.delivery = None
+        self.send_lock = threading.Lock()
+        if spool is not None:
+            self.stats.update({"spooled": 0, "drained": 0, "evicted": 0, "corrupt": 0})
+            self.delivery = SpooledDelivery(
+                spool, self._encode, self._deliver, self._count, f"logstash-{host}:{port}",
+                batch_size=batch_size, flush_interval=flush_interval, queue_size=queue_size,
+                drain_rate=drain_rate, backoff_initial=backoff_initial, backoff_max=backoff_max,
+                log_stats=self.log_stats, stats_interval=stats_interval
+            )
+            self.queue = self.delivery.queue
+
+    def _count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def start(self):
+        """Démarre le thread d'expédition"""
+        if self.delivery is not None:
+            self.delivery.start()
+        elif self.thread is None:
+            self.thread = threading.Thread(target=self._run, name=f"logstash-{self.host}:{self.port}", daemon=True)
+            self.thread.start()
+            logger.info(f"Expéditeur Logstash démarré vers {self.host}:{self.port} (lot {self.batch_size}, latence max {self.flush_interval}s)")
+        return self
+
+    def submit(self, document):
+        """
+        Ajoute un document à la file sans jamais bloquer.
+
+        Si la file est pleine, le document le plus ancien est écarté. Retourne
+        False si un document a dû être écarté.
+        """
+        self._count("submitted")
+        if self.delivery is not None:
+            return self.delivery.submit(document)
+        try:
+            self.queue.put_nowait(document)
+            return True
+        except queue.Full:
+            pass
+
+        try:
+            self.queue.get_nowait()
+            self._count("dropped")
+        except queue.Empty:
+            pass
+        try:
+            self.queue.put_nowait(document)
+        except queue.Full:
+            self._count("dropped")
+        return False
+
+    def put(self, document, timeout=None):
+        """Ajoute un document en attendant qu'une place se libère (rejeu d'historique: rien n'est écarté)"""
+        if self.delivery is not None:
+            self._count("submitted")
+            self.delivery.submit(document)
+            return
+        self.queue.put(document, timeout=timeout)
+        self._count("submitted")
+
+    def close(self, timeout=5.0):
+        """Vide la file (dans la limite du délai) puis ferme la connexion"""
+        if self.delivery is not None:
+            self.delivery.close(timeout)
+            self._disconnect()
+            self.log_stats()
+            return
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join(timeout)
+        self._disconnect()
+        self.log_stats()
+
+    def log_stats(self):
+        """Journalise les compteurs d'envoi"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        spool = ""
+        if self.delivery is not None:
+            spool = (f", journal: {stats['drained']} repris, {stats['evicted']} perdus (quota), "
+                     f"{self.delivery.spool.pending_bytes()} octets en attente")
+        logger.info(
+            f"Logstash {self.host}:{self.port}: {stats['sent']} documents envoyés en {stats['flushes']} lots, "
+            f"{stats['reconnects']} reconnexions, {stats['send_errors']} erreurs d'envoi, "
+            f"{stats['dropped']} documents écartés, file {self.queue.qsize()}{spool}"
+        )
+
+    def _next_batch(self):
+        """Attend le premier document puis complète le lot jusqu'à batch_size ou flush_interval"""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _connection_alive(self):
+        """Détecte une connexion fermée par Logstash (socket lisible avec EOF)"""
+        if self.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            if readable and not self.sock.recv(1, socket.MSG_PEEK):
+                return False
+        except OSError:
+            return False
+        return True
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+
+    def _disconnect(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _send(self, payload):
+        """Envoie un lot, en se reconnectant avec backoff exponentiel jusqu'au succès ou à l'arrêt"""
+        backoff = self.backoff_initial
+        while True:
+            try:
+                if not self._connection_alive():
+                    if self.sock is not None:
+                        self._disconnect()
+                    self._connect()
+                    self._count("reconnects")
+                self.sock.sendall(payload)
+                return True
+            except OSError as e:
+                self._count("send_errors")
+                self._disconnect()
+                logger.error(f"Erreur lors de l'envoi des données à Logstash: {str(e)} (nouvel essai dans {backoff:.1f}s)")
+                # À l'arrêt, on abandonne le lot plutôt que de bloquer la sortie
+                if self.stop_event.wait(backoff * random.uniform(0.8, 1.2)):
+                    return False
+                backoff = min(self.backoff_max, backoff * 2)
+
+    def _encode(self, document):
+        return json.dumps(document).encode() + b'\n'
+
+    def _deliver(self, payloads):
+        """Un seul essai d'envoi d'un lot déjà encodé (journal sur disque); retourne les documents non envoyés"""
+        started = time.monotonic()
+        with self.send_lock:
+            try:
+                if not self._connection_alive():
+                    if self.sock is not None:
+                        self._disconnect()
+                    self._connect()
+                    self._count("reconnects")
+                self.sock.sendall(b''.join(payloads))
+            except OSError as e:
+                self._count("send_errors")
+                self._disconnect()
+                logger.error(f"Erreur lors de l'envoi des données à Logstash: {str(e)}")
+                return payloads
+        self._count("sent", len(payloads))
+        self._count("flushes")
+        elapsed = time.monotonic() - started
+        for callback in self.on_send:
+            callback(len(payloads), elapsed)
+        return []
+
+    def _run(self):
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                payload = b''.join(self._encode(document) for document in batch)
+                started = time.monotonic()
+                if self._send(payload):
+                    self._count("sent", len(batch))
+                    self._count("flushes")
+                    elapsed = time.monotonic() - started
+                    for callback in self.on_send:
+                        callback(len(batch), elapsed)
+                else:
+                    self._count("dropped", len(batch))
+
+            if time.monotonic() - self._last_stats_log >= self.stats_interval:
+                self._last_stats_log = time.monotonic()
+                self.log_stats()
+
+
+def get_shipper(host, port, **options):
+    """Retourne l'expéditeur partagé pour une destination, démarré à la première demande"""
+    key = (host, port)
+    with _shippers_lock:
+        shipper = _shippers.get(key)
+        if shipper is None:
+            shipper = LogstashShipper(host, port, **options).start()
+            _shippers[key] = shipper
+    return shipper
+
+
+def close_shipper(host, port, timeout=5.0):
+    """
+    Vide et ferme l'expéditeur partagé d'une destination, puis l'oublie.
+
+    La demande suivante à get_shipper() en démarre un nouveau. Retourne
+    l'expéditeur fermé (pour ses statistiques), ou None s'il n'existait pas.
+    """
+    with _shippers_lock:
+        shipper = _shippers.pop((host, port), None)
+    if shipper is not None:
+        shipper.close(timeout)
+    return shipper
+
+
+@atexit.register
+def _close_shippers():
+    for shipper in list(_shippers.values()):
+        shipper.close()
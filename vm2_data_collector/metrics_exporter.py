@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Exposition des métriques internes du collecteur au format Prometheus
+Un petit serveur HTTP embarqué (thread démon) sert /metrics au format texte
+Prometheus 0.0.4, ou OpenMetrics 1.0 si le client le demande (en-tête Accept).
+
+Mesures relevées pendant la collecte:
+  dme_cycle_duration_seconds            durée d'un cycle complet (collecte + sorties)
+  dme_snmp_request_duration_seconds     aller-retour d'une requête GET, par équipement
+  dme_snmp_oid_duration_seconds         aller-retour de la PDU portant chaque métrique
+  dme_snmp_errors_total                 erreurs SNMP par type (timeout, auth, noSuchObject...)
+  dme_collections_total                 collectes par méthode (snmp, http) et résultat
+  dme_http_fallback_total               replis sur l'API HTTP après échec SNMPv3
+  dme_csv_write_duration_seconds        écriture d'une ligne CSV
+  dme_output_send_duration_seconds      envoi d'un lot vers Logstash / Elasticsearch
+
+Mesures lues à chaque requête /metrics (aucun coût pendant la collecte):
+profondeur des files d'expédition, compteurs des sorties, retard des
+ordonnanceurs, état des disjoncteurs et compteurs du moteur d'alertes.
+
+Pour rester peu coûteux avec des milliers d'équipements, une observation se
+résume à une recherche dichotomique dans les bornes de l'histogramme et à
+l'incrément d'un compteur sous verrou; le texte n'est produit qu'au scrape.
+Le libellé par équipement peut être désactivé (METRICS_PER_DEVICE=false).
+
+Auteur: arthur
+"""
+
+import math
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scheduler import aggregate_stats
+from circuit_breaker import breaker_summary
+
+logger = logging.getLogger("metrics_exporter")
+
+# Bornes par défaut des histogrammes (secondes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RTT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+WRITE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5)
+
+CONTENT_TYPE_TEXT = "text/plain; version=0.0.4; charset=utf-8"
+CONTENT_TYPE_OPENMETRICS = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Indications d'erreur pysnmp rattachées aux défauts d'authentification / chiffrement
+AUTH_ERRORS = ("unknownusername", "digest", "authentication", "notintimewindow", "decryption",
+               "unknownengineid", "unsupportedseclevel", "unknownsecurityname")
+VARBIND_EXCEPTIONS = ("noSuchObject", "noSuchInstance", "endOfMibView")
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Famille de séries: un enfant par combinaison de valeurs de libellés"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+
+    def labels(self, *values):
+        """Série correspondant aux valeurs de libellés (créée au premier appel)"""
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def family_name(self, openmetrics):
+        # OpenMetrics: le suffixe _total n'appartient qu'aux échantillons
+        if openmetrics and self.kind == "counter" and self.name.endswith("_total"):
+            return self.name[:-len("_total")]
+        return self.name
+
+    def render(self, openmetrics=False):
+        family = self.family_name(openmetrics)
+        lines = [f"# HELP {family} {self.documentation}", f"# TYPE {family} {self.kind}"]
+        with self.lock:
+            children = list(self.children.items())
+        for values, child in children:
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("lock", "value")
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value(self.lock)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self, values, child):
+        return [f"{self.name}{_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("lock", "bounds", "counts", "sum")
+
+    def __init__(self, lock, bounds):
+        self.lock = lock
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        # Borne "le" inclusive: première borne >= valeur
+        position = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[position] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.lock, self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _samples(self, values, child):
+        with self.lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+        suffix = _labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{suffix} {_format_value(total)}")
+        lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Famille dont les valeurs sont lues au moment du scrape: fn() -> [(valeurs de libellés, valeur)]"""
+
+    def __init__(self, name, documentation, kind, labelnames, fn):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self, openmetrics=False):
+        family = self.family_name(openmetrics)
+        lines = [f"# HELP {family} {self.documentation}", f"# TYPE {family} {self.kind}"]
+        try:
+            samples = list(self.fn())
+        except Exception as e:
+            logger.error(f"Erreur lors de la lecture de {self.name}: {str(e)}")
+            samples = []
+        for values, value in samples:
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    """Ensemble des familles exposées par le processus"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, kind, labelnames, fn):
+        return self.register(CallbackMetric(name, documentation, kind, labelnames, fn))
+
+    def render(self, openmetrics=False):
+        """Texte d'exposition complet"""
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(openmetrics))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CYCLE_DURATION = REGISTRY.histogram(
+    "dme_cycle_duration_seconds", "Durée d'un cycle de collecte complet (collecte et sorties)", ("result",))
+SNMP_RTT = REGISTRY.histogram(
+    "dme_snmp_request_duration_seconds", "Aller-retour d'une requête GET SNMP", ("device",), RTT_BUCKETS)
+OID_RTT = REGISTRY.histogram(
+    "dme_snmp_oid_duration_seconds", "Aller-retour de la PDU portant la métrique", ("metric",), RTT_BUCKETS)
+SNMP_ERRORS = REGISTRY.counter(
+    "dme_snmp_errors_total", "Erreurs SNMP par type", ("kind",))
+COLLECTIONS = REGISTRY.counter(
+    "dme_collections_total", "Collectes par méthode et résultat", ("method", "result"))
+HTTP_FALLBACKS = REGISTRY.counter(
+    "dme_http_fallback_total", "Replis sur l'API HTTP après échec de la collecte SNMPv3")
+CSV_WRITE = REGISTRY.histogram(
+    "dme_csv_write_duration_seconds", "Écriture d'une ligne dans le fichier CSV", (), WRITE_BUCKETS)
+OUTPUT_SEND = REGISTRY.histogram(
+    "dme_output_send_duration_seconds", "Envoi d'un lot vers une sortie (renvois compris)", ("output",))
+
+# Objets suivis, lus au moment du scrape
+_outputs = {}
+_schedulers = []
+_alert_engines = []
+_tracked_lock = threading.Lock()
+
+
+def _output_samples(kind):
+    with _tracked_lock:
+        outputs = list(_outputs.values())
+    for output, destination, sink in outputs:
+        if kind == "queue":
+            yield (output, destination), sink.queue.qsize()
+        elif kind == "spool":
+            delivery = getattr(sink, "delivery", None)
+            if delivery is not None:
+                yield (output, destination), delivery.spool.pending_bytes()
+        else:
+            with sink.stats_lock:
+                stats = dict(sink.stats)
+            for state, value in stats.items():
+                yield (output, destination, state), value
+
+
+def _scheduler_samples(key):
+    with _tracked_lock:
+        schedulers = list(_schedulers)
+    if schedulers:
+        yield (), aggregate_stats(schedulers)[key]
+
+
+def _alert_samples():
+    with _tracked_lock:
+        engines = list(_alert_engines)
+    for state in ("samples", "fired", "resolved"):
+        yield (state,), sum(engine.stats[state] for engine in engines)
+
+
+REGISTRY.callback("dme_output_queue_depth", "Documents en attente dans la file d'expédition", "gauge",
+                  ("output", "destination"), lambda: _output_samples("queue"))
+REGISTRY.callback("dme_output_documents_total", "Compteurs des sorties (soumis, envoyés, écartés...)", "counter",
+                  ("output", "destination", "state"), lambda: _output_samples("stats"))
+REGISTRY.callback("dme_output_spool_bytes", "Octets non acquittés dans le journal sur disque de la sortie", "gauge",
+                  ("output", "destination"), lambda: _output_samples("spool"))
+REGISTRY.callback("dme_scheduler_runs_total", "Cycles lancés par les ordonnanceurs", "counter",
+                  (), lambda: _scheduler_samples("runs"))
+REGISTRY.callback("dme_scheduler_skipped_total", "Échéances sautées (cycle précédent encore en cours)", "counter",
+                  (), lambda: _scheduler_samples("skipped"))
+REGISTRY.callback("dme_scheduler_lag_max_seconds", "Retard maximal d'un cycle sur son échéance", "gauge",
+                  (), lambda: _scheduler_samples("lag_max_s"))
+REGISTRY.callback("dme_scheduler_lag_avg_seconds", "Retard moyen des cycles sur leur échéance", "gauge",
+                  (), lambda: _scheduler_samples("lag_avg_s"))
+REGISTRY.callback("dme_scheduler_running", "Cycles en cours d'exécution", "gauge",
+                  (), lambda: _scheduler_samples("running"))
+REGISTRY.callback("dme_circuit_breakers", "Équipements par état du disjoncteur", "gauge",
+                  ("state",), lambda: [((state,), count) for state, count in breaker_summary()[0].items()])
+REGISTRY.callback("dme_circuit_rejected_total", "Collectes écartées par un disjoncteur ouvert", "counter",
+                  (), lambda: [((), breaker_summary()[1])])
+REGISTRY.callback("dme_alert_events_total", "Échantillons évalués et transitions d'alerte", "counter",
+                  ("state",), _alert_samples)
+
+
+def error_kind(reason):
+    """Classe un motif d'erreur SNMP (indication pysnmp, errorStatus, exception de varbind)"""
+    text = str(reason)
+    compact = text.lower().replace(" ", "")
+    if "timeout" in compact or "nosnmpresponse" in compact:
+        return "timeout"
+    if any(marker in compact for marker in AUTH_ERRORS):
+        return "auth"
+    if text in VARBIND_EXCEPTIONS or text.isalpha():
+        return text
+    return "other"
+
+
+def track_output(output, destination, sink):
+    """Suit une sortie (LogstashShipper, ElasticsearchBulkSink): durée des envois, file, compteurs"""
+    key = (output, destination)
+    with _tracked_lock:
+        if key in _outputs:
+            return
+        _outputs[key] = (output, destination, sink)
+    histogram = OUTPUT_SEND.labels(output)
+    sink.on_send.append(lambda documents, seconds: histogram.observe(seconds))
+
+
+def track_scheduler(scheduler):
+    with _tracked_lock:
+        _schedulers.append(scheduler)
+
+
+def track_alert_engine(engine):
+    with _tracked_lock:
+        if engine not in _alert_engines:
+            _alert_engines.append(engine)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+        body = REGISTRY.render(openmetrics).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE_OPENMETRICS if openmetrics else CONTENT_TYPE_TEXT)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port, address=""):
+    """Démarre le serveur /metrics une seule fois par processus; retourne False en cas d'échec"""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server is not False
+        try:
+            _server = ThreadingHTTPServer((address, port), _MetricsHandler)
+        except OSError as e:
+            # Une seule tentative par processus (nombreux collecteurs en mode flotte)
+            _server = False
+            logger.error(f"Impossible d'ouvrir le port des métriques {port}: {str(e)}")
+            return False
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-exporter", daemon=True).start()
+    logger.info(f"Métriques exposées sur http://{address or '0.0.0.0'}:{port}/metrics")
+    return True
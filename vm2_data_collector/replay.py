@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Rejeu de l'historique CSV vers Logstash / Elasticsearch
+Relit dme_data.csv (segments tournés et compressés compris) et renvoie chaque
+échantillon dans le pipeline sous la forme du document dme_metrics produit par
+send_to_logstash, avec son horodatage d'origine. Sert à recharger Elasticsearch
+après une panne de la chaîne ELK et aux essais de capacité.
+
+La lecture est une chaîne de générateurs (history_query.query -> échantillons
+-> documents -> cadence -> sorties): la mémoire reste constante quelle que
+soit la taille de l'historique. Plusieurs équipements (mode flotte) sont
+fusionnés par ordre chronologique.
+
+Cadence (--speed): 1 = temps réel, N = N fois plus vite, 0 = au plus vite.
+Les sorties sont alimentées avec attente (aucun document écarté); le débit
+atteint est journalisé pendant le rejeu et en fin de rejeu.
+
+Exemples:
+    python replay.py --file /app/data/dme_data.csv --start "2025-06-02 14:00" --speed 0 --output elasticsearch
+    python replay.py --file /app/data/dme_data.csv --device dme-nord --device dme-sud --speed 60 --output stdout
+
+Auteur: arthur
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import logging
+import argparse
+from datetime import datetime
+
+from csv_sink import parse_timestamp
+from history_query import query
+
+logger = logging.getLogger("replay")
+
+OUTPUTS = ("logstash", "elasticsearch", "stdout", "none")
+
+
+class Config:
+    # Sorties (mêmes variables que le collecteur)
+    LOGSTASH_ENABLED = os.environ.get("LOGSTASH_ENABLED", "false").lower() == "true"
+    LOGSTASH_HOST = os.environ.get("LOGSTASH_HOST", "logstash")
+    LOGSTASH_PORT = int(os.environ.get("LOGSTASH_PORT", 5044))
+    LOGSTASH_BATCH_SIZE = int(os.environ.get("LOGSTASH_BATCH_SIZE", 100))
+    LOGSTASH_FLUSH_INTERVAL = float(os.environ.get("LOGSTASH_FLUSH_INTERVAL", 1.0))
+    LOGSTASH_QUEUE_SIZE = int(os.environ.get("LOGSTASH_QUEUE_SIZE", 10000))
+    ES_BULK_ENABLED = os.environ.get("ES_BULK_ENABLED", "false").lower() == "true"
+    ES_URL = os.environ.get("ES_URL", "http://elasticsearch:9200")
+    ES_USER = os.environ.get("ES_USER", "elastic")
+    ES_PASSWORD = os.environ.get("ES_PASSWORD", "")
+    ES_INDEX_PREFIX = os.environ.get("ES_INDEX_PREFIX", "rcms-dme")
+    ES_BATCH_SIZE = int(os.environ.get("ES_BATCH_SIZE", 500))
+    ES_FLUSH_INTERVAL = float(os.environ.get("ES_FLUSH_INTERVAL", 1.0))
+    ES_POOL_SIZE = int(os.environ.get("ES_POOL_SIZE", 2))
+    ES_MAX_RETRIES = int(os.environ.get("ES_MAX_RETRIES", 5))
+    ES_CA_FILE = os.environ.get("ES_CA_FILE") or None
+
+    OUTPUT_FILE = os.environ.get("OUTPUT_FILE", "dme_data.csv")
+    # Journalisation du débit pendant le rejeu (s)
+    REPLAY_PROGRESS_INTERVAL = float(os.environ.get("REPLAY_PROGRESS_INTERVAL", 10))
+    # Attente maximale de la vidange des sorties en fin de rejeu (s)
+    REPLAY_DRAIN_TIMEOUT = float(os.environ.get("REPLAY_DRAIN_TIMEOUT", 120))
+
+
+def parse_value(text):
+    """Valeur CSV -> entier (valeurs SNMP), réel ou texte"""
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+
+def samples(base_path, start=None, end=None, columns=None, fill=True):
+    """
+    Génère (horodatage texte, {métrique: valeur}, ligne complète) pour chaque
+    ligne de la fenêtre; les cellules vides sont omises.
+    """
+    rows = query(base_path, start, end, columns, fill=fill)
+    header = next(rows, None)
+    if header is None:
+        return
+    names = header[1:]
+    for row in rows:
+        metrics = {name: parse_value(text) for name, text in zip(names, row[1:]) if text != ""}
+        yield row[0], metrics, len(metrics) == len(names)
+
+
+def _tagged(device, stream):
+    for timestamp, metrics, complete in stream:
+        yield timestamp, device, metrics, complete
+
+
+def merged_samples(sources):
+    """Fusionne par horodatage les échantillons de plusieurs équipements: (horodatage, équipement, métriques, complet)"""
+    streams = [_tagged(device, stream) for device, stream in sources]
+    # Horodatages de largeur fixe: l'ordre lexicographique est l'ordre chronologique
+    return heapq.merge(*streams, key=lambda sample: sample[0])
+
+
+def documents(merged, delta=False):
+    """Reconstruit le document dme_metrics de send_to_logstash: (datetime d'origine, document)"""
+    for timestamp, device, metrics, complete in merged:
+        if not metrics:
+            continue
+        sample_time = parse_timestamp(timestamp)
+        document = {
+            "@timestamp": sample_time.isoformat(),
+            "type": "dme_metrics",
+            "metrics": metrics
+        }
+        if device is not None:
+            document["device"] = device
+        if delta:
+            document["delta"] = True
+            document["keyframe"] = complete
+        yield sample_time, document
+
+
+def paced(timed_documents, speed=1.0, max_gap=None, clock=time.monotonic, sleep=time.sleep):
+    """
+    Cadence les documents selon leurs horodatages d'origine divisés par speed
+    (0 = sans attente). max_gap plafonne les trous de l'historique (s).
+    """
+    origin = None
+    previous = None
+    offset = 0.0
+    for sample_time, document in timed_documents:
+        if speed > 0:
+            if origin is None:
+                origin = clock()
+            else:
+                gap = max(0.0, (sample_time - previous).total_seconds())
+                offset += gap if max_gap is None else min(gap, max_gap)
+            delay = origin + offset / speed - clock()
+            if delay > 0:
+                sleep(delay)
+        previous = sample_time
+        yield sample_time, document
+
+
+class ReplayStats:
+    """Compteurs et débit du rejeu"""
+
+    def __init__(self, progress_interval=10.0):
+        self.progress_interval = progress_interval
+        self.started = time.monotonic()
+        self.last_log = self.started
+        self.documents = 0
+        self.first_time = None
+        self.last_time = None
+
+    def record(self, sample_time):
+        self.documents += 1
+        if self.first_time is None:
+            self.first_time = sample_time
+        self.last_time = sample_time
+        now = time.monotonic()
+        if self.progress_interval and now - self.last_log >= self.progress_interval:
+            self.last_log = now
+            logger.info(f"Rejeu: {self.documents} documents, {self.rate():.1f} docs/s, jusqu'à {sample_time.isoformat()}")
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.documents / elapsed if elapsed > 0 else 0.0
+
+    def speedup(self):
+        """Durée d'historique rejouée par seconde réelle"""
+        elapsed = self.elapsed()
+        if self.first_time is None or elapsed <= 0:
+            return 0.0
+        return (self.last_time - self.first_time).total_seconds() / elapsed
+
+
+class StdoutOutput:
+    """Sortie NDJSON sur la sortie standard (essais, redirection vers un fichier)"""
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self.stats = {"submitted": 0}
+
+    def put(self, document, timeout=None):
+        self.stream.write(json.dumps(document) + "\n")
+        self.stats["submitted"] += 1
+
+    def close(self, timeout=None):
+        self.stream.flush()
+
+
+def open_outputs(names, config):
+    """Sorties nommées (logstash, elasticsearch, stdout, none), configurées comme celles du collecteur"""
+    outputs = {}
+    for name in names:
+        if name == "logstash":
+            from logstash_shipper import get_shipper
+            outputs[name] = get_shipper(
+                config.LOGSTASH_HOST,
+                config.LOGSTASH_PORT,
+                batch_size=config.LOGSTASH_BATCH_SIZE,
+                flush_interval=config.LOGSTASH_FLUSH_INTERVAL,
+                queue_size=config.LOGSTASH_QUEUE_SIZE
+            )
+        elif name == "elasticsearch":
+            from es_bulk import get_bulk_sink
+            outputs[name] = get_bulk_sink(
+                config.ES_URL,
+                user=config.ES_USER,
+                password=config.ES_PASSWORD,
+                index_prefix=config.ES_INDEX_PREFIX,
+                batch_size=config.ES_BATCH_SIZE,
+                flush_interval=config.ES_FLUSH_INTERVAL,
+                pool_size=config.ES_POOL_SIZE,
+                max_retries=config.ES_MAX_RETRIES,
+                ca_file=config.ES_CA_FILE
+            )
+        elif name == "stdout":
+            outputs[name] = StdoutOutput()
+        elif name != "none":
+            raise ValueError(f"Sortie de rejeu inconnue: {name}")
+    return outputs
+
+
+def replay(sources, outputs, start=None, end=None, columns=None, speed=1.0, max_gap=None,
+           fill=True, delta=False, progress_interval=10.0):
+    """
+    Rejoue les fichiers sources [(équipement ou None, chemin de base)] vers les sorties.
+    Retourne les statistiques du rejeu (ReplayStats).
+    """
+    merged = merged_samples([
+        (device, samples(path, start, end, columns, fill=fill and not delta))
+        for device, path in sources
+    ])
+    stats = ReplayStats(progress_interval)
+    for sample_time, document in paced(documents(merged, delta), speed, max_gap):
+        for output in outputs.values():
+            output.put(document)
+        stats.record(sample_time)
+    return stats
+
+
+def _parse_bound(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def device_path(base_path, device):
+    """Fichier CSV d'un équipement en mode flotte (<base>_<équipement>.csv)"""
+    base, ext = os.path.splitext(base_path)
+    return f"{base}_{device}{ext}"
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    config = Config()
+    default_outputs = [name for name, enabled in (("logstash", config.LOGSTASH_ENABLED),
+                                                  ("elasticsearch", config.ES_BULK_ENABLED)) if enabled] or ["stdout"]
+    parser = argparse.ArgumentParser(description="Rejeu de l'historique CSV DME vers Logstash / Elasticsearch")
+    parser.add_argument("--file", default=config.OUTPUT_FILE, help="Fichier de sortie du collecteur")
+    parser.add_argument("--device", action="append", help="Équipement (mode flotte), répétable; ajoute le champ device")
+    parser.add_argument("--start", help="Début (AAAA-MM-JJ HH:MM[:SS])")
+    parser.add_argument("--end", help="Fin (AAAA-MM-JJ HH:MM[:SS])")
+    parser.add_argument("--columns", help="Colonnes séparées par des virgules (jokers autorisés)")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = temps réel, N = N fois plus vite, 0 = au plus vite")
+    parser.add_argument("--max-gap", type=float, help="Plafond des trous de l'historique (s)")
+    parser.add_argument("--delta", action="store_true", help="Fichiers écrits en mode delta: documents partiels marqués delta/keyframe")
+    parser.add_argument("--output", default=",".join(default_outputs),
+                        help=f"Sorties séparées par des virgules ({', '.join(OUTPUTS)})")
+    args = parser.parse_args()
+
+    if args.speed < 0:
+        parser.error("--speed doit être positif ou nul")
+    if args.device:
+        sources = [(device, device_path(args.file, device)) for device in args.device]
+    else:
+        sources = [(None, args.file)]
+    columns = [column.strip() for column in args.columns.split(",")] if args.columns else None
+    outputs = open_outputs([name.strip() for name in args.output.split(",") if name.strip()], config)
+
+    logger.info(f"Rejeu de {len(sources)} fichier(s) vers {', '.join(outputs) or 'aucune sortie'}, "
+                f"cadence {'maximale' if args.speed == 0 else f'x{args.speed:g}'}")
+    try:
+        stats = replay(sources, outputs, _parse_bound(args.start), _parse_bound(args.end), columns,
+                       args.speed, args.max_gap, delta=args.delta, progress_interval=config.REPLAY_PROGRESS_INTERVAL)
+    except KeyboardInterrupt:
+        logger.warning("Rejeu interrompu")
+        stats = None
+    finally:
+        for output in outputs.values():
+            output.close(config.REPLAY_DRAIN_TIMEOUT)
+
+    if stats is not None:
+        logger.info(f"Rejeu terminé: {stats.documents} documents en {stats.elapsed():.1f}s "
+                    f"({stats.rate():.1f} docs/s, historique rejoué x{stats.speedup():.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Ordonnanceur à cadence fixe sans dérive
+Les échéances sont calculées sur l'horloge monotone à partir d'une origine
+fixe (origine + k * intervalle): la durée d'un cycle ne décale jamais les
+suivants. La première échéance est alignée sur un multiple de l'intervalle en
+heure murale (ex: 12:00:00, 12:03:00...) augmenté d'un décalage déterministe
+propre à chaque équipement, ce qui étale les requêtes d'une flotte sur la période.
+
+Dépassement (cycle plus long que l'intervalle):
+  skip       : les échéances manquées sont sautées et comptées
+  concurrent : un nouveau cycle démarre à l'échéance même si le précédent
+               n'est pas terminé (au plus max_concurrent cycles simultanés,
+               les échéances au-delà sont sautées)
+
+Métriques: échéances, cycles exécutés, échéances sautées, dépassements et
+retard au démarrage (écart entre l'échéance et le démarrage effectif).
+
+Auteur: arthur
+"""
+
+import time
+import zlib
+import logging
+import threading
+
+logger = logging.getLogger("scheduler")
+
+OVERRUN_SKIP = "skip"
+OVERRUN_CONCURRENT = "concurrent"
+
+
+def device_offset(name, interval, spread=1.0):
+    """Décalage déterministe (s) d'un équipement dans la période, fonction de son nom"""
+    if not name or not spread:
+        return 0.0
+    fraction = zlib.crc32(name.encode()) / 2.0 ** 32
+    return fraction * spread * interval
+
+
+class FixedRateScheduler:
+    """Déclenche un travail à cadence fixe sur l'horloge monotone"""
+
+    def __init__(self, interval, offset=0.0, align=True, overrun_policy=OVERRUN_SKIP,
+                 max_concurrent=2, name="collecte"):
+        if interval <= 0:
+            raise ValueError(f"Intervalle invalide: {interval}")
+        if overrun_policy not in (OVERRUN_SKIP, OVERRUN_CONCURRENT):
+            raise ValueError(f"Politique de dépassement inconnue: {overrun_policy}")
+        self.interval = float(interval)
+        self.offset = float(offset) % self.interval
+        self.align = align
+        self.overrun_policy = overrun_policy
+        self.max_concurrent = max(1, max_concurrent) if overrun_policy == OVERRUN_CONCURRENT else 1
+        self.name = name
+
+        self.origin = None
+        self.tick = 0
+        self.running = 0
+        self.lock = threading.Lock()
+        self.stats = {
+            "ticks": 0,
+            "runs": 0,
+            "skipped": 0,
+            "overruns": 0,
+            "lag_last_s": 0.0,
+            "lag_max_s": 0.0,
+            "lag_total_s": 0.0,
+        }
+
+    def _first_deadline(self):
+        """Première échéance (horloge monotone), alignée sur l'heure murale si demandé"""
+        now_wall = time.time()
+        now = time.monotonic()
+        if not self.align:
+            return now + self.offset
+        boundary = (now_wall // self.interval) * self.interval + self.offset
+        if boundary <= now_wall:
+            boundary += self.interval
+        return now + (boundary - now_wall)
+
+    def deadline(self, tick=None):
+        """Échéance monotone du tick donné (par défaut le prochain)"""
+        if self.origin is None:
+            self.origin = self._first_deadline()
+        return self.origin + (self.tick if tick is None else tick) * self.interval
+
+    def _catch_up(self, now):
+        """Après un dépassement, saute les échéances passées; retourne le nombre sauté"""
+        if now < self.deadline():
+            return 0
+        missed = int((now - self.deadline()) // self.interval) + 1
+        self.tick += missed
+        with self.lock:
+            self.stats["skipped"] += missed
+            self.stats["ticks"] += missed
+            self.stats["overruns"] += 1
+        logger.warning(f"Dépassement de cadence [{self.name}]: {missed} échéance(s) sautée(s)")
+        return missed
+
+    def _record_start(self, scheduled):
+        lag = max(0.0, time.monotonic() - scheduled)
+        with self.lock:
+            self.stats["ticks"] += 1
+            self.stats["runs"] += 1
+            self.stats["lag_last_s"] = lag
+            self.stats["lag_total_s"] += lag
+            self.stats["lag_max_s"] = max(self.stats["lag_max_s"], lag)
+
+    def _record_skip(self):
+        with self.lock:
+            self.stats["ticks"] += 1
+            self.stats["skipped"] += 1
+            self.stats["overruns"] += 1
+        logger.warning(f"Dépassement de cadence [{self.name}]: {self.running} cycle(s) en cours, échéance sautée")
+
+    def snapshot(self):
+        """Copie des métriques, avec le retard moyen"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["running"] = self.running
+        stats["lag_avg_s"] = stats["lag_total_s"] / stats["runs"] if stats["runs"] else 0.0
+        return stats
+
+    def _run_job(self, job):
+        try:
+            job()
+        except Exception as e:
+            logger.error(f"Erreur lors du cycle [{self.name}]: {str(e)}")
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def run(self, job, stop_event=None):
+        """Exécute job() à chaque échéance jusqu'à stop_event (bloquant)"""
+        stop_event = stop_event or threading.Event()
+        logger.info(f"Ordonnancement [{self.name}]: intervalle {self.interval}s, décalage {self.offset:.2f}s, "
+                    f"politique {self.overrun_policy}")
+        while not stop_event.is_set():
+            scheduled = self.deadline()
+            if stop_event.wait(max(0.0, scheduled - time.monotonic())):
+                break
+            self.tick += 1
+
+            with self.lock:
+                busy = self.running >= self.max_concurrent
+                if not busy:
+                    self.running += 1
+            if busy:
+                self._record_skip()
+                continue
+
+            self._record_start(scheduled)
+            if self.overrun_policy == OVERRUN_CONCURRENT:
+                threading.Thread(target=self._run_job, args=(job,), name=f"cycle-{self.name}", daemon=True).start()
+            else:
+                self._run_job(job)
+                self._catch_up(time.monotonic())
+
+    async def run_async(self, job):
+        """Variante asyncio: job est une fonction retournant une coroutine"""
+        # Import différé: asyncio n'est chargé que par le mode flotte
+        import asyncio
+        tasks = set()
+
+        async def run_job():
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Erreur lors du cycle [{self.name}]: {str(e)}")
+            finally:
+                with self.lock:
+                    self.running -= 1
+
+        while True:
+            scheduled = self.deadline()
+            await asyncio.sleep(max(0.0, scheduled - time.monotonic()))
+            self.tick += 1
+
+            with self.lock:
+                busy = self.running >= self.max_concurrent
+                if not busy:
+                    self.running += 1
+            if busy:
+                self._record_skip()
+                continue
+
+            self._record_start(scheduled)
+            if self.overrun_policy == OVERRUN_CONCURRENT:
+                task = asyncio.ensure_future(run_job())
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            else:
+                await run_job()
+                self._catch_up(time.monotonic())
+
+
+def aggregate_stats(schedulers):
+    """Métriques cumulées d'un ensemble d'ordonnanceurs (mode flotte)"""
+    total = {"ticks": 0, "runs": 0, "skipped": 0, "overruns": 0, "running": 0, "lag_max_s": 0.0, "lag_total_s": 0.0}
+    for scheduler in schedulers:
+        stats = scheduler.snapshot()
+        for key in ("ticks", "runs", "skipped", "overruns", "running", "lag_total_s"):
+            total[key] += stats[key]
+        total["lag_max_s"] = max(total["lag_max_s"], stats["lag_max_s"])
+    total["lag_avg_s"] = total["lag_total_s"] / total["runs"] if total["runs"] else 0.0
+    return total
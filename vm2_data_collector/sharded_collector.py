@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Collecteur DME en mode flotte multi-processus
+Même avec les entrées/sorties asynchrones, le chiffrement SNMPv3, le codage
+BER et la sérialisation restent limités à un cœur par le GIL. Ce mode répartit
+l'inventaire entre plusieurs processus de collecte:
+
+- chaque équipement est affecté à un processus par hachage de rendez-vous
+  (nom de l'équipement, numéro du processus): l'affectation ne dépend pas de
+  l'ordre de l'inventaire et le retrait d'un processus ne déplace que ses
+  propres équipements;
+- chaque processus de collecte exécute un FleetPoller (asyncio, disjoncteurs,
+  repli HTTP) sur sa part de la flotte, sans sorties, et dépose chaque
+  échantillon dans son tampon circulaire en mémoire partagée (shm_ring.py);
+- le processus principal est l'unique écrivain: il vide les tampons et
+  alimente les sorties de chaque équipement (CSV, stockage colonnaire, delta,
+  alertes, Logstash, Elasticsearch) avec l'instant de collecte d'origine;
+- il supervise aussi les processus de collecte: redémarrage avec délai
+  croissant en cas d'arrêt ou de battement de cœur absent, retrait temporaire
+  d'un processus qui s'arrête trop souvent (ses équipements sont répartis sur
+  les autres, puis lui sont rendus après SHARD_RESTART_WINDOW).
+
+Métriques: le processus principal expose METRICS_PORT (sorties), le
+processus de collecte n expose METRICS_PORT + 1 + n (SNMP, cadence).
+
+Usage:
+    SHARD_WORKERS=4 python sharded_collector.py inventaire.json
+
+Auteur: arthur
+"""
+
+import sys
+import time
+import signal
+import marshal
+import hashlib
+import logging
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from datetime import datetime
+
+from dme_collector_snmpv3 import Config, DMECollector, logger as collector_logger
+from fleet_poller import FleetPoller, load_inventory, raise_open_files_limit
+from shm_ring import ShmRing
+
+logger = logging.getLogger("sharded_collector")
+
+# Enregistrements lus par tampon avant de passer au suivant (équité entre processus)
+DRAIN_BUDGET = 256
+# Attente de l'écrivain lorsque tous les tampons sont vides (s)
+IDLE_WAIT = 0.01
+# Période de supervision des processus de collecte (s)
+SUPERVISE_INTERVAL = 1.0
+
+
+def shard_weight(name, slot):
+    """Poids de rendez-vous d'un équipement pour un processus"""
+    return int.from_bytes(hashlib.blake2b(f"{slot}:{name}".encode(), digest_size=8).digest(), "big")
+
+
+def assign_shards(names, slots):
+    """Affecte chaque équipement au processus de plus fort poids; retourne {processus: [noms]}"""
+    shards = {slot: [] for slot in slots}
+    if not shards:
+        return shards
+    for name in names:
+        shards[max(slots, key=lambda slot: shard_weight(name, slot))].append(name)
+    return shards
+
+
+class ShardPoller(FleetPoller):
+    """FleetPoller d'un processus de collecte: les échantillons partent dans le tampon partagé"""
+
+    def __init__(self, slot, ring, devices, interval=None, fetch=None):
+        super().__init__(devices, interval=interval, fetch=fetch, outputs=False)
+        self.slot = slot
+        self.ring = ring
+        # Un seul producteur par tampon: les threads d'exécution se relaient
+        self.ring_lock = threading.Lock()
+
+    def process(self, device, collector, data):
+        if not data:
+            return False
+        payload = marshal.dumps((device.name, time.time(), data))
+        with self.ring_lock:
+            if self.ring.push(payload):
+                return True
+            self.ring.count_drop()
+        logger.warning(f"Tampon partagé plein, échantillon écarté [{device.name}]")
+        return False
+
+    async def run(self):
+        """Collecte jusqu'à SIGTERM (une boucle bloquée est arrêtée par SIGKILL du superviseur)"""
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            await asyncio.gather(self._heartbeat(), self.run_forever())
+        except asyncio.CancelledError:
+            logger.info(f"Processus de collecte {self.slot} arrêté")
+
+    async def _heartbeat(self):
+        while True:
+            self.ring.beat()
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+
+
+def run_worker(slot, ring_name, devices, interval, fetch_factory=None):
+    """Point d'entrée d'un processus de collecte"""
+    # Interruption clavier traitée par le superviseur, qui arrête les processus par SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    Config.METRICS_PORT += 1 + slot
+    ring = ShmRing(ring_name)
+    ring.beat()
+    fetch = fetch_factory(Config()) if fetch_factory is not None else None
+    logger.info(f"Processus de collecte {slot}: {len(devices)} équipements")
+    poller = ShardPoller(slot, ring, devices, interval=interval, fetch=fetch)
+    asyncio.run(poller.run())
+
+
+class Shard:
+    """Processus de collecte, son tampon et son historique d'arrêts"""
+
+    def __init__(self, slot, ring):
+        self.slot = slot
+        self.ring = ring
+        self.process = None
+        self.devices = []
+        self.restart_at = 0.0
+        self.stops = deque()
+        self.retired_until = None
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+
+class ShardSupervisor:
+    """Écrivain unique et superviseur des processus de collecte"""
+
+    def __init__(self, devices, workers=None, interval=None, fetch_factory=None):
+        self.config = Config()
+        self.devices = {device.name: device for device in devices}
+        self.interval = interval or self.config.COLLECTION_INTERVAL
+        self.fetch_factory = fetch_factory
+        workers = workers or self.config.SHARD_WORKERS or multiprocessing.cpu_count()
+        self.workers = max(1, min(workers, len(devices)))
+        # Processus démarrés par spawn: aucun état (threads, verrous) hérité de l'écrivain
+        self.context = multiprocessing.get_context("spawn")
+        self.collectors = {device.name: DMECollector(device=device) for device in devices}
+        self.shards = []
+        self.stop_event = threading.Event()
+        self.stats = {"written": 0, "restarts": 0, "rebalances": 0}
+
+    def start(self):
+        for slot in range(self.workers):
+            self.shards.append(Shard(slot, ShmRing(capacity=self.config.SHARD_RING_BYTES, create=True)))
+        self.rebalance()
+        logger.info(f"Mode flotte multi-processus: {len(self.devices)} équipements sur {self.workers} processus, "
+                    f"intervalle {self.interval}s")
+
+    def _spawn(self, shard):
+        devices = [self.devices[name] for name in shard.devices]
+        # Le battement de cœur précédent ne compte plus pour le nouveau processus
+        shard.ring.beat()
+        shard.process = self.context.Process(
+            target=run_worker,
+            args=(shard.slot, shard.ring.name, devices, self.interval, self.fetch_factory),
+            name=f"shard-{shard.slot}",
+            daemon=True
+        )
+        shard.process.start()
+
+    def _terminate(self, shard, timeout=5.0):
+        process = shard.process
+        if process is None:
+            return
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        shard.process = None
+
+    def rebalance(self):
+        """Répartit la flotte sur les processus actifs et relance ceux dont la part a changé"""
+        active = [shard for shard in self.shards if shard.retired_until is None]
+        assignment = assign_shards(sorted(self.devices), [shard.slot for shard in active])
+        for shard in self.shards:
+            devices = assignment.get(shard.slot, [])
+            if devices == shard.devices:
+                continue
+            self._terminate(shard)
+            shard.devices = devices
+            if devices:
+                self._spawn(shard)
+        self.stats["rebalances"] += 1
+
+    def supervise(self):
+        """Redémarre les processus arrêtés ou bloqués; retire et réintègre les processus instables"""
+        now = time.monotonic()
+        changed = False
+        for shard in self.shards:
+            if shard.retired_until is not None:
+                if now >= shard.retired_until:
+                    logger.info(f"Processus de collecte {shard.slot} réintégré")
+                    shard.retired_until = None
+                    shard.stops.clear()
+                    changed = True
+                continue
+
+            if shard.alive():
+                silence = now - shard.ring.heartbeat()
+                if silence > self.config.SHARD_HEARTBEAT_TIMEOUT:
+                    logger.error(f"Processus de collecte {shard.slot} sans battement de cœur depuis {silence:.0f}s: arrêt forcé")
+                    shard.process.kill()
+                    shard.process.join()
+                else:
+                    continue
+
+            if shard.process is not None:
+                exitcode = shard.process.exitcode
+                shard.process = None
+                shard.stops.append(now)
+                while shard.stops and now - shard.stops[0] > self.config.SHARD_RESTART_WINDOW:
+                    shard.stops.popleft()
+                active = sum(1 for other in self.shards if other.retired_until is None)
+                if len(shard.stops) > self.config.SHARD_MAX_RESTARTS and active > 1:
+                    logger.error(f"Processus de collecte {shard.slot} arrêté {len(shard.stops)} fois en "
+                                 f"{self.config.SHARD_RESTART_WINDOW:.0f}s: retiré, {len(shard.devices)} équipements répartis")
+                    shard.retired_until = now + self.config.SHARD_RESTART_WINDOW
+                    changed = True
+                    continue
+                backoff = min(self.config.SHARD_RESTART_BACKOFF_MAX,
+                              self.config.SHARD_RESTART_BACKOFF * 2 ** (len(shard.stops) - 1))
+                shard.restart_at = now + backoff
+                logger.error(f"Processus de collecte {shard.slot} arrêté (code {exitcode}), redémarrage dans {backoff:.0f}s")
+
+            if shard.devices and now >= shard.restart_at:
+                self._spawn(shard)
+                self.stats["restarts"] += 1
+                logger.info(f"Processus de collecte {shard.slot} redémarré ({len(shard.devices)} équipements)")
+
+        if changed:
+            self.rebalance()
+
+    def write(self, samples):
+        """
+        Alimente les sorties des équipements avec un lot d'échantillons [(nom, instant, données)].
+        Les alertes du lot sont évaluées en une fois (au plus un échantillon par équipement et par passe).
+        """
+        engine = None
+        pending = []
+        for name, sample_time, data in samples:
+            collector = self.collectors.get(name)
+            if collector is None:
+                logger.warning(f"Échantillon d'un équipement inconnu ignoré: {name}")
+                continue
+            try:
+                collector.process_data(data, sample_time, alerts=False)
+            except Exception as e:
+                logger.error(f"Erreur lors de l'écriture d'un échantillon [{name}]: {str(e)}")
+                continue
+            self.stats["written"] += 1
+            if collector.alert_engine is not None:
+                engine = collector.alert_engine
+                pending.append((name, sample_time, data))
+
+        while pending:
+            batch, seen, later = [], set(), []
+            for sample in pending:
+                (later if sample[0] in seen else batch).append(sample)
+                seen.add(sample[0])
+            pending = later
+            try:
+                events = engine.evaluate_many([(name, data) for name, _, data in batch],
+                                              [sample_time for _, sample_time, _ in batch])
+            except Exception as e:
+                logger.error(f"Erreur lors de l'évaluation des alertes: {str(e)}")
+                continue
+            for event in events:
+                self.collectors[event["device"]].emit_alerts([event])
+
+    def drain(self):
+        """Vide les tampons à tour de rôle; retourne le nombre d'échantillons reçus"""
+        samples = []
+        for shard in self.shards:
+            for _ in range(DRAIN_BUDGET):
+                payload = shard.ring.pop()
+                if payload is None:
+                    break
+                name, timestamp, data = marshal.loads(payload)
+                samples.append((name, datetime.fromtimestamp(timestamp), data))
+        if samples:
+            self.write(samples)
+        return len(samples)
+
+    def dropped(self):
+        return sum(shard.ring.dropped() for shard in self.shards)
+
+    def run(self):
+        """Boucle de l'écrivain et du superviseur, jusqu'à stop()"""
+        self.start()
+        next_check = time.monotonic() + SUPERVISE_INTERVAL
+        next_log = time.monotonic() + self.interval
+        try:
+            while not self.stop_event.is_set():
+                if not self.drain():
+                    self.stop_event.wait(IDLE_WAIT)
+                now = time.monotonic()
+                if now >= next_check:
+                    next_check = now + SUPERVISE_INTERVAL
+                    self.supervise()
+                if now >= next_log:
+                    next_log = now + self.interval
+                    alive = sum(1 for shard in self.shards if shard.alive())
+                    logger.info(f"Écrivain: {self.stats['written']} échantillons écrits, {self.dropped()} écartés, "
+                                f"{alive}/{len(self.shards)} processus actifs, {self.stats['restarts']} redémarrages")
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def shutdown(self):
+        """Arrête les processus de collecte, écrit les derniers échantillons et libère les tampons"""
+        for shard in self.shards:
+            self._terminate(shard)
+        self.drain()
+        for shard in self.shards:
+            shard.ring.close()
+        self.shards = []
+
+
+# Point d'entrée principal
+if __name__ == "__main__":
+    inventory_path = sys.argv[1] if len(sys.argv) > 1 else Config.FLEET_INVENTORY
+    if not inventory_path:
+        collector_logger.critical("Aucun inventaire fourni (argument ou variable FLEET_INVENTORY)")
+        exit(1)
+    try:
+        raise_open_files_limit()
+        supervisor = ShardSupervisor(load_inventory(inventory_path))
+        signal.signal(signal.SIGTERM, lambda signum, frame: supervisor.stop())
+        supervisor.run()
+    except KeyboardInterrupt:
+        logger.info("Collecte flotte interrompue par l'utilisateur")
+    except Exception as e:
+        logger.critical(f"Erreur critique: {str(e)}")
+        exit(1)
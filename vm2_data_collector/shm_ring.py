@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tampon circulaire en mémoire partagée (un producteur, un consommateur)
+Transporte des enregistrements d'octets entre deux processus sans verrou ni
+appel système: le producteur écrit l'enregistrement puis publie sa position
+d'écriture, le consommateur lit puis publie sa position de lecture. Chaque
+position n'est écrite que par un seul processus (mot de 8 octets aligné).
+
+Un producteur qui meurt au milieu d'une écriture ne laisse qu'un
+enregistrement non publié, écrasé par le producteur suivant: le tampon reste
+utilisable sans réinitialisation, ce qui permet de redémarrer un processus
+producteur sur le même tampon.
+
+Disposition:
+  0    en-tête (magie, capacité)
+  64   position d'écriture (octets écrits depuis la création)
+  128  position de lecture (octets lus depuis la création)
+  192  battement de cœur du producteur (horloge monotone, s)
+  200  enregistrements écartés faute de place (compteur du producteur)
+  256  données: [longueur u32][octets][bourrage jusqu'à 8 octets], PAD = fin de tour
+
+Auteur: arthur
+"""
+
+import time
+import struct
+from multiprocessing import shared_memory
+
+RING_MAGIC = b"DMERING1"
+HEADER = struct.Struct("<8sQ")
+POSITION = struct.Struct("<Q")
+HEARTBEAT = struct.Struct("<d")
+RECORD = struct.Struct("<I")
+# Marqueur de fin de tour: l'enregistrement suivant commence au début de la zone de données
+PAD = 0xFFFFFFFF
+
+WRITE_OFFSET = 64
+READ_OFFSET = 128
+HEARTBEAT_OFFSET = 192
+DROPPED_OFFSET = 200
+DATA_OFFSET = 256
+
+
+def _aligned(size):
+    return (size + 7) & ~7
+
+
+class ShmRing:
+    """Tampon circulaire d'enregistrements dans un segment de mémoire partagée"""
+
+    def __init__(self, name=None, capacity=4 * 1024 * 1024, create=False):
+        if create:
+            capacity = _aligned(capacity)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=DATA_OFFSET + capacity)
+            self.buffer = self.shm.buf
+            self.buffer[:DATA_OFFSET] = bytes(DATA_OFFSET)
+            HEADER.pack_into(self.buffer, 0, RING_MAGIC, capacity)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.buffer = self.shm.buf
+            magic, capacity = HEADER.unpack_from(self.buffer, 0)
+            if magic != RING_MAGIC:
+                raise ValueError(f"Segment de mémoire partagée inattendu: {name}")
+        self.name = self.shm.name
+        self.capacity = capacity
+        self.owner = create
+
+    def _position(self, offset):
+        return POSITION.unpack_from(self.buffer, offset)[0]
+
+    def used(self):
+        """Octets en attente de lecture"""
+        return self._position(WRITE_OFFSET) - self._position(READ_OFFSET)
+
+    def push(self, payload):
+        """Ajoute un enregistrement (côté producteur); retourne False si le tampon est plein"""
+        size = _aligned(RECORD.size + len(payload))
+        if size > self.capacity:
+            raise ValueError(f"Enregistrement trop grand pour le tampon ({len(payload)} octets)")
+        write = self._position(WRITE_OFFSET)
+        offset = write % self.capacity
+        room = self.capacity - offset
+        needed = size if size <= room else room + size
+        if self.capacity - (write - self._position(READ_OFFSET)) < needed:
+            return False
+        if size > room:
+            RECORD.pack_into(self.buffer, DATA_OFFSET + offset, PAD)
+            write += room
+            offset = 0
+        start = DATA_OFFSET + offset
+        RECORD.pack_into(self.buffer, start, len(payload))
+        self.buffer[start + RECORD.size:start + RECORD.size + len(payload)] = payload
+        # Publication: l'enregistrement est entièrement écrit avant la nouvelle position
+        POSITION.pack_into(self.buffer, WRITE_OFFSET, write + size)
+        return True
+
+    def pop(self):
+        """Retire le plus ancien enregistrement (côté consommateur); None si le tampon est vide"""
+        read = self._position(READ_OFFSET)
+        if read == self._position(WRITE_OFFSET):
+            return None
+        offset = read % self.capacity
+        length = RECORD.unpack_from(self.buffer, DATA_OFFSET + offset)[0]
+        if length == PAD:
+            read += self.capacity - offset
+            offset = 0
+            length = RECORD.unpack_from(self.buffer, DATA_OFFSET)[0]
+        start = DATA_OFFSET + offset + RECORD.size
+        payload = bytes(self.buffer[start:start + length])
+        POSITION.pack_into(self.buffer, READ_OFFSET, read + _aligned(RECORD.size + length))
+        return payload
+
+    def beat(self):
+        """Battement de cœur du producteur"""
+        HEARTBEAT.pack_into(self.buffer, HEARTBEAT_OFFSET, time.monotonic())
+
+    def heartbeat(self):
+        """Dernier battement de cœur du producteur (horloge monotone, 0 = jamais)"""
+        return HEARTBEAT.unpack_from(self.buffer, HEARTBEAT_OFFSET)[0]
+
+    def count_drop(self):
+        """Compte un enregistrement écarté faute de place (côté producteur, sous son verrou d'écriture)"""
+        POSITION.pack_into(self.buffer, DROPPED_OFFSET, self.dropped() + 1)
+
+    def dropped(self):
+        return self._position(DROPPED_OFFSET)
+
+    def close(self):
+        """Détache le segment; le créateur le supprime"""
+        self.buffer = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
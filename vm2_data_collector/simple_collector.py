@@ -8,13 +8,30 @@ Auteur: arthur
 """
 
 import os
+import re
+import sys
 import time
-import csv
-import json
 import logging
-import random
-import socket
 from datetime import datetime
+from urllib.parse import urlsplit
+from logstash_shipper import get_shipper
+from spool import get_spool
+from csv_sink import RotatingCSVSink
+from history_query import attach_index
+from scheduler import FixedRateScheduler
+from delta import DeltaEncoder, parse_deadbands
+from alerts import get_engine, log_event
+from es_bulk import get_bulk_sink
+import metrics_exporter
+
+try:
+    from dme_registry import REGISTRY
+    from dme_signal import SignalModel, load_models
+except ImportError:
+    # Exécution depuis le dépôt: registre partagé dans common/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+    from dme_registry import REGISTRY
+    from dme_signal import SignalModel, load_models
 
 # Configuration du logging
 logging.basicConfig(
@@ -30,119 +47,134 @@ logger = logging.getLogger("snmp_collector")
 # Configuration
 class Config:
     COLLECTION_INTERVAL = int(os.environ.get("COLLECTION_INTERVAL", 10))
+    # Cadence fixe alignée sur l'heure murale; dépassement: "skip" ou "concurrent"
+    COLLECTION_ALIGN = os.environ.get("COLLECTION_ALIGN", "true").lower() == "true"
+    COLLECTION_OVERRUN_POLICY = os.environ.get("COLLECTION_OVERRUN_POLICY", "skip")
+    COLLECTION_MAX_CONCURRENT = int(os.environ.get("COLLECTION_MAX_CONCURRENT", 2))
+    # Données simulées: graine (vide = aléatoire) et modèles de signaux par métrique (common/dme_signal.py)
+    SIM_SEED = int(os.environ["SIM_SEED"]) if os.environ.get("SIM_SEED") else None
+    SIM_SIGNAL_MODELS = os.environ.get("SIM_SIGNAL_MODELS", "")
     OUTPUT_FILE = os.environ.get("OUTPUT_FILE", "/app/data/dme_data.csv")
+    # Écriture CSV: politique fsync (always, interval, never), rotation et rétention
+    CSV_FSYNC_POLICY = os.environ.get("CSV_FSYNC_POLICY", "interval")
+    CSV_FSYNC_INTERVAL = float(os.environ.get("CSV_FSYNC_INTERVAL", 10))
+    CSV_FLUSH_INTERVAL = float(os.environ.get("CSV_FLUSH_INTERVAL", 1))
+    CSV_ROTATE_BYTES = int(os.environ.get("CSV_ROTATE_BYTES", 50 * 1024 * 1024))
+    CSV_ROTATE_DAILY = os.environ.get("CSV_ROTATE_DAILY", "true").lower() == "true"
+    CSV_MAX_SEGMENTS = int(os.environ.get("CSV_MAX_SEGMENTS", 30))
+    CSV_COMPRESS = os.environ.get("CSV_COMPRESS", "true").lower() == "true"
+    # Index temporel creux tenu à côté de chaque fichier CSV (history_query.py)
+    HISTORY_INDEX = os.environ.get("HISTORY_INDEX", "true").lower() == "true"
+    
+    # Émission par variations (delta.py): cellules vides = inchangé, keyframe périodique
+    DELTA_MODE = os.environ.get("DELTA_MODE", "false").lower() == "true"
+    DELTA_KEYFRAME_INTERVAL = int(os.environ.get("DELTA_KEYFRAME_INTERVAL", 20))
+    DELTA_DEADBANDS = os.environ.get("DELTA_DEADBANDS", "")
+    
+    # Détection d'anomalies à la collecte (alerts.py)
+    ALERTS_ENABLED = os.environ.get("ALERTS_ENABLED", "true").lower() == "true"
+    ALERT_RULES = os.environ.get("ALERT_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alert_rules.json"))
     
     LOGSTASH_ENABLED = os.environ.get("LOGSTASH_ENABLED", "true").lower() == "true"
     LOGSTASH_HOST = os.environ.get("LOGSTASH_HOST", "logstash")
     LOGSTASH_PORT = int(os.environ.get("LOGSTASH_PORT", 5044))
+    LOGSTASH_BATCH_SIZE = int(os.environ.get("LOGSTASH_BATCH_SIZE", 100))
+    LOGSTASH_FLUSH_INTERVAL = float(os.environ.get("LOGSTASH_FLUSH_INTERVAL", 1.0))
+    LOGSTASH_QUEUE_SIZE = int(os.environ.get("LOGSTASH_QUEUE_SIZE", 10000))
+    
+    # Sortie directe Elasticsearch _bulk (es_bulk.py)
+    ES_BULK_ENABLED = os.environ.get("ES_BULK_ENABLED", "false").lower() == "true"
+    ES_URL = os.environ.get("ES_URL", "http://elasticsearch:9200")
+    ES_USER = os.environ.get("ES_USER", "elastic")
+    ES_PASSWORD = os.environ.get("ES_PASSWORD", "")
+    ES_INDEX_PREFIX = os.environ.get("ES_INDEX_PREFIX", "rcms-dme")
+    ES_BATCH_SIZE = int(os.environ.get("ES_BATCH_SIZE", 500))
+    ES_FLUSH_INTERVAL = float(os.environ.get("ES_FLUSH_INTERVAL", 1.0))
+    ES_POOL_SIZE = int(os.environ.get("ES_POOL_SIZE", 2))
+    ES_MAX_RETRIES = int(os.environ.get("ES_MAX_RETRIES", 5))
+    ES_CA_FILE = os.environ.get("ES_CA_FILE") or None
+    
+    # Journal sur disque des sorties (spool.py): aucun document perdu pendant une panne de Logstash
+    # ou d'Elasticsearch ("" = désactivé), reprise de l'arriéré à SPOOL_DRAIN_RATE documents/s
+    SPOOL_DIR = os.environ.get("SPOOL_DIR", "")
+    SPOOL_SEGMENT_BYTES = int(os.environ.get("SPOOL_SEGMENT_BYTES", 16 * 1024 * 1024))
+    SPOOL_MAX_BYTES = int(os.environ.get("SPOOL_MAX_BYTES", 1024 * 1024 * 1024))
+    SPOOL_FSYNC = os.environ.get("SPOOL_FSYNC", "false").lower() == "true"
+    SPOOL_DRAIN_RATE = float(os.environ.get("SPOOL_DRAIN_RATE", 200))
+    
+    # Métriques internes au format Prometheus (metrics_exporter.py)
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_PORT = int(os.environ.get("METRICS_PORT", 9108))
 
-# OIDs et noms
-DME_OIDS = {
-    "1.3.6.1.4.1.32275.2.1.2.2.5.10": "mtuExecTXPADelayCurrentValue-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.34": "mtuExecTXPBDelayCurrentValue-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.10": "mtuExecTXPADelayCurrentValue-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.34": "mtuExecTXPBDelayCurrentValue-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.11": "mtuExecTXPAPulsePairSpacing-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.35": "mtuExecTXPBPulsePairSpacing-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.11": "mtuExecTXPAPulsePairSpacing-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.35": "mtuExecTXPBPulsePairSpacing-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.12": "mtuExecTXPATransmittedPowerCurrentValue-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.36": "mtuExecTXPBTransmittedPowerCurrentValue-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.12": "mtuExecTXPATransmittedPowerCurrentValue-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.36": "mtuExecTXPBTransmittedPowerCurrentValue-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.13": "mtuExecTXPAEfficiency-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.37": "mtuExecTXPBEfficiency-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.13": "mtuExecTXPAEfficiency-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.37": "mtuExecTXPBEfficiency-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.14": "mtuExecTXPATxFreqError-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.38": "mtuExecTXPBTxFreqError-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.14": "mtuExecTXPATxFreqError-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.38": "mtuExecTXPBTxFreqError-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.15": "mtuExecRadiatedPowerCurrentValue-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.15": "mtuExecRadiatedPowerCurrentValue-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.16": "mtuExecTransmissionRate-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.16": "mtuExecTransmissionRate-3",
-    "1.3.6.1.4.1.32275.2.1.2.2.5.17": "mtuExecIdentStatus-0",
-    "1.3.6.1.4.1.32275.2.1.2.2.8.17": "mtuExecIdentStatus-3",
-}
+# OIDs et noms (registre partagé common/dme_registry.py)
+DME_OIDS = REGISTRY.oid_names
 
 class SimpleCollector:
     def __init__(self):
         self.config = Config()
-        self.column_names = ["Timestamp"] + list(DME_OIDS.values())
+        self.column_names = list(REGISTRY.column_names)
+        self.scheduler = None
+        self.metrics = self.config.METRICS_ENABLED
+        if self.metrics:
+            metrics_exporter.start_http_server(self.config.METRICS_PORT)
         self._initialize_output_file()
+        self.delta_encoder = None
+        if self.config.DELTA_MODE:
+            self.delta_encoder = DeltaEncoder(
+                self.column_names[1:],
+                keyframe_interval=self.config.DELTA_KEYFRAME_INTERVAL,
+                deadbands=parse_deadbands(self.config.DELTA_DEADBANDS)
+            )
+        self.alert_engine = None
+        if self.config.ALERTS_ENABLED:
+            try:
+                self.alert_engine = get_engine(self.column_names[1:], self.config.ALERT_RULES)
+                if self.metrics:
+                    metrics_exporter.track_alert_engine(self.alert_engine)
+            except Exception as e:
+                logger.error(f"Erreur règles d'alerte: {str(e)}")
         
+        # Modèle de signaux vectorisé (common/dme_signal.py): un pas de marche par collecte
+        self.signal = SignalModel(
+            1,
+            load_models(self.config.SIM_SIGNAL_MODELS),
+            self.config.SIM_SEED,
+            reference_interval=self.config.COLLECTION_INTERVAL
+        )
         # État initial des données
-        self.dme_data = {
-            "mtuExecTXPADelayCurrentValue-0": 0,
-            "mtuExecTXPBDelayCurrentValue-0": 49200,
-            "mtuExecTXPADelayCurrentValue-3": 0,
-            "mtuExecTXPBDelayCurrentValue-3": 49200,
-            "mtuExecTXPAPulsePairSpacing-0": 0,
-            "mtuExecTXPBPulsePairSpacing-0": 12000,
-            "mtuExecTXPAPulsePairSpacing-3": 0,
-            "mtuExecTXPBPulsePairSpacing-3": 12000,
-            "mtuExecTXPATransmittedPowerCurrentValue-0": 0,
-            "mtuExecTXPBTransmittedPowerCurrentValue-0": 1080,
-            "mtuExecTXPATransmittedPowerCurrentValue-3": 0,
-            "mtuExecTXPBTransmittedPowerCurrentValue-3": 1125,
-            "mtuExecTXPAEfficiency-0": 0,
-            "mtuExecTXPBEfficiency-0": 90,
-            "mtuExecTXPAEfficiency-3": 0,
-            "mtuExecTXPBEfficiency-3": 91,
-            "mtuExecTXPATxFreqError-0": 0,
-            "mtuExecTXPBTxFreqError-0": 2,
-            "mtuExecTXPATxFreqError-3": 0,
-            "mtuExecTXPBTxFreqError-3": 2,
-            "mtuExecRadiatedPowerCurrentValue-0": 980,
-            "mtuExecRadiatedPowerCurrentValue-3": 970,
-            "mtuExecTransmissionRate-0": 840,
-            "mtuExecTransmissionRate-3": 840,
-            "mtuExecIdentStatus-0": 1,
-            "mtuExecIdentStatus-3": 1,
-        }
+        self.dme_data = {entry.name: entry.initial for entry in REGISTRY}
         
         logger.info("Collecteur DME simplifié initialisé")
         logger.info(f"Intervalle: {self.config.COLLECTION_INTERVAL}s")
         logger.info(f"Logstash: {self.config.LOGSTASH_ENABLED}")
+        logger.info(f"Elasticsearch _bulk: {self.config.ES_BULK_ENABLED}")
         logger.info(f"OIDs: {len(DME_OIDS)}")
+        logger.info(f"Mode delta: {self.config.DELTA_MODE}")
     
     def _initialize_output_file(self):
-        """Initialise le fichier CSV"""
-        if not os.path.isfile(self.config.OUTPUT_FILE):
-            try:
-                os.makedirs(os.path.dirname(self.config.OUTPUT_FILE), exist_ok=True)
-                with open(self.config.OUTPUT_FILE, 'w', newline='') as csvfile:
-                    writer = csv.writer(csvfile, delimiter='\t')
-                    writer.writerow(self.column_names)
-                logger.info(f"Fichier CSV initialisé: {self.config.OUTPUT_FILE}")
-            except Exception as e:
-                logger.error(f"Erreur init CSV: {str(e)}")
-                raise
+        """Ouvre le fichier CSV pour toute la durée de la collecte"""
+        try:
+            self.csv_sink = RotatingCSVSink(
+                self.config.OUTPUT_FILE,
+                self.column_names,
+                fsync_policy=self.config.CSV_FSYNC_POLICY,
+                fsync_interval=self.config.CSV_FSYNC_INTERVAL,
+                flush_interval=self.config.CSV_FLUSH_INTERVAL,
+                rotate_bytes=self.config.CSV_ROTATE_BYTES,
+                rotate_daily=self.config.CSV_ROTATE_DAILY,
+                max_segments=self.config.CSV_MAX_SEGMENTS,
+                compress=self.config.CSV_COMPRESS
+            )
+            if self.config.HISTORY_INDEX:
+                attach_index(self.csv_sink)
+        except Exception as e:
+            logger.error(f"Erreur init CSV: {str(e)}")
+            raise
     
     def update_values(self):
-        """Met à jour les valeurs avec des variations réalistes"""
-        # Variation des délais
-        self.dme_data["mtuExecTXPBDelayCurrentValue-0"] += random.randint(-50, 50)
-        self.dme_data["mtuExecTXPBDelayCurrentValue-3"] += random.randint(-50, 50)
-        
-        # Variation de la puissance
-        self.dme_data["mtuExecTXPBTransmittedPowerCurrentValue-0"] += random.randint(-5, 5)
-        self.dme_data["mtuExecTXPBTransmittedPowerCurrentValue-3"] += random.randint(-5, 5)
-        
-        # Variation de l'efficacité
-        self.dme_data["mtuExecTXPBEfficiency-0"] += random.randint(-2, 2)
-        self.dme_data["mtuExecTXPBEfficiency-3"] += random.randint(-2, 2)
-        
-        # Normaliser
-        self.dme_data["mtuExecTXPBDelayCurrentValue-0"] = max(49000, min(49400, self.dme_data["mtuExecTXPBDelayCurrentValue-0"]))
-        self.dme_data["mtuExecTXPBDelayCurrentValue-3"] = max(49000, min(49400, self.dme_data["mtuExecTXPBDelayCurrentValue-3"]))
-        
-        self.dme_data["mtuExecTXPBTransmittedPowerCurrentValue-0"] = max(1050, min(1100, self.dme_data["mtuExecTXPBTransmittedPowerCurrentValue-0"]))
-        self.dme_data["mtuExecTXPBTransmittedPowerCurrentValue-3"] = max(1100, min(1150, self.dme_data["mtuExecTXPBTransmittedPowerCurrentValue-3"]))
-        
-        self.dme_data["mtuExecTXPBEfficiency-0"] = max(85, min(95, self.dme_data["mtuExecTXPBEfficiency-0"]))
-        self.dme_data["mtuExecTXPBEfficiency-3"] = max(85, min(95, self.dme_data["mtuExecTXPBEfficiency-3"]))
+        """Met à jour les valeurs avec des variations réalistes (modèles de signaux par métrique)"""
+        values = self.signal.advance()[0].tolist()
+        self.dme_data = dict(zip(REGISTRY.names, values))
     
     def collect_data(self):
         """Collecte les données DME"""
@@ -154,18 +186,13 @@ class SimpleCollector:
         logger.info(f"✓ Collecte réussie: {len(self.dme_data)} métriques")
         return self.dme_data
     
-    def format_data(self, data):
+    def format_data(self, data, sample_time=None, missing=0):
         """Formate les données pour CSV"""
-        if not data:
+        if data is None:
             return None
         
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-4]
-        row = [timestamp]
-        
-        for column in self.column_names[1:]:
-            row.append(data.get(column, 0))
-        
-        return row
+        timestamp = (sample_time or datetime.now()).strftime("%Y-%m-%d %H:%M:%S.%f")[:-4]
+        return REGISTRY.format_row(data, timestamp, missing)
     
     def save_to_csv(self, row):
         """Sauvegarde CSV"""
@@ -173,18 +200,69 @@ class SimpleCollector:
             return False
         
         try:
-            with open(self.config.OUTPUT_FILE, 'a', newline='') as csvfile:
-                writer = csv.writer(csvfile, delimiter='\t')
-                writer.writerow(row)
+            started = time.monotonic()
+            self.csv_sink.write_row(row)
+            if self.metrics:
+                metrics_exporter.CSV_WRITE.observe(time.monotonic() - started)
             logger.info("✓ Données CSV sauvegardées")
             return True
         except Exception as e:
             logger.error(f"Erreur CSV: {str(e)}")
             return False
     
-    def send_to_logstash(self, data):
-        """Envoi vers Logstash"""
-        if not self.config.LOGSTASH_ENABLED or not data:
+    def _get_spool(self, name):
+        """Journal sur disque partagé d'une sortie (None si SPOOL_DIR n'est pas défini)"""
+        if not self.config.SPOOL_DIR:
+            return None
+        return get_spool(
+            os.path.join(self.config.SPOOL_DIR, re.sub(r"[^A-Za-z0-9._-]", "_", name)),
+            segment_bytes=self.config.SPOOL_SEGMENT_BYTES,
+            max_bytes=self.config.SPOOL_MAX_BYTES,
+            fsync=self.config.SPOOL_FSYNC
+        )
+    
+    def ship(self, document):
+        """Mise en file vers Logstash et/ou Elasticsearch; vrai si aucun document n'a été écarté"""
+        accepted = True
+        if self.config.LOGSTASH_ENABLED:
+            shipper = get_shipper(
+                self.config.LOGSTASH_HOST,
+                self.config.LOGSTASH_PORT,
+                batch_size=self.config.LOGSTASH_BATCH_SIZE,
+                flush_interval=self.config.LOGSTASH_FLUSH_INTERVAL,
+                queue_size=self.config.LOGSTASH_QUEUE_SIZE,
+                spool=self._get_spool(f"logstash-{self.config.LOGSTASH_HOST}-{self.config.LOGSTASH_PORT}"),
+                drain_rate=self.config.SPOOL_DRAIN_RATE
+            )
+            if self.metrics:
+                metrics_exporter.track_output("logstash", f"{self.config.LOGSTASH_HOST}:{self.config.LOGSTASH_PORT}", shipper)
+            if not shipper.submit(document):
+                logger.warning("File Logstash pleine, document le plus ancien écarté")
+                accepted = False
+        if self.config.ES_BULK_ENABLED:
+            sink = get_bulk_sink(
+                self.config.ES_URL,
+                user=self.config.ES_USER,
+                password=self.config.ES_PASSWORD,
+                index_prefix=self.config.ES_INDEX_PREFIX,
+                batch_size=self.config.ES_BATCH_SIZE,
+                flush_interval=self.config.ES_FLUSH_INTERVAL,
+                pool_size=self.config.ES_POOL_SIZE,
+                max_retries=self.config.ES_MAX_RETRIES,
+                ca_file=self.config.ES_CA_FILE,
+                spool=self._get_spool(f"elasticsearch-{urlsplit(self.config.ES_URL).netloc}"),
+                drain_rate=self.config.SPOOL_DRAIN_RATE
+            )
+            if self.metrics:
+                metrics_exporter.track_output("elasticsearch", self.config.ES_URL, sink)
+            if not sink.submit(document):
+                logger.warning("File Elasticsearch pleine, document le plus ancien écarté")
+                accepted = False
+        return accepted
+    
+    def send_to_logstash(self, data, keyframe=None):
+        """Envoi vers Logstash / Elasticsearch (keyframe: None hors mode delta)"""
+        if not (self.config.LOGSTASH_ENABLED or self.config.ES_BULK_ENABLED) or not data:
             return
         
         try:
@@ -199,34 +277,55 @@ class SimpleCollector:
                     "interval": self.config.COLLECTION_INTERVAL
                 }
             }
+            if keyframe is not None:
+                logstash_data["delta"] = True
+                logstash_data["keyframe"] = keyframe
             
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(5)
-            sock.connect((self.config.LOGSTASH_HOST, self.config.LOGSTASH_PORT))
-            
-            message = json.dumps(logstash_data) + '\n'
-            sock.sendall(message.encode('utf-8'))
-            sock.close()
-            
-            logger.info("✓ Données envoyées à Logstash")
+            if self.ship(logstash_data):
+                logger.info("✓ Données transmises aux sorties")
             
         except Exception as e:
             logger.error(f"Erreur Logstash: {str(e)}")
     
+    def check_alerts(self, data, sample_time):
+        """Évalue l'échantillon contre les règles et envoie les événements dme_alert"""
+        try:
+            events = self.alert_engine.evaluate(None, data, sample_time)
+        except Exception as e:
+            logger.error(f"Erreur alertes: {str(e)}")
+            return []
+        for event in events:
+            log_event(event)
+            if self.config.LOGSTASH_ENABLED or self.config.ES_BULK_ENABLED:
+                self.ship(event)
+        return events
+    
     def run_collection_cycle(self):
         """Cycle complet de collecte"""
         data = self.collect_data()
         if not data:
             return False
         
-        formatted_data = self.format_data(data)
+        # Mode delta: seules les variations sont écrites et envoyées
+        sample_time = datetime.now()
+        emitted, keyframe = data, None
+        if self.delta_encoder is not None:
+            if self.csv_sink.will_rotate(sample_time):
+                self.delta_encoder.force_keyframe()
+            emitted, keyframe = self.delta_encoder.encode(data)
+            logger.info(f"Mode delta: {len(emitted)}/{len(data)} métriques émises{' (keyframe)' if keyframe else ''}")
+        
+        formatted_data = self.format_data(emitted, sample_time, missing="" if keyframe is not None else 0)
         if not formatted_data:
             return False
         
         success = self.save_to_csv(formatted_data)
         
-        if success and self.config.LOGSTASH_ENABLED:
-            self.send_to_logstash(data)
+        if success and (self.config.LOGSTASH_ENABLED or self.config.ES_BULK_ENABLED):
+            self.send_to_logstash(emitted, keyframe)
+        
+        if self.alert_engine is not None:
+            self.check_alerts(data, sample_time)
         
         logger.info("=== FIN CYCLE ===")
         return success
@@ -236,14 +335,24 @@ class SimpleCollector:
         logger.info("DÉMARRAGE COLLECTEUR DME SIMPLIFIÉ")
         logger.info("Mode: Simulation complète avec données réalistes")
         
-        while True:
-            try:
-                self.run_collection_cycle()
-            except Exception as e:
-                logger.error(f"Erreur cycle: {str(e)}")
-            
-            logger.info(f"Attente {self.config.COLLECTION_INTERVAL}s...")
-            time.sleep(self.config.COLLECTION_INTERVAL)
+        # Cadence fixe: la durée d'un cycle ne décale pas les suivants
+        self.scheduler = FixedRateScheduler(
+            self.config.COLLECTION_INTERVAL,
+            align=self.config.COLLECTION_ALIGN,
+            overrun_policy=self.config.COLLECTION_OVERRUN_POLICY,
+            max_concurrent=self.config.COLLECTION_MAX_CONCURRENT
+        )
+        if self.metrics:
+            metrics_exporter.track_scheduler(self.scheduler)
+        self.scheduler.run(self._scheduled_cycle)
+    
+    def _scheduled_cycle(self):
+        started = time.monotonic()
+        success = self.run_collection_cycle()
+        if self.metrics:
+            metrics_exporter.CYCLE_DURATION.labels("success" if success else "failure").observe(time.monotonic() - started)
+        stats = self.scheduler.snapshot()
+        logger.info(f"Cadence: retard {stats['lag_last_s'] * 1000:.0f} ms, {stats['skipped']} échéance(s) sautée(s) sur {stats['ticks']}")
 
 if __name__ == "__main__":
     try:
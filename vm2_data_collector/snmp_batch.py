@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Regroupement des requêtes SNMP GET en PDU de taille bornée
+Ce module découpe une liste d'OIDs en lots tenant dans la taille de message
+maximale acceptée par l'agent, et ramène les erreurs partielles (varbinds en
+exception, errorIndex) aux OIDs concernés.
+
+Auteur: arthur
+"""
+
+import logging
+
+logger = logging.getLogger("snmp_batch")
+
+# Surcoût fixe estimé d'un message SNMPv3 authPriv hors varbinds (en octets):
+# en-tête global, paramètres USM (engineID, boots, time, empreinte HMAC, sel),
+# scopedPDU chiffré (contextEngineID, contextName) et en-tête de la PDU.
+SNMPV3_MESSAGE_OVERHEAD = 180
+
+# Taille maximale de l'encodage BER d'une valeur scalaire en réponse
+# (Counter64 = 1 octet de tag + 1 octet de longueur + 9 octets de contenu)
+MAX_SCALAR_VALUE_SIZE = 11
+
+# Valeurs d'exception SNMPv2 renvoyées à la place d'une valeur (RFC 3416)
+EXCEPTION_VALUE_TYPES = frozenset(("NoSuchObject", "NoSuchInstance", "EndOfMibView"))
+
+# Code errorStatus "tooBig" (RFC 3416)
+ERROR_STATUS_TOO_BIG = 1
+
+
+def _ber_length_size(length):
+    """Nombre d'octets nécessaires pour encoder une longueur BER"""
+    if length < 0x80:
+        return 1
+    size = 1
+    while length:
+        length >>= 8
+        size += 1
+    return size
+
+
+def _ber_tlv_size(content_length):
+    """Taille totale d'un TLV BER (tag sur un octet) pour un contenu donné"""
+    return 1 + _ber_length_size(content_length) + content_length
+
+
+def _oid_content_size(oid):
+    """Taille du contenu BER d'un OBJECT IDENTIFIER"""
+    arcs = oid if isinstance(oid, tuple) else tuple(map(int, oid.split('.')))
+    # Les deux premiers arcs sont fusionnés en un seul sous-identifiant
+    subids = (arcs[0] * 40 + arcs[1],) + arcs[2:]
+    size = 0
+    for subid in subids:
+        size += 1
+        subid >>= 7
+        while subid:
+            size += 1
+            subid >>= 7
+    return size
+
+
+def estimate_varbind_size(oid, value_size=MAX_SCALAR_VALUE_SIZE):
+    """Estime la taille encodée d'un varbind (OID + valeur) dans la réponse"""
+    content = _ber_tlv_size(_oid_content_size(oid)) + value_size
+    return _ber_tlv_size(content)
+
+
+def plan_batches(oids, max_msg_size, max_varbinds=0, overhead=SNMPV3_MESSAGE_OVERHEAD):
+    """
+    Répartit les OIDs en lots dont la réponse estimée tient dans max_msg_size.
+
+    L'estimation porte sur la réponse (plus grande que la requête, les valeurs
+    remplaçant les NULL). max_varbinds borne en plus le nombre de varbinds par
+    PDU (0 = pas de limite). Un OID seul est toujours placé dans un lot, même
+    s'il dépasse la taille estimée: l'agent tranchera avec tooBig.
+    """
+    budget = max_msg_size - overhead
+    batches = []
+    current = []
+    current_size = 0
+
+    for oid in oids:
+        size = estimate_varbind_size(oid)
+        full = max_varbinds and len(current) >= max_varbinds
+        if current and (full or current_size + size > budget):
+            batches.append(current)
+            current = []
+            current_size = 0
+        current.append(oid)
+        current_size += size
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_batch(batch):
+    """Coupe un lot en deux moitiés (réponse tooBig de l'agent)"""
+    middle = len(batch) // 2
+    return [part for part in (batch[:middle], batch[middle:]) if part]
+
+
+def is_timeout(error_indication):
+    """Vrai si l'indication d'erreur pysnmp correspond à une absence de réponse"""
+    return "timeout" in str(error_indication).lower()
+
+
+def varbind_exception(value):
+    """Retourne le nom de l'exception SNMPv2 portée par une valeur, sinon None"""
+    name = value.__class__.__name__
+    if name in EXCEPTION_VALUE_TYPES:
+        return name
+    return None
+
+
+class BatchedGet:
+    """
+    Suivi d'une collecte GET découpée en lots.
+
+    L'appelant récupère les lots avec next_batch(), exécute la requête (de
+    façon synchrone ou asyncio) et remet la réponse à handle_response(), qui
+    redécoupe, relance ou ventile les valeurs et erreurs par OID.
+
+    Avec fail_fast, la première expiration abandonne les lots restants:
+    l'équipement est considéré injoignable pour ce cycle.
+    """
+
+    def __init__(self, oids, max_msg_size, max_varbinds=0, fail_fast=False):
+        self.max_msg_size = max_msg_size
+        self.fail_fast = fail_fast
+        self.timed_out = False
+        self.pending = plan_batches(oids, max_msg_size, max_varbinds)
+        self.values = {}
+        self.errors = {}
+        self.requests = 0
+        # Allers-retours mesurés [(lot, secondes)] et motifs d'échec, un par événement
+        self.round_trips = []
+        self.failures = []
+
+    def next_batch(self):
+        """Retourne le prochain lot à interroger, ou None si la collecte est terminée"""
+        if not self.pending:
+            return None
+        self.requests += 1
+        return self.pending.pop(0)
+
+    def fail(self, batch, reason):
+        """Marque tous les OIDs d'un lot en erreur"""
+        for oid in batch:
+            self.errors[oid] = reason
+
+    def handle_response(self, batch, error_indication, error_status, error_index, var_binds, rtt=None):
+        """Traite la réponse d'un GET multi-varbinds pour le lot donné (rtt: durée de l'aller-retour)"""
+        # Erreur de transport ou de sécurité: tout le lot est perdu
+        if error_indication:
+            logger.error(f"Erreur SNMP: {error_indication}")
+            self.failures.append(str(error_indication))
+            self.fail(batch, str(error_indication))
+            if is_timeout(error_indication):
+                self.timed_out = True
+                if self.fail_fast and self.pending:
+                    logger.warning(f"Équipement muet: {sum(len(pending) for pending in self.pending)} OIDs restants abandonnés")
+                    for pending in self.pending:
+                        self.fail(pending, str(error_indication))
+                    self.pending = []
+            return
+
+        if rtt is not None:
+            self.round_trips.append((batch, rtt))
+
+        if error_status:
+            status = error_status.prettyPrint()
+
+            # Réponse trop grande: on coupe le lot et on abaisse la taille apprise
+            self.failures.append(status)
+            if int(error_status) == ERROR_STATUS_TOO_BIG and len(batch) > 1:
+                logger.warning(f"Réponse tooBig pour {len(batch)} OIDs, découpage de la PDU")
+                self.max_msg_size = max(484, self.max_msg_size // 2)
+                self.pending[0:0] = split_batch(batch)
+                return
+
+            # errorIndex (base 1) désigne le varbind fautif: on le retire et on relance le reste
+            if 0 < int(error_index) <= len(batch):
+                failed_oid = batch[int(error_index) - 1]
+                self.errors[failed_oid] = status
+                logger.error(f"Erreur SNMP: {status} pour l'OID {failed_oid}")
+                remaining = [oid for oid in batch if oid != failed_oid]
+                if remaining:
+                    self.pending.insert(0, remaining)
+            else:
+                logger.error(f"Erreur SNMP: {status} à l'index {error_index}")
+                self.fail(batch, status)
+            return
+
+        # Extraction des valeurs, varbind par varbind
+        for oid, var_bind in zip(batch, var_binds):
+            value = var_bind[1]
+            exception = varbind_exception(value)
+            if exception:
+                self.errors[oid] = exception
+                self.failures.append(exception)
+                logger.warning(f"OID {oid} indisponible: {exception}")
+                continue
+            self.values[oid] = int(value)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sessions SNMPv3 longue durée
+Créer un CommandGenerator à chaque cycle reconstruit un moteur SNMP complet
+(chargement des MIB), refait la découverte de l'engineID de l'agent et dérive
+à nouveau les clés USM depuis les mots de passe (1 Mo de hachage par clé,
+RFC 3414 A.2). Ici:
+
+- les clés maîtresses (mot de passe -> clé) sont calculées une seule fois par
+  processus et par (protocole, mot de passe), puis transmises à pysnmp comme
+  clés maîtresses: seule la localisation (un hachage court) reste par agent;
+- chaque équipement garde un moteur et un générateur de commandes pour toute
+  la durée de la collecte: engineID découvert, engineBoots/engineTime et clés
+  localisées restent en cache dans le moteur;
+- les modules MIB du moteur sont compilés une seule fois et conservés sur
+  disque (common/mib_cache.py), pysnmp n'étant importé qu'au premier cycle;
+- une erreur d'authentification ou de synchronisation (unknownUserName,
+  wrongDigest, decryptionError, unknownEngineID, notInTimeWindow) invalide la
+  session: le moteur suivant refait la découverte et relocalise les clés.
+
+Auteur: arthur
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger("snmp_session")
+
+# Indications d'erreur pysnmp (classes de pysnmp.proto.errind) imposant de rejeter l'état USM en cache
+USM_FAILURES = ("UnknownUserName", "UnknownSecurityName", "WrongDigest", "DecryptionError", "UnknownEngineID",
+                "NotInTimeWindow", "UnsupportedSecurityLevel", "AuthenticationFailure", "AuthenticationError")
+
+# Clés maîtresses, une par (protocoles, mots de passe)
+_master_keys = {}
+_master_keys_lock = threading.Lock()
+
+# Sessions partagées, une par (équipement, utilisateur)
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def is_usm_failure(error_indication):
+    """Vrai si l'erreur met en cause l'état USM (clés, engineID, fenêtre temporelle)"""
+    return type(error_indication).__name__ in USM_FAILURES
+
+
+def usm_protocols(auth_name, priv_name):
+    """Protocoles pysnmp d'après les noms de configuration (SHA/MD5, AES/DES)"""
+    from pysnmp.hlapi import usmHMACSHAAuthProtocol, usmHMACMD5AuthProtocol, usmAesCfb128Protocol, usmDESPrivProtocol
+    auth_protocol = usmHMACSHAAuthProtocol if auth_name.upper() == "SHA" else usmHMACMD5AuthProtocol
+    priv_protocol = usmAesCfb128Protocol if priv_name.upper() == "AES" else usmDESPrivProtocol
+    return auth_protocol, priv_protocol
+
+
+def master_keys(auth_protocol, auth_password, priv_protocol, priv_password):
+    """Clés maîtresses d'authentification et de chiffrement, calculées une fois par processus"""
+    key = (auth_protocol, auth_password, priv_protocol, priv_password)
+    with _master_keys_lock:
+        keys = _master_keys.get(key)
+        if keys is None:
+            from pysnmp.entity import config
+            keys = (
+                config.authServices[auth_protocol].hashPassphrase(auth_password),
+                config.privServices[priv_protocol].hashPassphrase(auth_protocol, priv_password),
+            )
+            _master_keys[key] = keys
+    return keys
+
+
+def usm_user_data(user, auth_name, auth_password, priv_name, priv_password):
+    """UsmUserData construit à partir des clés maîtresses en cache (aucun hachage de mot de passe)"""
+    from pysnmp.hlapi import UsmUserData, usmKeyTypeMaster
+    auth_protocol, priv_protocol = usm_protocols(auth_name, priv_name)
+    auth_key, priv_key = master_keys(auth_protocol, auth_password, priv_protocol, priv_password)
+    return UsmUserData(
+        user,
+        auth_key,
+        priv_key,
+        authProtocol=auth_protocol,
+        privProtocol=priv_protocol,
+        authKeyType=usmKeyTypeMaster,
+        privKeyType=usmKeyTypeMaster
+    )
+
+
+class SnmpSession:
+    """Moteur et générateur de commandes SNMPv3 conservés d'un cycle à l'autre pour un équipement"""
+
+    def __init__(self, host, port, user, auth_name, auth_password, priv_name, priv_password, mib_cache_dir=None):
+        self.host = host
+        self.port = port
+        self.name = f"{user}@{host}:{port}"
+        self.auth_data = usm_user_data(user, auth_name, auth_password, priv_name, priv_password)
+        self.mib_cache_dir = mib_cache_dir
+        self.generator = None
+        self.targets = {}
+        # Le générateur synchrone n'est pas réentrant (cycles concurrents possibles)
+        self.lock = threading.Lock()
+        self.stats = {"engines": 0, "requests": 0, "invalidations": 0}
+
+    def _generator(self):
+        if self.generator is None:
+            from pysnmp.entity.rfc3413.oneliner import cmdgen
+            from mib_cache import snmp_engine
+            self.generator = cmdgen.CommandGenerator(snmp_engine(self.mib_cache_dir))
+            self.stats["engines"] += 1
+        return self.generator
+
+    def _target(self, timeout, retries):
+        """Cible UDP par (délai, réessais): la résolution d'adresse n'est faite qu'une fois"""
+        key = (timeout, retries)
+        target = self.targets.get(key)
+        if target is None:
+            from pysnmp.entity.rfc3413.oneliner import cmdgen
+            target = cmdgen.UdpTransportTarget((self.host, self.port), timeout=timeout, retries=retries)
+            self.targets[key] = target
+        return target
+
+    def get(self, oids, timeout, retries, context="", identities=None):
+        """
+        GET SNMPv3 d'un lot d'OIDs; retourne (errorIndication, errorStatus, errorIndex, varBinds).
+        identities: ObjectIdentity précompilés par OID (résolus une fois, réutilisés ensuite).
+        """
+        from pysnmp.hlapi import ObjectIdentity
+        identities = identities or {}
+        with self.lock:
+            result = self._generator().getCmd(
+                self.auth_data,
+                self._target(timeout, retries),
+                *[identities[oid] if oid in identities else ObjectIdentity(oid) for oid in oids],
+                contextName=context
+            )
+            self.stats["requests"] += 1
+            error_indication = result[0]
+            if error_indication and is_usm_failure(error_indication):
+                self.invalidate(error_indication)
+        return result
+
+    def invalidate(self, reason):
+        """Abandonne le moteur (engineID, fenêtre temporelle et clés localisées en cache)"""
+        logger.warning(f"Session SNMPv3 {self.name} réinitialisée: {reason}")
+        self.generator = None
+        self.stats["invalidations"] += 1
+
+
+def get_session(host, port, user, auth_name, auth_password, priv_name, priv_password, mib_cache_dir=None):
+    """Retourne la session partagée d'un équipement et d'un utilisateur (créée au premier appel)"""
+    key = (host, port, user, auth_name, auth_password, priv_name, priv_password)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = SnmpSession(host, port, user, auth_name, auth_password, priv_name, priv_password, mib_cache_dir)
+            _sessions[key] = session
+    return session
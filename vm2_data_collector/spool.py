@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Journal sur disque des documents sortants (Logstash, Elasticsearch)
+Chaque document est écrit dans un journal en ajout seul avant d'être envoyé,
+puis acquitté une fois remis à la sortie: un document accepté survit à une
+panne de la sortie comme à un arrêt du collecteur (livraison au moins une fois,
+des doublons restent possibles après une reprise).
+
+Le journal est découpé en segments (segment-<n>.spool) d'enregistrements
+[longueur u32][CRC32 u32][octets encodés pour la sortie]. La position acquittée
+de chaque segment est tenue dans acks.json (remplacement atomique); un segment
+fermé et entièrement acquitté est supprimé. Au-delà du quota, les segments les
+plus anciens sont supprimés, acquittés ou non. Un enregistrement dont le CRC ne
+correspond pas est ignoré; une fin de segment tronquée (arrêt brutal pendant
+l'écriture) est abandonnée.
+
+Acheminement (SpooledDelivery):
+- en régime normal, le document part aussitôt depuis la mémoire et son segment
+  est acquitté après l'envoi;
+- si la sortie échoue, les documents ne sont plus qu'écrits dans le journal;
+- un thread de reprise renvoie l'arriéré du plus ancien au plus récent, au
+  débit SPOOL_DRAIN_RATE, et rétablit l'envoi direct dès que la sortie répond:
+  les nouvelles données circulent pendant la reprise de l'arriéré.
+
+Pour Logstash (TCP json_lines), un lot est acquitté une fois remis au système:
+un lot perdu avec la connexion elle-même n'est pas renvoyé.
+
+Auteur: arthur
+"""
+
+import os
+import json
+import time
+import zlib
+import queue
+import random
+import struct
+import logging
+import threading
+
+logger = logging.getLogger("spool")
+
+# Longueur, CRC32 des octets de l'enregistrement
+RECORD = struct.Struct("<II")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".spool"
+ACKS_FILE = "acks.json"
+
+# Journaux partagés, un par répertoire
+_spools = {}
+_spools_lock = threading.Lock()
+
+
+class Spool:
+    """Segments en ajout seul d'enregistrements contrôlés par CRC, positions acquittées par segment"""
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, max_bytes=1024 * 1024 * 1024,
+                 fsync=False, count=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        # Compteurs de la sortie: count(état, nombre) pour "evicted" et "corrupt"
+        self.count = count or (lambda key, amount=1: None)
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Segment -> taille (octets); segment -> position acquittée
+        self.sizes = {}
+        for entry in os.listdir(directory):
+            if entry.startswith(SEGMENT_PREFIX) and entry.endswith(SEGMENT_SUFFIX):
+                seq = int(entry[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                self.sizes[seq] = os.path.getsize(self._path(seq))
+        self.acks = {}
+        try:
+            with open(os.path.join(directory, ACKS_FILE), 'r') as f:
+                self.acks = {int(seq): offset for seq, offset in json.load(f).items() if int(seq) in self.sizes}
+        except (FileNotFoundError, ValueError):
+            pass
+        self.total_bytes = sum(self.sizes.values())
+        self.active = None
+        self.active_seq = None
+        self.next_seq = max(self.sizes, default=0) + 1
+        for seq in list(self.sizes):
+            if self.acks.get(seq, 0) >= self.sizes[seq]:
+                self._remove(seq)
+        if self.sizes:
+            logger.info(f"Journal {directory}: {len(self.sizes)} segment(s), {self.pending_bytes()} octets à reprendre")
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{seq:012d}{SEGMENT_SUFFIX}")
+
+    def _remove(self, seq):
+        try:
+            os.unlink(self._path(seq))
+        except FileNotFoundError:
+            pass
+        self.total_bytes -= self.sizes.pop(seq)
+        self.acks.pop(seq, None)
+
+    def _save_acks(self):
+        path = os.path.join(self.directory, ACKS_FILE)
+        with open(path + ".tmp", 'w') as f:
+            json.dump({str(seq): offset for seq, offset in self.acks.items()}, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _seal(self):
+        if self.active is None:
+            return
+        if self.fsync:
+            os.fsync(self.active.fileno())
+        self.active.close()
+        seq, self.active, self.active_seq = self.active_seq, None, None
+        if self.acks.get(seq, 0) >= self.sizes[seq]:
+            self._remove(seq)
+            self._save_acks()
+
+    def _unacked_records(self, seq):
+        """Nombre d'enregistrements non acquittés d'un segment (lecture des seuls en-têtes)"""
+        records = 0
+        offset = self.acks.get(seq, 0)
+        with open(self._path(seq), 'rb') as f:
+            while offset + RECORD.size <= self.sizes[seq]:
+                f.seek(offset)
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    break
+                offset += RECORD.size + RECORD.unpack(header)[0]
+                records += 1
+        return records
+
+    def _enforce_quota(self):
+        """Supprime les segments fermés les plus anciens tant que le quota est dépassé"""
+        while self.total_bytes > self.max_bytes:
+            sealed = [seq for seq in self.sizes if seq != self.active_seq]
+            if not sealed:
+                return
+            seq = min(sealed)
+            try:
+                lost = self._unacked_records(seq)
+            except OSError:
+                lost = 0
+            logger.warning(f"Quota du journal {self.directory} atteint: segment {seq} supprimé, {lost} document(s) non remis perdus")
+            self.count("evicted", lost)
+            self._remove(seq)
+            self._save_acks()
+
+    def append(self, payload):
+        """Ajoute un enregistrement; retourne sa position (segment, fin de l'enregistrement)"""
+        record = RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+        with self.lock:
+            if self.active is not None and self.sizes[self.active_seq] and \
+                    self.sizes[self.active_seq] + len(record) > self.segment_bytes:
+                self._seal()
+            if self.active is None:
+                self.active_seq = self.next_seq
+                self.next_seq += 1
+                self.active = open(self._path(self.active_seq), 'ab')
+                self.sizes[self.active_seq] = 0
+            self.active.write(record)
+            # Remis au système à chaque enregistrement: un arrêt du processus ne perd rien
+            self.active.flush()
+            if self.fsync:
+                os.fsync(self.active.fileno())
+            seq = self.active_seq
+            self.sizes[seq] += len(record)
+            self.total_bytes += len(record)
+            self._enforce_quota()
+            return seq, self.sizes[seq]
+
+    def seal(self):
+        """Ferme le segment en cours: l'enregistrement suivant ouvre un nouveau segment"""
+        with self.lock:
+            self._seal()
+
+    def sealed(self, seq):
+        return seq != self.active_seq
+
+    def size(self, seq):
+        return self.sizes.get(seq, 0)
+
+    def backlog(self):
+        """Segments non entièrement acquittés, du plus ancien au plus récent: [(segment, position acquittée)]"""
+        with self.lock:
+            return [(seq, self.acks.get(seq, 0)) for seq in sorted(self.sizes) if self.acks.get(seq, 0) < self.sizes[seq]]
+
+    def pending_bytes(self):
+        return sum(size - self.acks.get(seq, 0) for seq, size in list(self.sizes.items()))
+
+    def read(self, seq, offset, max_records, max_bytes):
+        """
+        Lit les enregistrements complets d'un segment à partir de offset.
+
+        Retourne ([(octets, position de fin)], position atteinte): les
+        enregistrements au CRC invalide sont ignorés mais font avancer la
+        position; la lecture s'arrête avant un enregistrement incomplet.
+        """
+        with self.lock:
+            size = self.sizes.get(seq)
+        records = []
+        if size is None:
+            return records, offset
+        try:
+            f = open(self._path(seq), 'rb')
+        except FileNotFoundError:
+            return records, offset
+        read_bytes = 0
+        with f:
+            f.seek(offset)
+            while len(records) < max_records and read_bytes < max_bytes:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    break
+                length, crc = RECORD.unpack(header)
+                if offset + RECORD.size + length > size:
+                    break
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+                offset += RECORD.size + length
+                if zlib.crc32(payload) != crc:
+                    logger.warning(f"Enregistrement corrompu ignoré dans {self._path(seq)} (position {offset})")
+                    self.count("corrupt")
+                    continue
+                records.append((payload, offset))
+                read_bytes += length
+        return records, offset
+
+    def ack(self, seq, offset):
+        """Acquitte un segment jusqu'à offset (positions croissantes); supprime un segment fermé entièrement acquitté"""
+        with self.lock:
+            if seq not in self.sizes or offset <= self.acks.get(seq, 0):
+                return
+            self.acks[seq] = offset
+            if seq != self.active_seq and offset >= self.sizes[seq]:
+                self._remove(seq)
+            self._save_acks()
+
+    def close(self):
+        with self.lock:
+            self._seal()
+            self._save_acks()
+        with _spools_lock:
+            if _spools.get(os.path.abspath(self.directory)) is self:
+                del _spools[os.path.abspath(self.directory)]
+
+
+def get_spool(directory, **options):
+    """Retourne le journal partagé d'un répertoire, ouvert à la première demande"""
+    key = os.path.abspath(directory)
+    with _spools_lock:
+        spool = _spools.get(key)
+        if spool is None:
+            spool = Spool(directory, **options)
+            _spools[key] = spool
+    return spool
+
+
+class SpooledDelivery:
+    """
+    Acheminement d'une sortie réseau à travers un journal sur disque.
+
+    encode(document) -> octets enregistrés puis envoyés; deliver([octets]) -> éléments
+    non remis (un seul essai, sûr depuis plusieurs threads); count(état, nombre).
+    """
+
+    def __init__(self, spool, encode, deliver, count, name, batch_size=100, max_bytes=5 * 1024 * 1024,
+                 flush_interval=1.0, queue_size=10000, drain_rate=0.0, attempts=3,
+                 backoff_initial=0.5, backoff_max=30.0, log_stats=None, stats_interval=60.0):
+        self.spool = spool
+        self.spool.count = count
+        self.encode = encode
+        self.deliver = deliver
+        self.count = count
+        self.name = name
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.drain_rate = drain_rate
+        self.attempts = attempts
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.log_stats = log_stats
+        self.stats_interval = stats_interval
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        # Sortie en échec: documents écrits dans le journal seulement, repris par le thread de reprise
+        self.degraded = False
+        # Segments dont les documents sont aussi en file mémoire (acquittés par le thread d'envoi)
+        self.live = set()
+        self.stop_event = threading.Event()
+        self.wakeup = threading.Event()
+        self.threads = []
+
+    def start(self):
+        if not self.threads:
+            for target, role in ((self._run_live, "send"), (self._run_drain, "drain")):
+                thread = threading.Thread(target=target, name=f"spool-{role}-{self.name}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+            logger.info(f"Journal de la sortie {self.name}: {self.spool.directory} "
+                        f"(reprise {self.drain_rate or 'illimitée'} documents/s)")
+        return self
+
+    def submit(self, document):
+        """Écrit le document dans le journal puis le met en file d'envoi; False si le journal est inutilisable"""
+        payload = self.encode(document)
+        with self.lock:
+            try:
+                position = self.spool.append(payload)
+            except OSError as e:
+                logger.error(f"Écriture impossible dans le journal {self.spool.directory}: {str(e)}")
+                self.count("dropped")
+                return False
+            self.count("spooled")
+            if not self.degraded:
+                try:
+                    self.queue.put_nowait((payload, position))
+                    self.live.add(position[0])
+                except queue.Full:
+                    self._degrade("file d'envoi pleine")
+        return True
+
+    def _degrade(self, reason):
+        """Bascule sur le journal seul (verrou tenu): la file mémoire est abandonnée, son contenu est sur disque"""
+        if self.degraded:
+            return
+        self.degraded = True
+        self.live.clear()
+        self.spool.seal()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        logger.warning(f"Sortie {self.name} en échec ({reason}): documents conservés dans le journal")
+        self.wakeup.set()
+
+    def _send(self, batch, attempts=None):
+        """
+        Envoie un lot [(octets, position)] en ne renvoyant que les éléments refusés.
+
+        Au plus attempts essais (sans limite jusqu'à l'arrêt si None); retourne la
+        position jusqu'à laquelle tout est remis (None si rien) et True si tout l'est.
+        """
+        payloads = [payload for payload, _ in batch]
+        backoff = self.backoff_initial
+        attempt = 0
+        while True:
+            payloads = self.deliver(payloads)
+            attempt += 1
+            if not payloads or (attempts is not None and attempt >= attempts) or \
+                    self.stop_event.wait(backoff * random.uniform(0.8, 1.2)):
+                break
+            backoff = min(self.backoff_max, backoff * 2)
+        # Préfixe remis: tout ce qui précède le premier élément encore refusé
+        undelivered = {id(payload) for payload in payloads}
+        delivered = 0
+        while delivered < len(batch) and id(batch[delivered][0]) not in undelivered:
+            delivered += 1
+        return (batch[delivered - 1][1] if delivered else None), not payloads
+
+    def _ack(self, batch, upto):
+        """Acquitte, segment par segment, les éléments du lot jusqu'à la position upto incluse"""
+        last = {}
+        for _, (seq, end) in batch:
+            last[seq] = max(end, last.get(seq, 0))
+            if (seq, end) == upto:
+                break
+        for seq, end in last.items():
+            self.spool.ack(seq, end)
+        with self.lock:
+            # Segments fermés entièrement remis, supprimés du journal
+            self.live = {seq for seq in self.live if self.spool.size(seq)}
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and size < self.max_bytes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run_live(self):
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            upto, complete = self._send(batch, self.attempts)
+            if upto is not None:
+                self._ack(batch, upto)
+            if not complete:
+                # La suite du lot est reprise depuis le journal
+                with self.lock:
+                    self._degrade("échec d'envoi")
+
+    def _next_backlog(self):
+        """Prochain lot de l'arriéré: (segment, [(octets, position)]) ou None"""
+        with self.lock:
+            live = set(self.live)
+        for seq, acked in self.spool.backlog():
+            if seq in live:
+                continue
+            records, position = self.spool.read(seq, acked, self.batch_size, self.max_bytes)
+            if records:
+                return seq, records
+            if position > acked:
+                # Enregistrements corrompus seulement: position avancée
+                self.spool.ack(seq, position)
+            elif self.spool.sealed(seq):
+                logger.warning(f"Fin tronquée abandonnée dans le segment {seq} du journal {self.spool.directory}")
+                self.count("corrupt")
+                self.spool.ack(seq, self.spool.size(seq))
+        return None
+
+    def _run_drain(self):
+        last_stats_log = time.monotonic()
+        while not self.stop_event.is_set():
+            if self.log_stats is not None and time.monotonic() - last_stats_log >= self.stats_interval:
+                last_stats_log = time.monotonic()
+                self.log_stats()
+            work = self._next_backlog()
+            if work is None:
+                self.wakeup.wait(self.flush_interval)
+                self.wakeup.clear()
+                continue
+            seq, records = work
+            started = time.monotonic()
+            # Essais sans limite (backoff plafonné): seuls les éléments refusés sont renvoyés
+            upto, complete = self._send([(payload, (seq, end)) for payload, end in records])
+            if upto is not None:
+                self.spool.ack(seq, upto[1])
+            if not complete:
+                continue
+            self.count("drained", len(records))
+            with self.lock:
+                if self.degraded:
+                    # Sortie rétablie: envoi direct des nouveaux documents, l'arriéré continue ici
+                    self.degraded = False
+                    self.spool.seal()
+                    logger.info(f"Sortie {self.name} rétablie: envoi direct repris, "
+                                f"{self.spool.pending_bytes()} octets d'arriéré à reprendre")
+            if self.drain_rate:
+                self.stop_event.wait(len(records) / self.drain_rate - (time.monotonic() - started))
+
+    def close(self, timeout=5.0):
+        """Arrête les threads (les documents non remis restent dans le journal) puis ferme le journal"""
+        self.stop_event.set()
+        self.wakeup.set()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self.spool.close()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Stockage colonnaire binaire des échantillons DME (memory-mapped)
+Chaque série est un répertoire contenant une colonne d'horodatages int64
+(millisecondes epoch) et une colonne int32 de largeur fixe par métrique.
+Les colonnes sont préallouées par blocs et écrites via mmap; la lecture
+retourne des vues NumPy sans copie, et une plage temporelle se résout par
+recherche dichotomique sur la colonne des horodatages (triée par construction).
+
+Structure:
+    <répertoire>/meta.json        colonnes, types, version
+    <répertoire>/count            nombre de lignes validées (int64)
+    <répertoire>/timestamp.col    horodatages int64
+    <répertoire>/<métrique>.col   valeurs int32 (MISSING si non collectée)
+
+Utilisation en ligne de commande:
+    python tsstore.py convert dme_data.csv /app/data/tsstore
+    python tsstore.py info /app/data/tsstore
+    python tsstore.py read /app/data/tsstore mtuExecTXPBDelayCurrentValue-0 --start "2025-06-02 14:00" --end "2025-06-02 14:20"
+
+Auteur: arthur
+"""
+
+import os
+import sys
+import csv
+import gzip
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from delta import fill_rows
+
+logger = logging.getLogger("tsstore")
+
+STORE_VERSION = 1
+TIMESTAMP_COLUMN = "timestamp"
+TIMESTAMP_DTYPE = np.dtype("<i8")
+VALUE_DTYPE = np.dtype("<i4")
+# Valeur sentinelle d'une métrique non collectée
+MISSING = np.iinfo(VALUE_DTYPE).min
+# Nombre de lignes ajoutées à chaque extension des fichiers
+GROWTH_ROWS = 65536
+
+
+def to_epoch_ms(value):
+    """Convertit un datetime (heure locale, comme le CSV) en millisecondes epoch"""
+    return int(value.timestamp() * 1000)
+
+
+def from_epoch_ms(value):
+    """Convertit des millisecondes epoch en datetime local"""
+    return datetime.fromtimestamp(int(value) / 1000.0)
+
+
+class TimeSeriesStore:
+    """Série colonnaire memory-mapped d'un équipement"""
+
+    def __init__(self, path, columns=None, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        meta_path = os.path.join(path, "meta.json")
+
+        if os.path.isfile(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get("version") != STORE_VERSION:
+                raise ValueError(f"Version de stockage non supportée: {meta.get('version')}")
+            if columns is not None and list(columns) != meta["columns"]:
+                raise ValueError(f"Colonnes incompatibles avec le stockage existant: {path}")
+            self.columns = meta["columns"]
+        elif readonly:
+            raise FileNotFoundError(f"Stockage inexistant: {path}")
+        else:
+            if not columns:
+                raise ValueError("Colonnes requises pour créer un stockage")
+            os.makedirs(path, exist_ok=True)
+            self.columns = list(columns)
+            with open(meta_path + ".tmp", 'w') as f:
+                json.dump({
+                    "version": STORE_VERSION,
+                    "columns": self.columns,
+                    "timestamp_dtype": TIMESTAMP_DTYPE.str,
+                    "value_dtype": VALUE_DTYPE.str,
+                    "missing": int(MISSING),
+                }, f, indent=2)
+            os.replace(meta_path + ".tmp", meta_path)
+            logger.info(f"Stockage colonnaire créé: {path} ({len(self.columns)} métriques)")
+
+        self.column_index = {name: index for index, name in enumerate(self.columns)}
+        self._count = self._map_count()
+        self._maps = {}
+        self.capacity = 0
+        self._map_columns()
+
+    def _column_file(self, name):
+        return os.path.join(self.path, f"{name}.col")
+
+    def _map_count(self):
+        count_path = os.path.join(self.path, "count")
+        if not os.path.isfile(count_path):
+            if self.readonly:
+                raise FileNotFoundError(f"Compteur absent: {count_path}")
+            with open(count_path, 'wb') as f:
+                f.write(b'\0' * TIMESTAMP_DTYPE.itemsize)
+        return np.memmap(count_path, dtype=TIMESTAMP_DTYPE, mode='r' if self.readonly else 'r+', shape=(1,))
+
+    def _map_columns(self, capacity=None):
+        """(Re)mappe toutes les colonnes, en étendant les fichiers jusqu'à capacity lignes"""
+        self._maps = {}
+        specs = [(TIMESTAMP_COLUMN, TIMESTAMP_DTYPE)] + [(name, VALUE_DTYPE) for name in self.columns]
+        rows = None
+        for name, dtype in specs:
+            file_path = self._column_file(name)
+            if not self.readonly:
+                if not os.path.isfile(file_path):
+                    open(file_path, 'wb').close()
+                if capacity is not None and os.path.getsize(file_path) < capacity * dtype.itemsize:
+                    os.truncate(file_path, capacity * dtype.itemsize)
+            size = os.path.getsize(file_path) // dtype.itemsize
+            rows = size if rows is None else min(rows, size)
+            if size:
+                self._maps[name] = np.memmap(file_path, dtype=dtype, mode='r' if self.readonly else 'r+', shape=(size,))
+        self.capacity = rows or 0
+
+    def __len__(self):
+        return int(self._count[0])
+
+    def _ensure_capacity(self, rows):
+        if rows <= self.capacity:
+            return
+        capacity = max(rows, self.capacity + GROWTH_ROWS)
+        self.flush()
+        self._map_columns(capacity)
+
+    def append(self, timestamp, values):
+        """Ajoute une ligne: timestamp (datetime ou ms epoch) et valeurs par nom de métrique"""
+        if isinstance(timestamp, datetime):
+            timestamp = to_epoch_ms(timestamp)
+        row = np.full(len(self.columns), MISSING, dtype=VALUE_DTYPE)
+        for name, value in values.items():
+            index = self.column_index.get(name)
+            if index is not None and value is not None:
+                row[index] = value
+        self.append_many(np.array([timestamp], dtype=TIMESTAMP_DTYPE), row.reshape(1, -1))
+
+    def append_many(self, timestamps, matrix):
+        """Ajoute un bloc de lignes (timestamps int64 ms, matrice lignes x métriques)"""
+        if self.readonly:
+            raise PermissionError(f"Stockage ouvert en lecture seule: {self.path}")
+        count = len(self)
+        added = len(timestamps)
+        # Ordre vérifié dans le bloc et avec la dernière ligne validée: range_slice suppose une colonne triée
+        if added and np.any(np.diff(timestamps) < 0):
+            raise ValueError("Les horodatages doivent être croissants")
+        if count and added and int(timestamps[0]) < int(self._maps[TIMESTAMP_COLUMN][count - 1]):
+            raise ValueError("Les horodatages doivent être croissants")
+        self._ensure_capacity(count + added)
+
+        self._maps[TIMESTAMP_COLUMN][count:count + added] = timestamps
+        for index, name in enumerate(self.columns):
+            self._maps[name][count:count + added] = matrix[:, index]
+        # Le compteur n'est avancé qu'après l'écriture des valeurs: un lecteur ne voit que des lignes complètes
+        self._count[0] = count + added
+
+    def refresh(self):
+        """Prend en compte les lignes ajoutées par un autre processus (lecteur)"""
+        if len(self) > self.capacity:
+            self._map_columns()
+
+    def flush(self):
+        """Force l'écriture des pages modifiées sur disque"""
+        for column in self._maps.values():
+            column.flush()
+        if not self.readonly:
+            self._count.flush()
+
+    def timestamps(self):
+        """Vue sans copie de la colonne des horodatages (ms epoch)"""
+        if not len(self):
+            return np.empty(0, dtype=TIMESTAMP_DTYPE)
+        return self._maps[TIMESTAMP_COLUMN][:len(self)]
+
+    def column(self, name):
+        """Vue sans copie d'une colonne de métrique"""
+        if name not in self.column_index:
+            raise KeyError(f"Métrique inconnue: {name}")
+        if not len(self):
+            return np.empty(0, dtype=VALUE_DTYPE)
+        return self._maps[name][:len(self)]
+
+    def range_slice(self, start=None, end=None):
+        """Tranche des lignes dont l'horodatage est dans [start, end]"""
+        timestamps = self.timestamps()
+        first = 0 if start is None else int(np.searchsorted(timestamps, to_epoch_ms(start) if isinstance(start, datetime) else start, side='left'))
+        last = len(timestamps) if end is None else int(np.searchsorted(timestamps, to_epoch_ms(end) if isinstance(end, datetime) else end, side='right'))
+        return slice(first, last)
+
+    def read(self, name, start=None, end=None):
+        """Horodatages et valeurs d'une métrique sur une plage (vues sans copie)"""
+        window = self.range_slice(start, end)
+        return self.timestamps()[window], self.column(name)[window]
+
+    def close(self):
+        self.flush()
+        self._maps = {}
+        self._count = None
+
+
+def _open_csv(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', newline='')
+    return open(path, 'r', newline='')
+
+
+def convert_csv(csv_path, store_path, chunk_rows=10000, delimiter='\t'):
+    """Importe un fichier CSV du collecteur (éventuellement .gz, éventuellement écrit en mode delta)
+
+    Les lignes dont l'horodatage précède la dernière ligne importée sont écartées
+    (et comptées): le stockage reste trié.
+    """
+    imported = 0
+    skipped = 0
+    started = time.monotonic()
+    with _open_csv(csv_path) as f:
+        # Cellules vides du mode delta complétées par la dernière valeur connue
+        reader = fill_rows(csv.reader(f, delimiter=delimiter))
+        header = next(reader)
+        store = TimeSeriesStore(store_path, columns=header[1:])
+        positions = [store.column_index[name] for name in header[1:]]
+        last = int(store.timestamps()[-1]) if len(store) else None
+
+        timestamps = []
+        rows = []
+
+        def flush_chunk():
+            if not rows:
+                return
+            matrix = np.full((len(rows), len(store.columns)), MISSING, dtype=VALUE_DTYPE)
+            matrix[:, positions] = np.array(rows, dtype=np.int64)
+            store.append_many(np.array(timestamps, dtype=TIMESTAMP_DTYPE), matrix)
+            timestamps.clear()
+            rows.clear()
+
+        for line in reader:
+            if not line:
+                continue
+            timestamp = to_epoch_ms(datetime.strptime(line[0], "%Y-%m-%d %H:%M:%S.%f"))
+            if last is not None and timestamp < last:
+                skipped += 1
+                logger.debug(f"Ligne hors ordre écartée ({csv_path}): {line[0]}")
+                continue
+            last = timestamp
+            timestamps.append(timestamp)
+            rows.append([int(float(value)) if value else MISSING for value in line[1:]])
+            if len(rows) >= chunk_rows:
+                imported += len(rows)
+                flush_chunk()
+        imported += len(rows)
+        flush_chunk()
+        store.close()
+
+    if skipped:
+        logger.warning(f"{skipped} lignes hors ordre chronologique écartées de {csv_path}")
+    logger.info(f"{imported} lignes importées depuis {csv_path} en {time.monotonic() - started:.2f}s")
+    return imported
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Stockage colonnaire des échantillons DME")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="Importe un CSV du collecteur")
+    convert.add_argument("csv", nargs="+", help="Fichier(s) CSV, éventuellement compressés (.gz), dans l'ordre chronologique")
+    convert.add_argument("store", help="Répertoire du stockage")
+
+    info = commands.add_parser("info", help="Résumé d'un stockage")
+    info.add_argument("store")
+
+    read = commands.add_parser("read", help="Lit une métrique sur une plage temporelle")
+    read.add_argument("store")
+    read.add_argument("metric")
+    read.add_argument("--start", help="Début (AAAA-MM-JJ HH:MM[:SS])")
+    read.add_argument("--end", help="Fin (AAAA-MM-JJ HH:MM[:SS])")
+
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        for csv_path in args.csv:
+            convert_csv(csv_path, args.store)
+        return
+
+    store = TimeSeriesStore(args.store, readonly=True)
+    if args.command == "info":
+        timestamps = store.timestamps()
+        print(f"Lignes: {len(store)}")
+        print(f"Métriques: {len(store.columns)}")
+        if len(store):
+            print(f"Période: {from_epoch_ms(timestamps[0])} -> {from_epoch_ms(timestamps[-1])}")
+    elif args.command == "read":
+        start = datetime.fromisoformat(args.start) if args.start else None
+        end = datetime.fromisoformat(args.end) if args.end else None
+        started = time.perf_counter()
+        timestamps, values = store.read(args.metric, start, end)
+        elapsed = time.perf_counter() - started
+        for timestamp, value in zip(timestamps, values):
+            print(f"{from_epoch_ms(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-4]}\t{'' if value == MISSING else value}")
+        print(f"# {len(values)} lignes lues en {elapsed * 1000:.2f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()